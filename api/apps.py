@@ -9,6 +9,8 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
+        from . import signals  # noqa: F401
+
         try:
             storage = S3Boto3Storage()
             if not storage.bucket.exists():
@@ -0,0 +1,197 @@
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from . import feed, profile_cards, profile_queue, swipe_stream
+from .models import Like, Match, User, UserImage
+from .serializers import SwipeEventSerializer, UserImageSerializer
+from .views import UserImageViewSet, UserViewSet
+
+logger = logging.getLogger(__name__)
+
+# Асинхронные версии горячих эндпоинтов для ASGI (settings.ASYNC_HOT_VIEWS).
+# Пути и формат ответов те же, что у представлений DRF в api/views.py и
+# api/urls.py. Redis вызывается через асинхронный клиент; ORM Django 4.2
+# выполняет запросы в отдельном потоке, поэтому цепочки запросов собраны
+# в один переход через sync_to_async.
+
+
+class AsyncAPIView(View):
+    """Асинхронное представление с разбором JSON; остальное отдается sync_view"""
+    # Синхронное представление DRF для методов и случаев без async-версии
+    sync_view = None
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Как и APIView, эндпоинты API не проверяют CSRF-токен
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    @staticmethod
+    def parse_data(request):
+        if request.content_type == 'application/json':
+            return json.loads(request.body or b'{}')
+        return request.POST
+
+    @staticmethod
+    def respond(data, status=200):
+        return JsonResponse(data, status=status, safe=False)
+
+
+class AsyncSwipeView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            data = self.parse_data(request)
+            from_user_id = data.get('from_user')
+            to_user_id = data.get('to_user')
+            is_skip = data.get('is_skip', False)
+
+            if not from_user_id or not to_user_id:
+                return self.respond({'error': 'from_user and to_user are required'}, status=400)
+
+            if swipe_stream.is_enabled():
+                # Отложенная запись: лайк и мэтч создаст потребитель потока
+                serializer = SwipeEventSerializer(data=data)
+                if not serializer.is_valid():
+                    return self.respond(serializer.errors, status=400)
+                await swipe_stream.apublish(**serializer.validated_data)
+                return self.respond({
+                    'success': True,
+                    'queued': True,
+                    'match': False,
+                    'matched_profile': None,
+                    'next_profile': await self.next_profile(from_user_id),
+                }, status=202)
+
+            users = await User.objects.ain_bulk([from_user_id, to_user_id], field_name='telegram_id')
+            from_user = users.get(int(from_user_id))
+            to_user = users.get(int(to_user_id))
+
+            if not from_user or not to_user:
+                return self.respond({'error': 'User not found'}, status=404)
+
+            is_match = await sync_to_async(self.record_swipe)(from_user, to_user, is_skip)
+
+            result = {
+                'success': True,
+                'match': False,
+                'matched_profile': None,
+            }
+            if is_match:
+                result['match'] = True
+                result['matched_profile'] = await profile_cards.aget_card_by_id(to_user.telegram_id)
+
+            # Как и в SwipeView, анкету снимаем с очереди только после успешного свайпа
+            result['next_profile'] = await self.next_profile(from_user.telegram_id)
+            return self.respond(result, status=201)
+
+        except Exception as e:
+            logger.error(f"Error processing swipe: {str(e)}")
+            return self.respond({'error': str(e)}, status=500)
+
+    @staticmethod
+    def record_swipe(from_user, to_user, is_skip):
+        """Лайк и мэтч одним переходом в поток ORM; возвращает, случился ли мэтч"""
+        # Взаимный лайк проверяется в Like.save
+        like = Like.objects.create(from_user=from_user, to_user=to_user, is_skip=is_skip)
+        if like.is_match:
+            Match.objects.create(user1=from_user, user2=to_user)
+        return like.is_match
+
+    async def next_profile(self, telegram_id):
+        """Следующая анкета из очереди зрителя; при ошибке бот возьмет ее сам"""
+        try:
+            return await profile_queue.apop_profile_card(telegram_id)
+        except Exception as e:
+            logger.error(f"Error popping next profile for user {telegram_id}: {str(e)}")
+            return None
+
+
+class AsyncUserListView(AsyncAPIView):
+    """Пополнение ленты (GET /api/users/?exclude_user=...); остальное - UserViewSet"""
+    sync_view = staticmethod(UserViewSet.as_view({'get': 'list', 'post': 'create'}))
+
+    async def get(self, request):
+        exclude_user = request.GET.get('exclude_user')
+        # Постраничный обход по курсору идет в базу целиком - оставляем его DRF
+        if not exclude_user or 'cursor' in request.GET:
+            return await self.delegate(request)
+
+        viewer = await User.objects.filter(telegram_id=exclude_user).afirst()
+        if viewer is None:
+            return self.respond({'error': 'User not found'}, status=404)
+        limit = int(request.GET.get('limit', 20))
+
+        # Берем из ленты не больше анкет, чем поместится в очередь
+        try:
+            limit = min(limit, await profile_queue.afree_slots(viewer.telegram_id))
+        except Exception as e:
+            logger.error(f"Error reading Redis queue length: {str(e)}")
+        if limit <= 0:
+            return self.respond([])
+
+        cards = await sync_to_async(self.build_cards)(viewer, limit)
+        try:
+            await profile_cards.astore_cards(cards)
+            added = await profile_queue.apush_profiles(
+                viewer.telegram_id,
+                [card['telegram_id'] for card in cards]
+            )
+            logger.info(f"Added {added} profiles to queue for user {viewer.telegram_id}")
+        except Exception as e:
+            logger.error(f"Error adding profiles to Redis queue: {str(e)}")
+        return self.respond(cards)
+
+    async def post(self, request):
+        return await self.delegate(request)
+
+    @staticmethod
+    def build_cards(viewer, limit):
+        return profile_cards.build_cards(feed.build_feed(viewer, limit))
+
+
+class AsyncMatchCheckView(AsyncAPIView):
+    async def get(self, request):
+        """Проверяет, есть ли мэтч между двумя пользователями"""
+        user1_id = request.GET.get('user1')
+        user2_id = request.GET.get('user2')
+
+        if not user1_id or not user2_id:
+            return self.respond({'error': 'Требуются оба параметра: user1 и user2'}, status=400)
+
+        try:
+            user_ids = {int(user1_id), int(user2_id)}
+            if await User.objects.filter(telegram_id__in=user_ids).acount() != len(user_ids):
+                raise User.DoesNotExist
+
+            # Пара лайков уникальна, поэтому мэтч - это оба направления
+            likes = await Like.objects.filter(
+                Q(from_user_id=user1_id, to_user_id=user2_id) | Q(from_user_id=user2_id, to_user_id=user1_id),
+                is_skip=False
+            ).acount()
+            return self.respond({'is_match': likes == 2})
+
+        except (ValueError, User.DoesNotExist):
+            return self.respond({'error': 'Один из пользователей не найден'}, status=404)
+
+
+class AsyncUserImagesView(AsyncAPIView):
+    """Фото пользователя (GET /api/images/?telegram_id=...); загрузка - UserImageViewSet"""
+    sync_view = staticmethod(UserImageViewSet.as_view({'get': 'list', 'post': 'create'}))
+
+    async def get(self, request):
+        telegram_id = request.GET.get('telegram_id')
+        if not telegram_id:
+            return self.respond([])
+
+        images = [image async for image in UserImage.objects.filter(user__telegram_id=telegram_id)]
+        return self.respond(UserImageSerializer(images, many=True).data)
+
+    async def post(self, request):
+        return await self.delegate(request)
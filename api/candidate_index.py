@@ -0,0 +1,285 @@
+import logging
+from django.conf import settings
+from django.db.models import Q
+from .models import User, Like, Match
+from .redis_client import redis_client
+from . import seen_filter
+
+logger = logging.getLogger(__name__)
+
+# Хеш: участник индекса -> ключ городской корзины, в которой он сейчас лежит
+BUCKETS_KEY = 'candidate_buckets'
+
+# Поля пользователя, от которых зависит положение в индексе
+INDEXED_FIELDS = {'gender', 'seeking_gender', 'city', 'combined_rating'}
+
+# Идентификаторы дополняются нулями, чтобы при равном рейтинге
+# Redis упорядочивал участников так же, как числовые id
+MEMBER_WIDTH = 20
+
+# Значение курсора для полностью просмотренной корзины
+CURSOR_END = 'end'
+
+# Индекс полностью построен rebuild(). Корзины, созданные сигналами post_save
+# до первого перестроения, содержат не всех пользователей - без маркера
+# лента читается из базы.
+READY_KEY = 'candidate_index_ready'
+
+# KEYS[1] - корзина; ARGV: рейтинг и участник курсора, размер страницы.
+# Равные рейтинги в порядке убывания идут по убыванию участника, поэтому
+# позиция после курсора находится двоичным поиском внутри диапазона равных -
+# даже если участника курсора уже нет в корзине или его рейтинг изменился.
+PAGE_AFTER_SCRIPT = """
+local lo = redis.call('ZCOUNT', KEYS[1], '(' .. ARGV[1], '+inf')
+local hi = lo + redis.call('ZCOUNT', KEYS[1], ARGV[1], ARGV[1])
+while lo < hi do
+    local mid = math.floor((lo + hi) / 2)
+    if redis.call('ZREVRANGE', KEYS[1], mid, mid)[1] < ARGV[2] then
+        hi = mid
+    else
+        lo = mid + 1
+    end
+end
+return redis.call('ZREVRANGE', KEYS[1], lo, lo + tonumber(ARGV[3]) - 1, 'WITHSCORES')
+"""
+
+_page_after_script = redis_client.register_script(PAGE_AFTER_SCRIPT)
+
+
+def to_member(user_id):
+    return f"{user_id:0{MEMBER_WIDTH}d}"
+
+
+def from_member(member):
+    return int(member)
+
+
+def bucket_key(gender, seeking_gender, city):
+    """Корзина кандидатов конкретного города"""
+    city = (city or '').strip().lower()
+    return f"candidates:{gender}:{seeking_gender}:{city}"
+
+
+def wide_bucket_key(gender, seeking_gender):
+    """Корзина кандидатов по всем городам"""
+    return f"candidates_all:{gender}:{seeking_gender}"
+
+
+def _wide_key_for_bucket(bucket):
+    _, gender, seeking_gender, _ = bucket.split(':', 3)
+    return wide_bucket_key(gender, seeking_gender)
+
+
+def index_user(user):
+    """Добавить или переместить пользователя в индексе кандидатов"""
+    score = user.combined_rating
+    if not isinstance(score, (int, float)):
+        # Рейтинг еще не вычислен (например, F-выражение) - обновим при следующем сохранении
+        return
+
+    member = to_member(user.pk)
+    new_bucket = bucket_key(user.gender, user.seeking_gender, user.city)
+    old_bucket = redis_client.hget(BUCKETS_KEY, member)
+
+    pipe = redis_client.pipeline()
+    if old_bucket and old_bucket != new_bucket:
+        pipe.zrem(old_bucket, member)
+        pipe.zrem(_wide_key_for_bucket(old_bucket), member)
+    pipe.zadd(new_bucket, {member: score})
+    pipe.zadd(wide_bucket_key(user.gender, user.seeking_gender), {member: score})
+    pipe.hset(BUCKETS_KEY, member, new_bucket)
+    pipe.execute()
+
+
+def remove_user(user_id):
+    """Удалить пользователя из индекса кандидатов"""
+    member = to_member(user_id)
+    bucket = redis_client.hget(BUCKETS_KEY, member)
+    if not bucket:
+        return
+
+    pipe = redis_client.pipeline()
+    pipe.zrem(bucket, member)
+    pipe.zrem(_wide_key_for_bucket(bucket), member)
+    pipe.hdel(BUCKETS_KEY, member)
+    pipe.execute()
+
+
+def remove_users(user_ids, batch_size=1000):
+    """Удалить из индекса много пользователей сразу (например, после отката тестовых данных)"""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), batch_size):
+        members = [to_member(user_id) for user_id in user_ids[start:start + batch_size]]
+        buckets = redis_client.hmget(BUCKETS_KEY, members)
+
+        pipe = redis_client.pipeline(transaction=False)
+        for member, bucket in zip(members, buckets):
+            if bucket:
+                pipe.zrem(bucket, member)
+                pipe.zrem(_wide_key_for_bucket(bucket), member)
+        pipe.hdel(BUCKETS_KEY, *members)
+        pipe.execute()
+
+
+def _exclude_swiped(viewer, user_ids, use_seen_filter=False):
+    """Отбросить кандидатов, с которыми у зрителя уже есть лайк или мэтч"""
+    if not user_ids:
+        return []
+
+    if use_seen_filter:
+        # Фильтр Блума заменяет запрос к таблице лайков
+        excluded = seen_filter.seen_among(viewer.pk, user_ids)
+    else:
+        excluded = set(
+            Like.objects.filter(
+                from_user=viewer,
+                to_user__id__in=user_ids
+            ).values_list('to_user__id', flat=True)
+        )
+    for user1_id, user2_id in Match.objects.filter(
+        Q(user1=viewer, user2_id__in=user_ids) | Q(user2=viewer, user1_id__in=user_ids),
+        is_active=True
+    ).values_list('user1_id', 'user2_id'):
+        excluded.add(user1_id)
+        excluded.add(user2_id)
+
+    return [user_id for user_id in user_ids if user_id not in excluded]
+
+
+def _page_after(key, cursor, count):
+    """Страница участников корзины после позиции курсора (rating, id) в порядке убывания"""
+    if cursor is None:
+        return redis_client.zrevrange(key, 0, count - 1, withscores=True)
+
+    rating, user_id = cursor
+    page = _page_after_script(keys=[key], args=[repr(float(rating)), to_member(user_id), count])
+    return [(member, float(score)) for member, score in zip(page[::2], page[1::2])]
+
+
+def get_candidate_ids(viewer, limit, cursors=None):
+    """
+    Читает кандидатов для ленты из индекса: сначала город зрителя,
+    затем остальные города. Для каждой корзины продолжает с сохраненного
+    курсора. Возвращает (id кандидатов, новые курсоры) или None,
+    если индекс не построен.
+    """
+    if not redis_client.exists(READY_KEY):
+        return None
+
+    keys = [
+        bucket_key(viewer.seeking_gender, viewer.gender, viewer.city),
+        wide_bucket_key(viewer.seeking_gender, viewer.gender),
+    ]
+
+    page_size = settings.CANDIDATE_INDEX_PAGE_SIZE
+    max_scanned = settings.CANDIDATE_INDEX_MAX_SCAN
+    use_seen_filter = settings.SEEN_FILTER_ENABLED and seen_filter.is_built(viewer.pk)
+    cursors = {key: cursor for key, cursor in (cursors or {}).items() if key in keys}
+    candidate_ids = []
+    seen = {viewer.pk}
+
+    for key in keys:
+        scanned = 0
+        while (
+            len(candidate_ids) < limit
+            and scanned < max_scanned
+            and cursors.get(key) != CURSOR_END
+        ):
+            page = _page_after(key, cursors.get(key), page_size)
+            if not page:
+                cursors[key] = CURSOR_END
+                break
+            scanned += len(page)
+
+            # Анкеты города зрителя уже пройдены на первом шаге
+            local = [None] * len(page)
+            if key != keys[0]:
+                local = redis_client.zmscore(keys[0], [member for member, _ in page])
+
+            page_ids = []
+            for (member, _), local_score in zip(page, local):
+                user_id = from_member(member)
+                if user_id not in seen and local_score is None:
+                    seen.add(user_id)
+                    page_ids.append(user_id)
+            kept_ids = set(_exclude_swiped(viewer, page_ids, use_seen_filter))
+
+            # Курсор сдвигаем только по тем участникам, которые действительно просмотрены
+            for member, score in page:
+                user_id = from_member(member)
+                cursors[key] = (score, user_id)
+                if user_id in kept_ids:
+                    candidate_ids.append(user_id)
+                    if len(candidate_ids) >= limit:
+                        break
+
+    # Все корзины пройдены до конца - следующий запрос начнет ленту сначала
+    if all(cursors.get(key) == CURSOR_END for key in keys):
+        cursors = {}
+
+    return candidate_ids, cursors
+
+
+def get_candidates(viewer, limit, cursors=None):
+    """
+    Кандидаты для ленты в порядке рейтинга и новые курсоры
+    или None, если индекс недоступен
+    """
+    try:
+        result = get_candidate_ids(viewer, limit, cursors)
+    except Exception as e:
+        logger.error(f"Error reading candidate index: {str(e)}")
+        return None
+
+    if result is None:
+        return None
+
+    candidate_ids, cursors = result
+    users = User.objects.in_bulk(candidate_ids)
+    return [users[user_id] for user_id in candidate_ids if user_id in users], cursors
+
+
+def rebuild():
+    """Полностью перестроить индекс кандидатов по таблице пользователей"""
+    # Пока индекс строится, лента читается из базы
+    redis_client.delete(READY_KEY)
+    for key in redis_client.scan_iter(match='candidates:*'):
+        redis_client.delete(key)
+    for key in redis_client.scan_iter(match='candidates_all:*'):
+        redis_client.delete(key)
+    redis_client.delete(BUCKETS_KEY)
+
+    users = User.objects.values_list(
+        'id', 'gender', 'seeking_gender', 'city', 'combined_rating'
+    ).iterator(chunk_size=settings.CANDIDATE_INDEX_PAGE_SIZE * 10)
+    indexed_count = _index_rows(users)
+    redis_client.set(READY_KEY, 1)
+
+    logger.info(f"Rebuilt candidate index for {indexed_count} users")
+    return indexed_count
+
+
+def update_scores(users):
+    """
+    Обновить рейтинги в индексе после массового пересчета в базе:
+    UPDATE по набору строк не вызывает сигналы post_save
+    """
+    return _index_rows(
+        users.values_list('id', 'gender', 'seeking_gender', 'city', 'combined_rating')
+    )
+
+
+def _index_rows(rows):
+    indexed_count = 0
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id, gender, seeking_gender, city, combined_rating in rows:
+        member = to_member(user_id)
+        bucket = bucket_key(gender, seeking_gender, city)
+        pipe.zadd(bucket, {member: combined_rating})
+        pipe.zadd(wide_bucket_key(gender, seeking_gender), {member: combined_rating})
+        pipe.hset(BUCKETS_KEY, member, bucket)
+        indexed_count += 1
+        if indexed_count % 1000 == 0:
+            pipe.execute()
+    pipe.execute()
+    return indexed_count
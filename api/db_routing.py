@@ -0,0 +1,142 @@
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import Resolver404, resolve
+from .redis_client import get_async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Чтение с реплик (settings.DATABASE_REPLICAS). По умолчанию все идет в default;
+# на реплики читают только GET/HEAD-запросы API (ReplicaRoutingMiddleware) и
+# сканы пересчета рейтингов (replica_reads). Чтобы пользователь видел свои
+# изменения, после записи:
+# - в том же запросе все следующие чтения идут в default;
+# - его следующие запросы DB_REPLICA_PIN_SECONDS читают из default
+#   (метка в Redis по telegram_id, ставится сигналами в api/signals.py).
+PIN_KEY_PREFIX = 'db_primary_pin:'
+# Параметры запроса, по которым определяется пользователь
+ACTOR_PARAMS = ('exclude_user', 'telegram_id', 'user1', 'from_user')
+
+
+class RoutingState:
+    def __init__(self, replica, pin_on_write=True):
+        # Можно ли сейчас читать с реплики
+        self.replica = replica
+        # Переключаться на default после первой записи
+        self.pin_on_write = pin_on_write
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+def replicas_enabled():
+    return bool(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica or not replicas_enabled():
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем там же, где пишем
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.pin_on_write:
+            state.replica = False
+        # Явно: иначе объект, прочитанный с реплики, сохранялся бы на нее
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+@contextmanager
+def replica_reads():
+    """Чтения внутри блока идут на реплики; запись не переключает их на default"""
+    token = _state.set(RoutingState(replica=True, pin_on_write=False))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def get_pin_key(telegram_id):
+    return f"{PIN_KEY_PREFIX}{telegram_id}"
+
+
+def pin_primary(telegram_id):
+    """Пользователь что-то изменил - его чтения пока идут в default"""
+    if replicas_enabled():
+        redis_client.set(get_pin_key(telegram_id), 1, ex=settings.DB_REPLICA_PIN_SECONDS)
+
+
+def get_actor(request):
+    for param in ACTOR_PARAMS:
+        value = request.GET.get(param)
+        if value:
+            return value
+    try:
+        return resolve(request.path_info).kwargs.get('telegram_id')
+    except Resolver404:
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Разрешает чтение с реплик для GET/HEAD-запросов незакрепленных пользователей"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        replica = self.is_read(request)
+        if replica:
+            actor = get_actor(request)
+            try:
+                replica = not (actor and redis_client.exists(get_pin_key(actor)))
+            except Exception as e:
+                logger.error(f"Error reading primary pin: {str(e)}")
+                replica = False
+        token = _state.set(RoutingState(replica=replica))
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
+
+    async def __acall__(self, request):
+        replica = self.is_read(request)
+        if replica:
+            actor = get_actor(request)
+            try:
+                replica = not (actor and await get_async_redis_client().exists(get_pin_key(actor)))
+            except Exception as e:
+                logger.error(f"Error reading primary pin: {str(e)}")
+                replica = False
+        token = _state.set(RoutingState(replica=replica))
+        try:
+            return await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+    @staticmethod
+    def is_read(request):
+        return replicas_enabled() and request.method in ('GET', 'HEAD')
@@ -0,0 +1,29 @@
+import logging
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Пользователи, у которых изменились счетчики или фотографии с последнего
+# пересчета. Задача recalculate_dirty_ratings пересчитывает только их.
+DIRTY_RATINGS_KEY = 'ratings_dirty'
+
+
+def mark_dirty(*user_ids):
+    """Отметить пользователей для пересчета рейтингов"""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids:
+        return
+    try:
+        redis_client.sadd(DIRTY_RATINGS_KEY, *user_ids)
+    except Exception as e:
+        # Пропущенных пользователей подберет полный пересчет по расписанию
+        logger.error(f"Error marking ratings dirty for users {user_ids}: {str(e)}")
+
+
+def pending_count():
+    return redis_client.scard(DIRTY_RATINGS_KEY)
+
+
+def pop_batch(count):
+    """Забрать из множества до count пользователей"""
+    return [int(user_id) for user_id in redis_client.spop(DIRTY_RATINGS_KEY, count) or []]
@@ -0,0 +1,155 @@
+import logging
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from .models import User, Like, Match
+from .redis_client import redis_client
+from . import candidate_index
+from .candidate_index import CURSOR_END
+
+logger = logging.getLogger(__name__)
+
+FEED_QUERY_MODES = ('not_exists', 'exclude_lists')
+
+# Поле хеша курсоров для ленты, собранной запросом к базе
+DB_CURSOR_FIELD = 'db'
+
+
+def get_cursor_key(telegram_id):
+    return f"feed_cursor:{telegram_id}"
+
+
+def parse_cursor(value):
+    """Курсор вида "<combined_rating>:<id>" -> (rating, id)"""
+    if value == CURSOR_END:
+        return CURSOR_END
+    rating, user_id = value.rsplit(':', 1)
+    return float(rating), int(user_id)
+
+
+def format_cursor(cursor):
+    if cursor == CURSOR_END:
+        return CURSOR_END
+    rating, user_id = cursor
+    return f"{rating!r}:{user_id}"
+
+
+def load_cursors(telegram_id):
+    """Сохраненные курсоры ленты зрителя: источник -> (rating, id)"""
+    try:
+        stored = redis_client.hgetall(get_cursor_key(telegram_id))
+        return {source: parse_cursor(value) for source, value in stored.items()}
+    except Exception as e:
+        logger.error(f"Error loading feed cursors for user {telegram_id}: {str(e)}")
+        return {}
+
+
+def save_cursors(telegram_id, cursors):
+    key = get_cursor_key(telegram_id)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.delete(key)
+        if cursors:
+            pipe.hset(key, mapping={source: format_cursor(cursor) for source, cursor in cursors.items()})
+            pipe.expire(key, settings.FEED_CURSOR_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error saving feed cursors for user {telegram_id}: {str(e)}")
+
+
+def exclude_lists_queryset(viewer):
+    """Исключения передаются в базу списками id (NOT IN)"""
+    queryset = User.objects.exclude(id=viewer.id)
+
+    # Фильтруем по предпочтениям пола
+    queryset = queryset.filter(
+        gender=viewer.seeking_gender,
+        seeking_gender=viewer.gender
+    )
+
+    # Исключаем пользователей, с которыми уже есть лайки
+    liked_users = Like.objects.filter(
+        from_user__telegram_id=viewer.telegram_id
+    ).values_list('to_user__telegram_id', flat=True)
+    queryset = queryset.exclude(telegram_id__in=liked_users)
+
+    # Исключаем пользователей, с которыми уже есть мэтчи
+    matched_users = Match.objects.filter(
+        Q(user1__telegram_id=viewer.telegram_id) | Q(user2__telegram_id=viewer.telegram_id),
+        is_active=True
+    ).values_list('user1__telegram_id', 'user2__telegram_id')
+    matched_ids = set()
+    for user1, user2 in matched_users:
+        matched_ids.add(user1)
+        matched_ids.add(user2)
+    return queryset.exclude(telegram_id__in=matched_ids)
+
+
+def not_exists_queryset(viewer):
+    """Исключения выполняются в базе коррелированными подзапросами NOT EXISTS"""
+    queryset = User.objects.exclude(id=viewer.id).filter(
+        gender=viewer.seeking_gender,
+        seeking_gender=viewer.gender
+    )
+
+    liked = Like.objects.filter(
+        from_user=viewer.telegram_id,
+        to_user=OuterRef('telegram_id')
+    )
+    matched = Match.objects.filter(
+        Q(user1=viewer, user2=OuterRef('pk')) | Q(user2=viewer, user1=OuterRef('pk')),
+        is_active=True
+    )
+    return queryset.exclude(Exists(liked)).exclude(Exists(matched))
+
+
+def get_feed_queryset(viewer, limit, mode=None, cursor=None):
+    """Подбор кандидатов для ленты напрямую из базы данных"""
+    mode = mode or settings.FEED_QUERY_MODE
+    if mode == 'exclude_lists':
+        queryset = exclude_lists_queryset(viewer)
+    else:
+        queryset = not_exists_queryset(viewer)
+
+    # Продолжаем с позиции курсора: range scan по (combined_rating, id)
+    if cursor is not None:
+        rating, user_id = cursor
+        queryset = queryset.filter(
+            Q(combined_rating__lt=rating) | Q(combined_rating=rating, id__lt=user_id)
+        )
+
+    # Сортируем по рейтингу и ограничиваем количество результатов
+    return queryset.order_by('-combined_rating', '-id')[:limit]
+
+
+def get_db_feed(viewer, limit, cursor=None):
+    """Страница ленты из базы и курсор следующей страницы (None - лента закончилась)"""
+    profiles = list(get_feed_queryset(viewer, limit, cursor=cursor))
+    if len(profiles) < limit:
+        return profiles, None
+    last = profiles[-1]
+    return profiles, (last.combined_rating, last.id)
+
+
+def build_feed(viewer, limit):
+    """
+    Следующая порция ленты зрителя. Позиция в ленте хранится в Redis,
+    поэтому каждое пополнение продолжает с места предыдущего.
+    """
+    cursors = load_cursors(viewer.telegram_id)
+
+    result = None
+    if settings.CANDIDATE_INDEX_ENABLED:
+        result = candidate_index.get_candidates(viewer, limit, cursors)
+
+    if result is None:
+        db_cursor = cursors.get(DB_CURSOR_FIELD)
+        if db_cursor == CURSOR_END:
+            db_cursor = None
+        profiles, next_cursor = get_db_feed(viewer, limit, db_cursor)
+        # Лента закончилась - следующее пополнение начнется сначала
+        cursors = {DB_CURSOR_FIELD: next_cursor} if next_cursor else {}
+    else:
+        profiles, cursors = result
+
+    save_cursors(viewer.telegram_id, cursors)
+    return profiles
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+from django.db.models import Q
+from .models import UserImage
+
+logger = logging.getLogger(__name__)
+
+# Поля UserImage с объектами в хранилище. Одинаковые фото (по content_hash)
+# ссылаются на одни и те же объекты, поэтому объект удаляется только вместе
+# с последней ссылкой на него.
+FILE_FIELDS = ('image', 'card_image', 'thumbnail')
+
+
+def content_hash(file):
+    """SHA-256 загруженного файла; файл читается кусками и перематывается в начало"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def is_referenced(name):
+    """Ссылается ли на объект хоть одно фото"""
+    query = Q()
+    for field in FILE_FIELDS:
+        query |= Q(**{field: name})
+    return UserImage.objects.filter(query).exists()
+
+
+def find_duplicate(user, image_hash):
+    """
+    Уже сохраненное фото с тем же содержимым: (фото, принадлежит ли оно user).
+    Фото самого пользователя важнее - повторно его не создаем.
+    """
+    if not image_hash:
+        return None, False
+    same = UserImage.objects.filter(content_hash=image_hash)
+    own = same.filter(user=user).first()
+    if own is not None:
+        return own, True
+    return same.first(), False
+
+
+def shared_fields(original):
+    """Поля нового UserImage, ссылающегося на объекты original без загрузки"""
+    return {field: getattr(original, field).name for field in FILE_FIELDS}
+
+
+def deduplicate(image, source):
+    """
+    Найти повтор фото, зарегистрированного по ключу объекта (хеш считается в Celery
+    по уже прочитанному оригиналу source, а не в API). Возвращает фото, для которого
+    еще нужны уменьшенные копии, или None, если копии уже есть у повтора.
+    """
+    image_hash = hashlib.sha256(source.getvalue()).hexdigest()
+    duplicate, is_own = find_duplicate(image.user, image_hash)
+
+    if is_own:
+        # Пользователь уже загружал это фото - лишняя запись не нужна,
+        # объект удалит release_files, если на него никто не ссылается
+        if image.is_main and not duplicate.is_main:
+            duplicate.is_main = True
+            duplicate.save(update_fields=['is_main'])
+        image.delete()
+        return None
+
+    image.content_hash = image_hash
+    if duplicate is None:
+        image.save(update_fields=['content_hash'])
+        return image
+
+    key = image.image.name
+    for field, name in shared_fields(duplicate).items():
+        setattr(image, field, name)
+    image.save(update_fields=['content_hash', *FILE_FIELDS])
+    if not is_referenced(key):
+        try:
+            image.image.storage.delete(key)
+        except Exception as e:
+            logger.error(f"Error deleting duplicate image {key}: {str(e)}")
+    # Копии повтора еще не готовы - создадим свои по тому же содержимому
+    return None if image.card_image else image
+
+
+def release_files(image):
+    """Удалить объекты удаленного фото, на которые больше никто не ссылается"""
+    for field in FILE_FIELDS:
+        file = getattr(image, field)
+        if not file.name:
+            continue
+        # Ссылка из любого поля любого фото, в том числе без хеша или со старым хешем
+        if is_referenced(file.name):
+            continue
+        try:
+            file.storage.delete(file.name)
+        except Exception as e:
+            logger.error(f"Error deleting {file.name} from storage: {str(e)}")
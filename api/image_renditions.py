@@ -0,0 +1,47 @@
+import io
+import os
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Уменьшенные копии загруженных фотографий: (поле UserImage, наибольшая сторона, качество JPEG)
+RENDITIONS = {
+    'card': ('card_image', 1080, 82),
+    'thumbnail': ('thumbnail', 320, 75),
+}
+
+
+def render(source, max_side, quality):
+    """Уменьшить изображение до max_side по большей стороне и пережать в JPEG"""
+    with Image.open(source) as image:
+        # Учитываем поворот из EXIF, сами EXIF-данные в копию не попадают
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def read_original(user_image):
+    with user_image.image.open('rb') as original:
+        return io.BytesIO(original.read())
+
+
+def generate(user_image, source=None):
+    """Создать копии фотографии и сохранить их рядом с оригиналом"""
+    if source is None:
+        source = read_original(user_image)
+
+    base_name = os.path.splitext(os.path.basename(user_image.image.name))[0]
+    for name, (field, max_side, quality) in RENDITIONS.items():
+        source.seek(0)
+        getattr(user_image, field).save(
+            f"{base_name}_{name}.jpg",
+            ContentFile(render(source, max_side, quality)),
+            save=False
+        )
+
+    # Сигналы post_save сбросят кеш карточки владельца
+    user_image.save(update_fields=[field for field, _, _ in RENDITIONS.values()])
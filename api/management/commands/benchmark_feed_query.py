@@ -0,0 +1,78 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api import feed
+from api.models import User, Like, Match
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает режимы запроса ленты (NOT EXISTS и списки NOT IN) '
+        'на пользователе с большим числом свайпов. Тестовые данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--swipes', type=int, default=10000, help='Количество свайпов зрителя')
+        parser.add_argument('--matches', type=int, default=500, help='Количество мэтчей зрителя')
+        parser.add_argument('--candidates', type=int, default=20000, help='Количество кандидатов подходящего пола')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            viewer = self.seed(options)
+            for mode in feed.FEED_QUERY_MODES:
+                timings = self.measure(viewer, mode, options['limit'], options['repeat'])
+                self.stdout.write(
+                    f"{mode:>14}: median {statistics.median(timings):.2f} ms, "
+                    f"p95 {self.percentile(timings, 95):.2f} ms, max {max(timings):.2f} ms"
+                )
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        # Берем id заведомо выше существующих, чтобы не конфликтовать с реальными данными
+        base_id = (User.objects.order_by('-telegram_id').values_list('telegram_id', flat=True).first() or 0) + 1
+        # bulk_create не вызывает сигналы, поэтому индекс кандидатов в Redis не затрагивается
+        viewer, = User.objects.bulk_create([User(
+            telegram_id=base_id, name='benchmark', gender='M', age=30,
+            seeking_gender='F', city='benchmark'
+        )])
+        candidates = User.objects.bulk_create([
+            User(
+                telegram_id=base_id + i, name=f'candidate {i}', gender='F', age=25,
+                seeking_gender='M', city='benchmark',
+                combined_rating=float(i % 100)
+            )
+            for i in range(1, options['candidates'] + 1)
+        ], batch_size=1000)
+
+        swiped = candidates[:options['swipes']]
+        Like.objects.bulk_create([
+            Like(from_user=viewer, to_user=candidate, is_skip=i % 3 == 0)
+            for i, candidate in enumerate(swiped)
+        ], batch_size=1000)
+        Match.objects.bulk_create([
+            Match(user1=viewer, user2=candidate)
+            for candidate in swiped[:options['matches']]
+        ], batch_size=1000)
+
+        self.stdout.write(
+            f"Seeded viewer with {len(swiped)} swipes and {min(options['matches'], len(swiped))} matches "
+            f"over {len(candidates)} candidates"
+        )
+        return viewer
+
+    def measure(self, viewer, mode, limit, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(feed.get_feed_queryset(viewer, limit, mode=mode))
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    @staticmethod
+    def percentile(values, percent):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+        return ordered[index]
@@ -0,0 +1,114 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api import candidate_index, rating_engine
+from api.models import User, UserImage
+from api.ratings import (
+    behavioral_rating_expression,
+    combined_rating_expression,
+    primary_rating_expression,
+)
+from api.tasks import update_in_batches
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность пересчета рейтингов: методы '
+        'User.update_ratings, SQL UPDATE и движок numpy. Тестовые данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000, help='Количество тестовых пользователей')
+        parser.add_argument('--sample', type=int, default=1000,
+                            help='Сколько пользователей пересчитать по одному (результат экстраполируется)')
+        parser.add_argument('--chunk-size', type=int, help='Размер пачки движка numpy')
+
+    def handle(self, *args, **options):
+        seeded_ids = []
+        try:
+            with transaction.atomic():
+                seeded_ids = self.seed(options['users'])
+                total = User.objects.count()
+
+                self.report('per-instance', *self.run_per_instance(options['sample']))
+
+                primary = primary_rating_expression()
+                behavioral = behavioral_rating_expression()
+                started = time.perf_counter()
+                update_in_batches(
+                    primary_rating=primary,
+                    behavioral_rating=behavioral,
+                    combined_rating=combined_rating_expression(primary, behavioral)
+                )
+                self.report('sql', total, time.perf_counter() - started)
+                sql_ratings = self.snapshot()
+
+                started = time.perf_counter()
+                rating_engine.recalculate(chunk_size=options['chunk_size'])
+                self.report('numpy', total, time.perf_counter() - started)
+
+                mismatches = int(np.count_nonzero(sql_ratings != self.snapshot()))
+                if mismatches:
+                    self.stdout.write(self.style.ERROR(f"numpy differs from sql in {mismatches} values"))
+                else:
+                    self.stdout.write(self.style.SUCCESS('numpy matches sql for all users'))
+
+                transaction.set_rollback(True)
+        finally:
+            # Пересчет обновил индекс кандидатов, а строки откатились
+            try:
+                candidate_index.remove_users(seeded_ids)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"Could not clean candidate index: {str(e)}"))
+
+    def seed(self, count, batch_size=10000):
+        # Берем id заведомо выше существующих, чтобы не конфликтовать с реальными данными
+        base_id = (User.objects.order_by('-telegram_id').values_list('telegram_id', flat=True).first() or 0) + 1
+        rng = np.random.default_rng(0)
+
+        seeded_ids = []
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            likes = rng.integers(0, 500, size)
+            skips = rng.integers(0, 500, size)
+            matches = rng.integers(0, likes + 1)
+            conversations = rng.integers(0, matches + 1)
+            bio_lengths = rng.integers(0, 100, size)
+
+            # bulk_create не вызывает сигналы, поэтому индекс кандидатов в Redis не затрагивается
+            users = User.objects.bulk_create([
+                User(
+                    telegram_id=base_id + start + i, name=f'benchmark {start + i}',
+                    gender='MF'[i % 2], age=18 + i % 50, seeking_gender='FM'[i % 2],
+                    city='benchmark', bio='x' * int(bio_lengths[i]),
+                    likes_count=int(likes[i]), skips_count=int(skips[i]),
+                    matches_count=int(matches[i]), conversations_initiated=int(conversations[i])
+                )
+                for i in range(size)
+            ])
+            UserImage.objects.bulk_create([
+                UserImage(user=user, image=f'user_images/benchmark_{user.pk}_{n}.jpg', is_main=n == 0)
+                for i, user in enumerate(users)
+                for n in range(i % 4)
+            ])
+            seeded_ids.extend(user.pk for user in users)
+
+        self.stdout.write(f"Seeded {len(seeded_ids)} users")
+        return seeded_ids
+
+    def run_per_instance(self, sample):
+        users = list(User.objects.order_by('?')[:sample])
+        started = time.perf_counter()
+        for user in users:
+            user.update_ratings()
+        return len(users), time.perf_counter() - started
+
+    def snapshot(self):
+        return np.array(
+            User.objects.order_by('id').values_list(*rating_engine.RATING_FIELDS),
+            dtype=np.float64
+        )
+
+    def report(self, name, count, seconds):
+        self.stdout.write(f"{name:>12}: {count} users in {seconds:.2f} s, {count / seconds:,.0f} users/s")
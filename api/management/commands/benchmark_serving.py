@@ -0,0 +1,175 @@
+import asyncio
+import os
+import random
+import subprocess
+import time
+import aiohttp
+from common.queue_scripts import get_queue_key, get_queue_members_key
+from django.core.management.base import BaseCommand, CommandError
+from api import candidate_index, db_routing, dirty_ratings, feed, seen_filter
+from api.models import User
+from api.redis_client import redis_client
+
+SERVERS = {
+    # Синхронные представления DRF под WSGI (gunicorn - в requirements-dev.txt)
+    'wsgi': (['gunicorn', 'dating.wsgi:application', '--workers', '{workers}', '--bind', '127.0.0.1:{port}'], 'false'),
+    # Асинхронные горячие эндпоинты под ASGI
+    'asgi': (['uvicorn', 'dating.asgi:application', '--workers', '{workers}', '--port', '{port}',
+              '--no-access-log'], 'true'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает запросы в секунду горячих эндпоинтов под gunicorn (WSGI) и uvicorn '
+        '(ASGI, ASYNC_HOT_VIEWS) при одинаковом числе воркеров. Серверы работают в '
+        'отдельных процессах, поэтому нагрузка идет от временных пользователей, '
+        'которые после замера удаляются вместе с их лайками, очередями и курсорами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Воркеров у каждого сервера')
+        parser.add_argument('--concurrency', type=int, default=100, help='Одновременных клиентов')
+        parser.add_argument('--duration', type=float, default=15, help='Длительность замера в секундах')
+        parser.add_argument('--port', type=int, default=8800)
+        parser.add_argument('--swipes', action='store_true', help='Добавить в нагрузку POST /api/swipe/')
+        parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+        parser.add_argument('--users', type=int, default=200, help='Количество временных пользователей')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя')
+
+        telegram_ids = self.seed(options['users'])
+        try:
+            for name in options['servers']:
+                self.run_server(name, telegram_ids, options)
+        finally:
+            self.cleanup(telegram_ids)
+
+    def run_server(self, name, telegram_ids, options):
+        server = self.start_server(name, options['workers'], options['port'])
+        try:
+            requests, errors, latencies = asyncio.run(self.load(
+                f"http://127.0.0.1:{options['port']}", telegram_ids,
+                options['concurrency'], options['duration'], options['swipes']
+            ))
+        finally:
+            server.terminate()
+            server.wait()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        self.stdout.write(
+            f"{name}: {requests / options['duration']:,.1f} req/s, "
+            f"p50 {p50:.1f} ms, p99 {p99:.1f} ms, errors {errors}"
+        )
+
+    def seed(self, count):
+        """Временные пользователи в отдельном городе; свайпают только друг друга"""
+        # Берем id заведомо выше существующих, чтобы не конфликтовать с реальными данными
+        base_id = (User.objects.order_by('-telegram_id').values_list('telegram_id', flat=True).first() or 0) + 1
+        User.objects.bulk_create([
+            User(
+                telegram_id=base_id + i, name=f'benchmark {i}', age=25, city='benchmark',
+                gender='MF'[i % 2], seeking_gender='FM'[i % 2]
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        users = User.objects.filter(telegram_id__gte=base_id, telegram_id__lt=base_id + count)
+        # bulk_create не вызывает сигналы - добавляем пользователей в индекс кандидатов сами
+        candidate_index.update_scores(users)
+        self.stdout.write(f"Created {count} benchmark users (telegram_id {base_id}..{base_id + count - 1})")
+        return list(range(base_id, base_id + count))
+
+    def cleanup(self, telegram_ids):
+        """Удалить временных пользователей и все, что нагрузка записала для них в Redis"""
+        users = User.objects.filter(telegram_id__in=telegram_ids)
+        user_ids = list(users.values_list('id', flat=True))
+        # Сигналы post_delete убирают пользователей из индекса, кеша карточек
+        # и множеств лайкнувших; лайки и мэтчи удаляются каскадом
+        users.delete()
+
+        keys = []
+        for telegram_id in telegram_ids:
+            keys += [
+                get_queue_key(telegram_id), get_queue_members_key(telegram_id),
+                feed.get_cursor_key(telegram_id), db_routing.get_pin_key(telegram_id),
+            ]
+        keys += [seen_filter.get_filter_key(user_id) for user_id in user_ids]
+        pipe = redis_client.pipeline(transaction=False)
+        for start in range(0, len(keys), 1000):
+            pipe.delete(*keys[start:start + 1000])
+        if user_ids:
+            pipe.srem(dirty_ratings.DIRTY_RATINGS_KEY, *user_ids)
+            pipe.srem(seen_filter.BUILT_KEY, *user_ids)
+        pipe.execute()
+        self.stdout.write(f"Removed {len(user_ids)} benchmark users")
+
+    def start_server(self, name, workers, port):
+        command, async_views = SERVERS[name]
+        command = [part.format(workers=workers, port=port) for part in command]
+        env = {**os.environ, 'ASYNC_HOT_VIEWS': async_views}
+        server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # Ждем, пока сервер начнет отвечать
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"{name} server exited with code {server.returncode}")
+            try:
+                asyncio.run(self.ping(f"http://127.0.0.1:{port}"))
+                return server
+            except (aiohttp.ClientError, OSError):
+                time.sleep(0.5)
+        server.terminate()
+        raise CommandError(f"{name} server did not start")
+
+    @staticmethod
+    async def ping(base_url):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{base_url}/api/images/"):
+                pass
+
+    @staticmethod
+    def request_for(telegram_ids, swipes):
+        user1, user2 = random.sample(telegram_ids, 2)
+        choices = [
+            ('GET', '/api/users/', {'params': {'exclude_user': user1}}),
+            ('GET', '/api/matches/check/', {'params': {'user1': user1, 'user2': user2}}),
+            ('GET', '/api/images/', {'params': {'telegram_id': user2}}),
+        ]
+        if swipes:
+            choices.append(('POST', '/api/swipe/', {'json': {'from_user': user1, 'to_user': user2, 'is_skip': True}}))
+        return random.choice(choices)
+
+    async def load(self, base_url, telegram_ids, concurrency, duration, swipes):
+        requests = errors = 0
+        latencies = []
+        deadline = time.monotonic() + duration
+
+        async def client(session):
+            nonlocal requests, errors
+            while time.monotonic() < deadline:
+                method, path, kwargs = self.request_for(telegram_ids, swipes)
+                started = time.perf_counter()
+                try:
+                    async with session.request(method, f"{base_url}{path}", **kwargs) as response:
+                        await response.read()
+                        status = response.status
+                except aiohttp.ClientError:
+                    errors += 1
+                    continue
+                # В req/s и задержки идут только успешные ответы: быстрые ошибки
+                # (например, повторный свайп той же пары) не завышают пропускную способность
+                if not 200 <= status < 300:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                requests += 1
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+            await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        return requests, errors, latencies
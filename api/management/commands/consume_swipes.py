@@ -0,0 +1,44 @@
+import logging
+import os
+import socket
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api import swipe_stream
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Потребитель потока свайпов (SWIPE_INGESTION_MODE=stream): пачками пишет '
+        'лайки в базу, применяет счетчики и создает мэтчи. Можно запускать несколько.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', help='Имя потребителя в группе; по умолчанию host-pid')
+        parser.add_argument('--batch-size', type=int, default=settings.SWIPE_STREAM_BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help='Обработать накопленные события и выйти')
+
+    def handle(self, *args, **options):
+        consumer = options['consumer'] or f"{socket.gethostname()}-{os.getpid()}"
+        swipe_stream.ensure_group()
+        logger.info(f"Swipe consumer {consumer} started")
+
+        while True:
+            entries = swipe_stream.read_batch(consumer, options['batch_size'], settings.SWIPE_STREAM_BLOCK_MS)
+            if not entries:
+                if options['once']:
+                    break
+                continue
+
+            try:
+                swipes_count, matches_count = swipe_stream.ingest(entries)
+            except Exception as e:
+                # События остаются неподтвержденными и будут забраны повторно
+                logger.error(f"Error ingesting {len(entries)} swipe events: {str(e)}")
+                time.sleep(1)
+                continue
+
+            swipe_stream.ack([entry_id for entry_id, _ in entries])
+            logger.info(f"Ingested {swipes_count} swipes and {matches_count} matches from {len(entries)} events")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.models import UserImage
+from api.tasks import generate_image_renditions
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь Celery создание уменьшенных копий для фотографий без них'
+
+    def handle(self, *args, **options):
+        image_ids = UserImage.objects.filter(card_image='').values_list('id', flat=True)
+        scheduled_count = 0
+        for image_id in image_ids.iterator():
+            generate_image_renditions.delay(image_id)
+            scheduled_count += 1
+        self.stdout.write(self.style.SUCCESS(f"Scheduled renditions for {scheduled_count} images"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api import candidate_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает индекс кандидатов ленты в Redis по таблице пользователей'
+
+    def handle(self, *args, **options):
+        indexed_count = candidate_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed_count} users"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from api import seen_filter
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает фильтры просмотренных анкет в Redis по таблице лайков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='telegram_ids',
+            help='telegram_id зрителя (можно указать несколько раз); по умолчанию все пользователи'
+        )
+
+    def handle(self, *args, **options):
+        viewer_ids = None
+        if options['telegram_ids']:
+            viewer_ids = list(
+                User.objects.filter(telegram_id__in=options['telegram_ids']).values_list('id', flat=True)
+            )
+
+        size, hash_count = seen_filter.filter_size()
+        rebuilt_count = seen_filter.rebuild(viewer_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rebuilt_count} filters ({size} bits, {hash_count} hashes each)"
+        ))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.20 on 2026-10-17 07:07
+
+from django.db import migrations, models
+from api.migration_operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('api', '0004_alter_like_from_user_alter_like_to_user'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='like',
+            index=models.Index(fields=['to_user', 'from_user', 'is_skip'], name='like_mutual_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='like',
+            index=models.Index(condition=models.Q(('is_skip', False)), fields=['to_user', 'from_user'], name='like_mutual_nonskip_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='match',
+            index=models.Index(fields=['user1', 'is_active'], name='match_user1_active_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='match',
+            index=models.Index(fields=['user2', 'is_active'], name='match_user2_active_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='match',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user1'], name='match_user1_only_active_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='match',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user2'], name='match_user2_only_active_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='user',
+            index=models.Index(fields=['gender', 'seeking_gender', '-combined_rating', '-id'], name='user_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.20 on 2026-10-17 07:21
+
+from django.db import migrations, models
+import storages.backends.s3
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimage',
+            name='card_image',
+            field=models.ImageField(blank=True, max_length=255, storage=storages.backends.s3.S3Storage(), upload_to='user_images/renditions/'),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, max_length=255, storage=storages.backends.s3.S3Storage(), upload_to='user_images/renditions/'),
+        ),
+    ]
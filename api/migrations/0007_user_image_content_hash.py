@@ -0,0 +1,25 @@
+# Generated by Django 4.2.20 on 2026-10-17 07:24
+
+from django.db import migrations, models
+from api.migration_operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('api', '0006_user_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimage',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='userimage',
+            index=models.Index(fields=['content_hash'], name='userimage_content_hash_idx'),
+        ),
+    ]
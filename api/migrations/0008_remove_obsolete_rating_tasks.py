@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.utils import timezone
+
+# Полные пересчеты рейтингов убраны из beat_schedule (dating/celery.py), но
+# DatabaseScheduler хранит задачи в базе и продолжил бы их запускать
+OBSOLETE_TASKS = (
+    'recalculate-primary-ratings',
+    'recalculate-behavioral-ratings',
+    'recalculate-combined-ratings',
+)
+
+
+def remove_obsolete_tasks(apps, schema_editor):
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    PeriodicTasks = apps.get_model('django_celery_beat', 'PeriodicTasks')
+
+    deleted, _ = PeriodicTask.objects.filter(name__in=OBSOLETE_TASKS).delete()
+    if deleted:
+        # Запущенный beat перечитает расписание
+        PeriodicTasks.objects.update_or_create(ident=1, defaults={'last_update': timezone.now()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_user_image_content_hash'),
+        ('django_celery_beat', '0019_alter_periodictasks_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_obsolete_tasks, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,13 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser
 from storages.backends.s3boto3 import S3Boto3Storage
-from django.db.models import Avg, Count, F, ExpressionWrapper, FloatField
+from django.db.models import Avg, Count, F, ExpressionWrapper, FloatField, Q
+from django.conf import settings
+from . import dirty_ratings, seen_filter
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class User(AbstractBaseUser):
@@ -34,6 +39,15 @@ class User(AbstractBaseUser):
     matches_count = models.PositiveIntegerField(default=0, verbose_name="Количество мэтчей")
     conversations_initiated = models.PositiveIntegerField(default=0, verbose_name="Инициировано диалогов")
 
+    class Meta:
+        indexes = [
+            # Лента: фильтр по полу и обход по (combined_rating, id)
+            models.Index(
+                fields=['gender', 'seeking_gender', '-combined_rating', '-id'],
+                name='user_feed_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"User #{self.telegram_id}"
 
@@ -132,11 +146,30 @@ class UserImage(models.Model):
         storage=S3Boto3Storage(),
         max_length=255
     )
+    # Уменьшенные копии для ленты и списков (создает задача generate_image_renditions)
+    card_image = models.ImageField(
+        upload_to='user_images/renditions/',
+        storage=S3Boto3Storage(),
+        max_length=255,
+        blank=True
+    )
+    thumbnail = models.ImageField(
+        upload_to='user_images/renditions/',
+        storage=S3Boto3Storage(),
+        max_length=255,
+        blank=True
+    )
+    # SHA-256 содержимого: одинаковые фото ссылаются на один объект в хранилище
+    content_hash = models.CharField(max_length=64, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_main = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['id']
+        indexes = [
+            # Поиск уже загруженного фото по содержимому
+            models.Index(fields=['content_hash'], name='userimage_content_hash_idx'),
+        ]
 
     def __str__(self):
         return f"Image for {self.user.name}"
@@ -147,35 +180,75 @@ class Like(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_skip = models.BooleanField(default=False)
 
+    # Взаимный ли лайк - заполняется в save() для нового свайпа
+    is_match = False
+
     class Meta:
         unique_together = ('from_user', 'to_user')
+        indexes = [
+            # Проверка взаимного лайка
+            models.Index(fields=['to_user', 'from_user', 'is_skip'], name='like_mutual_idx'),
+            models.Index(
+                fields=['to_user', 'from_user'],
+                condition=Q(is_skip=False),
+                name='like_mutual_nonskip_idx'
+            ),
+        ]
 
     def save(self, *args, **kwargs):
+        from . import mutual_likes, swipes
+
         is_new = self._state.adding
-        
-        super().save(*args, **kwargs)
-        
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if is_new:
+                self.is_match = False
+                if not self.is_skip:
+                    # Проверяем на взаимный лайк по множествам лайкнувших в Redis;
+                    # в множество получателя лайк попадет только после коммита
+                    self.is_match = mutual_likes.record_like(self.from_user_id, self.to_user_id)
+                    transaction.on_commit(self._confirm_like)
+
+                try:
+                    # Счетчики (и рейтинги обоих при мэтче) одним UPDATE
+                    swipes.apply_swipe(self, self.is_match)
+                except Exception:
+                    if not self.is_skip:
+                        self._discard_like()
+                    raise
+
         if is_new:
-            if self.is_skip:
-                self.to_user.increment_skips()
-            else:
-                self.to_user.increment_likes()
-                
-                # Проверяем на взаимный лайк
-                mutual_like = Like.objects.filter(
-                    from_user=self.to_user,
-                    to_user=self.from_user,
-                    is_skip=False
-                ).exists()
-                
-                if mutual_like:
-                    # Увеличиваем счетчик мэтчей для обоих пользователей
-                    self.from_user.increment_matches()
-                    self.to_user.increment_matches()
-                    
-                    # Обновляем рейтинги обоих пользователей
-                    self.from_user.update_ratings()
-                    self.to_user.update_ratings()
+            # Отмечаем анкету как просмотренную в фильтре зрителя после коммита
+            if settings.SEEN_FILTER_ENABLED:
+                transaction.on_commit(self._add_to_seen_filter)
+
+            if not self.is_match:
+                # Счетчики получателя изменились - пересчитаем его рейтинг
+                dirty_ratings.mark_dirty(self.to_user.pk)
+
+    def _add_to_seen_filter(self):
+        try:
+            seen_filter.add(self.from_user.pk, self.to_user.pk)
+        except Exception as e:
+            logger.error(f"Error updating seen filter for user {self.from_user_id}: {str(e)}")
+
+    def _confirm_like(self):
+        from . import mutual_likes
+
+        try:
+            mutual_likes.confirm_like(self.from_user_id, self.to_user_id)
+        except Exception as e:
+            logger.error(f"Error confirming like {self.from_user_id} -> {self.to_user_id} in Redis: {str(e)}")
+
+    def _discard_like(self):
+        from . import mutual_likes
+
+        try:
+            mutual_likes.discard_like(self.from_user_id, self.to_user_id)
+        except Exception as e:
+            logger.error(f"Error discarding like {self.from_user_id} -> {self.to_user_id} in Redis: {str(e)}")
 
 class Match(models.Model):
     user1 = models.ForeignKey(
@@ -206,6 +279,12 @@ class Match(models.Model):
     class Meta:
         unique_together = ('user1', 'user2')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user1', 'is_active'], name='match_user1_active_idx'),
+            models.Index(fields=['user2', 'is_active'], name='match_user2_active_idx'),
+            models.Index(fields=['user1'], condition=Q(is_active=True), name='match_user1_only_active_idx'),
+            models.Index(fields=['user2'], condition=Q(is_active=True), name='match_user2_only_active_idx'),
+        ]
 
     def __str__(self):
         return f'Match between {self.user1} and {self.user2}'
@@ -219,9 +298,9 @@ class Match(models.Model):
             
             # Увеличиваем счетчик инициированных диалогов
             sender.increment_conversations()
-            
-            # Обновляем рейтинги
-            sender.update_ratings()
+
+            # Рейтинги пересчитает recalculate_dirty_ratings; откатившаяся транзакция отметки не оставит
+            transaction.on_commit(lambda: dirty_ratings.mark_dirty(sender.pk))
 
 class Referral(models.Model):
     referrer = models.ForeignKey(User, related_name='referrals', on_delete=models.CASCADE)
@@ -0,0 +1,152 @@
+import logging
+from django.conf import settings
+from .models import Like
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Определение взаимного лайка без запроса к базе: для каждого пользователя
+# в Redis хранится множество telegram_id тех, кто его лайкнул.
+# Маркер LOADED_MARKER означает, что множество загружено из таблицы Like
+# полностью; без него отсутствие лайка в множестве ничего не доказывает.
+#
+# Лайк попадает в множество только после коммита транзакции (confirm_like),
+# поэтому откатившийся лайк не даст ложный мэтч. Пока транзакция не
+# завершилась, лайк виден по ключу like_pending:{автор}:{получатель} с
+# коротким TTL: встречные лайки, записываемые одновременно, видят друг друга.
+LOADED_MARKER = '*'
+MISS = -1
+
+# KEYS[1] - ожидающий коммита лайк автора, KEYS[2] - встречный ожидающий лайк,
+# KEYS[3] - кто лайкнул автора лайка
+# ARGV: получатель, маркер загрузки, TTL ожидания
+# Возвращает 1 - взаимный лайк, 0 - нет, -1 - множество автора не загружено
+RECORD_LIKE_SCRIPT = """
+redis.call('SET', KEYS[1], 1, 'EX', ARGV[3])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 1
+end
+if redis.call('SISMEMBER', KEYS[3], ARGV[1]) == 1 then
+    return 1
+end
+if redis.call('SISMEMBER', KEYS[3], ARGV[2]) == 1 then
+    return 0
+end
+return -1
+"""
+
+_record_like = redis_client.register_script(RECORD_LIKE_SCRIPT)
+
+
+def get_likes_in_key(telegram_id):
+    return f"likes_in:{telegram_id}"
+
+
+def get_pending_key(from_id, to_id):
+    return f"like_pending:{from_id}:{to_id}"
+
+
+def record_like(from_id, to_id):
+    """
+    Отметить лайк from_id -> to_id как ожидающий коммита и проверить, лайкал ли
+    to_id автора. При промахе кеша проверяет таблицу Like и загружает множество
+    автора. Вызывается внутри транзакции; после нее - confirm_like или discard_like.
+    """
+    return record_likes([(from_id, to_id)])[(from_id, to_id)]
+
+
+def record_likes(pairs):
+    """
+    record_like для пачки лайков (пары from_id, to_id): проверки идут одним
+    конвейером Redis, незагруженные множества авторов читаются из базы одним
+    запросом. Возвращает {пара: взаимный ли лайк}.
+    """
+    pairs = list(pairs)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for from_id, to_id in pairs:
+            _record_like(
+                keys=[get_pending_key(from_id, to_id), get_pending_key(to_id, from_id), get_likes_in_key(from_id)],
+                args=[to_id, LOADED_MARKER, settings.LIKE_PENDING_TTL],
+                client=pipe
+            )
+        results = pipe.execute()
+    except Exception as e:
+        logger.error(f"Error checking {len(pairs)} mutual likes in Redis: {str(e)}")
+        results = [MISS] * len(pairs)
+
+    mutual = {pair: result == 1 for pair, result in zip(pairs, results)}
+    missed = [pair for pair, result in zip(pairs, results) if result == MISS]
+    if missed:
+        # Лайки, которые получили авторы, - они же ответ на проверку
+        likers = load_many({from_id for from_id, _ in missed})
+        for from_id, to_id in missed:
+            mutual[(from_id, to_id)] = to_id in likers[from_id]
+    return mutual
+
+
+def confirm_like(from_id, to_id):
+    """Транзакция с лайком закоммичена - добавляем его в множество получателя"""
+    confirm_likes([(from_id, to_id)])
+
+
+def confirm_likes(pairs):
+    """confirm_like для нескольких лайков (пары from_id, to_id)"""
+    pipe = redis_client.pipeline(transaction=False)
+    for from_id, to_id in pairs:
+        pipe.sadd(get_likes_in_key(to_id), from_id)
+        pipe.expire(get_likes_in_key(to_id), settings.LIKES_IN_TTL)
+        pipe.delete(get_pending_key(from_id, to_id))
+    pipe.execute()
+
+
+def discard_like(from_id, to_id):
+    """Транзакция с лайком откатилась"""
+    discard_likes([(from_id, to_id)])
+
+
+def discard_likes(pairs):
+    keys = [get_pending_key(from_id, to_id) for from_id, to_id in pairs]
+    if keys:
+        redis_client.delete(*keys)
+
+
+def remove_like(from_id, to_id):
+    """Лайк удален или стал пропуском - убираем автора из множества получателя"""
+    redis_client.srem(get_likes_in_key(to_id), from_id)
+
+
+def load(telegram_id):
+    """
+    Загрузить множество лайкнувших пользователя из базы. Множество только
+    дополняется, поэтому лайки, записанные во время загрузки, не теряются.
+    """
+    return load_many([telegram_id])[telegram_id]
+
+
+def load_many(telegram_ids):
+    """load для нескольких пользователей одним запросом; возвращает {telegram_id: лайкнувшие}"""
+    likers = {telegram_id: set() for telegram_id in telegram_ids}
+    for to_id, from_id in Like.objects.filter(
+        to_user__in=list(likers), is_skip=False
+    ).values_list('to_user', 'from_user'):
+        likers[to_id].add(from_id)
+
+    try:
+        pipe = redis_client.pipeline()
+        for telegram_id, user_likers in likers.items():
+            key = get_likes_in_key(telegram_id)
+            pipe.sadd(key, LOADED_MARKER, *user_likers)
+            pipe.expire(key, settings.LIKES_IN_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error loading inbound likes of {len(likers)} users: {str(e)}")
+    return likers
+
+
+def forget(telegram_id):
+    """
+    Удалить множество лайкнувших пользователя. Из множеств тех, кого он лайкнул,
+    его убирает remove_like: лайки удаляются каскадом вместе с пользователем.
+    """
+    redis_client.delete(get_likes_in_key(telegram_id))
@@ -0,0 +1,108 @@
+import json
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch, prefetch_related_objects
+from common.queue_scripts import PROFILE_CARD_TTL, TELEGRAM_FILE_IDS_KEY, get_card_key
+from .models import User, UserImage
+from .redis_client import get_async_redis_client, redis_client
+
+# Поля пользователя, которые попадают в карточку анкеты
+CARD_FIELDS = {'telegram_id', 'name', 'age', 'city', 'bio'}
+
+
+def _image_data(image):
+    url = image.image.url if image.image else None
+    return {
+        'id': image.id,
+        'image': url,
+        'image_url': url,
+        'card_url': image.card_image.url if image.card_image else None,
+        'thumbnail_url': image.thumbnail.url if image.thumbnail else None,
+        'is_main': image.is_main,
+    }
+
+
+def build_cards(users):
+    """
+    Карточки анкет для ленты. Фото всех пользователей загружаются одним
+    запросом, словари собираются без сериализаторов DRF. Первым идет главное
+    фото, а если его нет - самое раннее: бот показывает images[0].
+    """
+    users = list(users)
+    prefetch_related_objects(users, Prefetch(
+        'images',
+        queryset=UserImage.objects.order_by('-is_main', 'id'),
+        to_attr='card_images'
+    ))
+    return [
+        {
+            'telegram_id': user.telegram_id,
+            'name': user.name,
+            'age': user.age,
+            'city': user.city,
+            'bio': user.bio,
+            'images': [_image_data(image) for image in user.card_images],
+        }
+        for user in users
+    ]
+
+
+def store_cards(cards):
+    """Положить карточки в общий кеш на PROFILE_CARD_TTL"""
+    if not cards:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for card in cards:
+        pipe.set(get_card_key(card['telegram_id']), json.dumps(card), ex=PROFILE_CARD_TTL)
+    pipe.execute()
+
+
+def get_card(user):
+    """Карточка из кеша; при промахе собирается и кладется в кеш"""
+    cached = redis_client.get(get_card_key(user.telegram_id))
+    if cached:
+        return json.loads(cached)
+
+    card, = build_cards([user])
+    store_cards([card])
+    return card
+
+
+def get_card_by_id(telegram_id):
+    """Карточка по telegram_id; None, если пользователя уже нет"""
+    cached = redis_client.get(get_card_key(telegram_id))
+    if cached:
+        return json.loads(cached)
+
+    user = User.objects.filter(telegram_id=telegram_id).first()
+    if user is None:
+        return None
+    card, = build_cards([user])
+    store_cards([card])
+    return card
+
+
+async def astore_cards(cards):
+    """Асинхронная store_cards"""
+    if not cards:
+        return
+    pipe = get_async_redis_client().pipeline(transaction=False)
+    for card in cards:
+        pipe.set(get_card_key(card['telegram_id']), json.dumps(card), ex=PROFILE_CARD_TTL)
+    await pipe.execute()
+
+
+async def aget_card_by_id(telegram_id):
+    """Асинхронная get_card_by_id: попадание в кеш не занимает поток"""
+    cached = await get_async_redis_client().get(get_card_key(telegram_id))
+    if cached:
+        return json.loads(cached)
+    return await sync_to_async(get_card_by_id)(telegram_id)
+
+
+def invalidate_card(telegram_id):
+    redis_client.delete(get_card_key(telegram_id))
+
+
+def forget_file_id(image_id):
+    """Фото изменилось или удалено - бот загрузит его в Telegram заново"""
+    redis_client.hdel(TELEGRAM_FILE_IDS_KEY, image_id)
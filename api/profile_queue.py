@@ -0,0 +1,72 @@
+from common.queue_scripts import (
+    PROFILE_QUEUE_MAX_LENGTH,
+    PROFILE_QUEUE_TTL,
+    POP_PROFILE_SCRIPT,
+    PUSH_PROFILES_SCRIPT,
+    get_queue_key,
+    get_queue_members_key,
+)
+from . import profile_cards
+from .redis_client import get_async_redis_client, redis_client
+
+push_profiles_script = redis_client.register_script(PUSH_PROFILES_SCRIPT)
+pop_profile_script = redis_client.register_script(POP_PROFILE_SCRIPT)
+
+
+def free_slots(telegram_id):
+    """Сколько анкет еще поместится в очередь пользователя"""
+    return max(0, PROFILE_QUEUE_MAX_LENGTH - redis_client.llen(get_queue_key(telegram_id)))
+
+
+def push_profiles(telegram_id, profile_ids):
+    """Добавить telegram_id анкет в очередь без дублей. Возвращает количество добавленных."""
+    if not profile_ids:
+        return 0
+
+    return push_profiles_script(
+        keys=[get_queue_key(telegram_id), get_queue_members_key(telegram_id)],
+        args=[PROFILE_QUEUE_MAX_LENGTH, PROFILE_QUEUE_TTL, *profile_ids]
+    )
+
+
+def pop_profile_card(telegram_id):
+    """Карточка следующей анкеты из очереди пользователя или None, если очередь пуста"""
+    keys = [get_queue_key(telegram_id), get_queue_members_key(telegram_id)]
+    while True:
+        profile_id = pop_profile_script(keys=keys)
+        if profile_id is None:
+            return None
+        card = profile_cards.get_card_by_id(profile_id)
+        # Удаленные анкеты пропускаем
+        if card is not None:
+            return card
+
+
+# Асинхронные версии для async-представлений (api/async_views.py)
+
+async def afree_slots(telegram_id):
+    client = get_async_redis_client()
+    return max(0, PROFILE_QUEUE_MAX_LENGTH - await client.llen(get_queue_key(telegram_id)))
+
+
+async def apush_profiles(telegram_id, profile_ids):
+    if not profile_ids:
+        return 0
+
+    script = get_async_redis_client().register_script(PUSH_PROFILES_SCRIPT)
+    return await script(
+        keys=[get_queue_key(telegram_id), get_queue_members_key(telegram_id)],
+        args=[PROFILE_QUEUE_MAX_LENGTH, PROFILE_QUEUE_TTL, *profile_ids]
+    )
+
+
+async def apop_profile_card(telegram_id):
+    keys = [get_queue_key(telegram_id), get_queue_members_key(telegram_id)]
+    script = get_async_redis_client().register_script(POP_PROFILE_SCRIPT)
+    while True:
+        profile_id = await script(keys=keys)
+        if profile_id is None:
+            return None
+        card = await profile_cards.aget_card_by_id(profile_id)
+        if card is not None:
+            return card
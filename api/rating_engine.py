@@ -0,0 +1,137 @@
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Length
+from .models import User
+from .ratings import photos_count_expression
+from . import candidate_index, db_routing
+
+# Векторный пересчет рейтингов: счетчики пачки пользователей загружаются
+# в массивы NumPy, рейтинги считаются за один проход и записываются bulk_update.
+# Формулы повторяют User.calculate_*_rating с тем же порядком операций.
+
+RATING_FIELDS = ('primary_rating', 'behavioral_rating', 'combined_rating')
+
+# Колонки массива пачки в порядке values_list
+COLUMNS = (
+    'id', 'name_length', 'age', 'gender_length', 'seeking_gender_length', 'city_length',
+    'bio_length', 'photos_count', 'likes_count', 'skips_count', 'matches_count',
+    'conversations_initiated', 'primary_rating', 'behavioral_rating',
+)
+
+
+def load_chunk(after_id, chunk_size):
+    """Счетчики следующих chunk_size пользователей с id больше after_id"""
+    rows = list(
+        User.objects.filter(id__gt=after_id)
+        .order_by('id')
+        .annotate(
+            name_length=Length('name'),
+            gender_length=Length('gender'),
+            seeking_gender_length=Length('seeking_gender'),
+            city_length=Length('city'),
+            bio_length=Length('bio'),
+            photos_count=photos_count_expression(),
+        )
+        .values_list(*COLUMNS)[:chunk_size]
+    )
+    if not rows:
+        return None
+    data = np.array(rows, dtype=np.float64)
+    return {column: data[:, i] for i, column in enumerate(COLUMNS)}
+
+
+def _ratio(numerator, denominator):
+    """numerator / denominator, ноль там, где знаменатель равен нулю"""
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def primary_ratings(chunk):
+    """Первичный рейтинг (см. User.calculate_primary_rating)"""
+    rating = np.zeros(len(chunk['id']))
+
+    # Базовые баллы за заполнение обязательных полей
+    for column in ('name_length', 'age', 'gender_length', 'seeking_gender_length', 'city_length'):
+        rating += np.where(chunk[column] > 0, 20.0, 0.0)
+
+    # Дополнительные баллы за биографию
+    bio_length = chunk['bio_length']
+    rating += np.where(bio_length == 0, 0.0, np.where(bio_length >= 50, 10.0, 5.0))
+
+    # Баллы за фотографии, максимум 30
+    rating += np.minimum(chunk['photos_count'] * 10, 30)
+
+    return np.minimum(rating, 100)
+
+
+def behavioral_ratings(chunk):
+    """Поведенческий рейтинг (см. User.calculate_behavioral_rating)"""
+    likes = chunk['likes_count']
+    matches = chunk['matches_count']
+    total_interactions = likes + chunk['skips_count']
+
+    rating = np.zeros(len(chunk['id']))
+    # Баллы за лайки и пропуски, максимум 40
+    rating += np.where(total_interactions > 0, _ratio(likes, total_interactions) * 40, 0.0)
+    # Баллы за мэтчи, максимум 30
+    rating += np.where(likes > 0, np.minimum(_ratio(matches, likes) * 30, 30), 0.0)
+    # Баллы за инициирование диалогов, максимум 30
+    rating += np.where(
+        matches > 0, np.minimum(_ratio(chunk['conversations_initiated'], matches) * 30, 30), 0.0
+    )
+
+    return np.minimum(rating, 100)
+
+
+def combined_ratings(primary, behavioral):
+    """Комбинированный рейтинг (см. User.calculate_combined_rating)"""
+    return primary * 0.3 + behavioral * 0.7
+
+
+def compute_ratings(chunk, fields=RATING_FIELDS):
+    """
+    Рейтинги пачки. Не пересчитываемые первичный и поведенческий рейтинги
+    берутся из базы, комбинированный считается из итоговых значений.
+    """
+    primary = primary_ratings(chunk) if 'primary_rating' in fields else chunk['primary_rating']
+    behavioral = behavioral_ratings(chunk) if 'behavioral_rating' in fields else chunk['behavioral_rating']
+    return {
+        'primary_rating': primary,
+        'behavioral_rating': behavioral,
+        'combined_rating': combined_ratings(primary, behavioral),
+    }
+
+
+def recalculate(fields=RATING_FIELDS, chunk_size=None, update_index=True):
+    """
+    Пересчет рейтингов всех пользователей пачками. Возвращает количество
+    обновленных пользователей.
+    """
+    fields = [field for field in RATING_FIELDS if field in fields]
+    chunk_size = chunk_size or settings.RATING_ENGINE_CHUNK_SIZE
+
+    updated_count = 0
+    after_id = 0
+    while True:
+        # Скан идет с реплики; индекс ниже читает только что записанное из default
+        with db_routing.replica_reads():
+            chunk = load_chunk(after_id, chunk_size)
+        if chunk is None:
+            break
+
+        ratings = compute_ratings(chunk, fields)
+        ids = chunk['id'].astype(np.int64).tolist()
+        columns = [ratings[field].tolist() for field in fields]
+        users = [
+            User(id=user_id, **dict(zip(fields, values)))
+            for user_id, *values in zip(ids, *columns)
+        ]
+        User.objects.bulk_update(users, fields, batch_size=settings.RATING_ENGINE_WRITE_BATCH_SIZE)
+        updated_count += len(users)
+
+        # bulk_update не вызывает сигналы - обновляем индекс кандидатов сами
+        if update_index and 'combined_rating' in fields:
+            candidate_index.update_scores(User.objects.filter(id__in=ids))
+
+        after_id = ids[-1]
+
+    return updated_count
@@ -0,0 +1,91 @@
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, Least, Length
+from django.db.models.lookups import Exact, GreaterThan, GreaterThanOrEqual
+from .models import UserImage
+
+# SQL-версии формул User.calculate_*_rating для пересчета одним UPDATE.
+# Порядок арифметических операций совпадает с Python-версией,
+# поэтому результаты совпадают с пересчетом по одному пользователю.
+
+
+def _float(expression):
+    return Cast(expression, FloatField())
+
+
+def photos_count_expression():
+    """Количество фотографий пользователя (агрегат по UserImage)"""
+    return Coalesce(
+        Subquery(
+            UserImage.objects.filter(user=OuterRef('pk'))
+            .order_by()
+            .values('user')
+            .annotate(count=Count('id'))
+            .values('count')
+        ),
+        0
+    )
+
+
+def primary_rating_expression(photos_count=None):
+    """Первичный рейтинг (см. User.calculate_primary_rating)"""
+    if photos_count is None:
+        photos_count = photos_count_expression()
+
+    def filled(field, empty):
+        # Базовые баллы за заполнение обязательного поля
+        return Case(When(Exact(F(field), empty), then=Value(0.0)), default=Value(20.0))
+
+    rating = (
+        filled('name', '')
+        + filled('age', 0)
+        + filled('gender', '')
+        + filled('seeking_gender', '')
+        + filled('city', '')
+        # Дополнительные баллы за биографию
+        + Case(
+            When(Exact(F('bio'), ''), then=Value(0.0)),
+            When(GreaterThanOrEqual(Length('bio'), 50), then=Value(10.0)),
+            default=Value(5.0)
+        )
+        # Баллы за фотографии, максимум 30
+        + _float(Least(photos_count * 10, 30))
+    )
+    return Least(rating, Value(100.0))
+
+
+def behavioral_rating_expression(likes=None, skips=None, matches=None, conversations=None):
+    """
+    Поведенческий рейтинг (см. User.calculate_behavioral_rating).
+    Счетчики можно передать выражениями, например с еще не записанным приращением.
+    """
+    likes = likes if likes is not None else F('likes_count')
+    skips = skips if skips is not None else F('skips_count')
+    matches = matches if matches is not None else F('matches_count')
+    conversations = conversations if conversations is not None else F('conversations_initiated')
+
+    # Баллы за лайки и пропуски, максимум 40
+    like_part = Case(
+        When(GreaterThan(likes + skips, 0), then=_float(likes) / _float(likes + skips) * Value(40.0)),
+        default=Value(0.0)
+    )
+    # Баллы за мэтчи, максимум 30
+    match_part = Case(
+        When(GreaterThan(likes, 0), then=Least(_float(matches) / _float(likes) * Value(30.0), Value(30.0))),
+        default=Value(0.0)
+    )
+    # Баллы за инициирование диалогов, максимум 30
+    conversation_part = Case(
+        When(
+            GreaterThan(matches, 0),
+            then=Least(_float(conversations) / _float(matches) * Value(30.0), Value(30.0))
+        ),
+        default=Value(0.0)
+    )
+    return Least(like_part + match_part + conversation_part, Value(100.0))
+
+
+def combined_rating_expression(primary=None, behavioral=None):
+    """Комбинированный рейтинг (см. User.calculate_combined_rating)"""
+    primary = primary if primary is not None else F('primary_rating')
+    behavioral = behavioral if behavioral is not None else F('behavioral_rating')
+    return primary * Value(0.3) + behavioral * Value(0.7)
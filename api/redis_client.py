@@ -0,0 +1,24 @@
+import asyncio
+import os
+import weakref
+import redis
+import redis.asyncio
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+
+# Общий клиент Redis для Django-процессов (соединения берутся из пула лениво)
+redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+# Асинхронные клиенты для async-представлений. Соединения redis.asyncio
+# привязаны к циклу событий, поэтому клиент свой у каждого цикла
+# (под uvicorn цикл один на процесс).
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = redis.asyncio.from_url(REDIS_URL, decode_responses=True)
+        _async_clients[loop] = client
+    return client
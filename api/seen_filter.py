@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import math
+from itertools import groupby
+from django.conf import settings
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Фильтр Блума "уже просмотренных" анкет для каждого зрителя.
+# Хранится в обычной битовой строке Redis (SETBIT/GETBIT), без модуля RedisBloom.
+# Ложные срабатывания возможны (анкета будет пропущена), ложных пропусков нет.
+#
+# Фильтр заменяет запрос к таблице лайков, только если зритель есть в множестве
+# BUILT_KEY: его отмечает rebuild(), загрузивший все лайки зрителя. Ключ фильтра,
+# созданный add() для нового лайка, сам по себе не означает, что фильтр полный.
+BUILT_KEY = 'seen_filters_built'
+
+
+def filter_size():
+    """Размер фильтра в битах и количество хеш-функций для заданной емкости и точности"""
+    capacity = settings.SEEN_FILTER_CAPACITY
+    error_rate = settings.SEEN_FILTER_ERROR_RATE
+    size = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+    hash_count = max(1, round(size / capacity * math.log(2)))
+    return size, hash_count
+
+
+def get_filter_key(viewer_id):
+    return f"seen:{viewer_id}"
+
+
+def _positions(user_id, size, hash_count):
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % size for i in range(hash_count)]
+
+
+def add(viewer_id, *user_ids):
+    """Отметить анкеты как просмотренные зрителем"""
+    size, hash_count = filter_size()
+    key = get_filter_key(viewer_id)
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id in user_ids:
+        for position in _positions(user_id, size, hash_count):
+            pipe.setbit(key, position, 1)
+    pipe.execute()
+
+
+def is_built(viewer_id):
+    """Содержит ли фильтр зрителя все его лайки из базы"""
+    return bool(redis_client.sismember(BUILT_KEY, viewer_id))
+
+
+def seen_among(viewer_id, user_ids):
+    """Множество анкет из user_ids, которые зритель, вероятно, уже видел"""
+    if not user_ids:
+        return set()
+
+    size, hash_count = filter_size()
+    key = get_filter_key(viewer_id)
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id in user_ids:
+        for position in _positions(user_id, size, hash_count):
+            pipe.getbit(key, position)
+    bits = pipe.execute()
+
+    seen = set()
+    for index, user_id in enumerate(user_ids):
+        if all(bits[index * hash_count:(index + 1) * hash_count]):
+            seen.add(user_id)
+    return seen
+
+
+def rebuild(viewer_ids=None):
+    """Перестроить фильтры по таблице лайков. Возвращает количество зрителей."""
+    from .models import Like
+
+    likes = Like.objects.order_by('from_user__id')
+    if viewer_ids is not None:
+        viewer_ids = set(viewer_ids)
+        likes = likes.filter(from_user__id__in=viewer_ids)
+    rows = likes.values_list('from_user__id', 'to_user__id').iterator(chunk_size=10000)
+
+    size, hash_count = filter_size()
+    rebuilt_count = 0
+    for viewer_id, group in groupby(rows, key=lambda row: row[0]):
+        # Собираем фильтр во временном ключе и атомарно подменяем старый
+        key = get_filter_key(viewer_id)
+        tmp_key = f"{key}:rebuild"
+        pipe = redis_client.pipeline()
+        pipe.delete(tmp_key)
+        for _, user_id in group:
+            for position in _positions(user_id, size, hash_count):
+                pipe.setbit(tmp_key, position, 1)
+        pipe.rename(tmp_key, key)
+        pipe.sadd(BUILT_KEY, viewer_id)
+        pipe.execute()
+        rebuilt_count += 1
+        if viewer_ids is not None:
+            viewer_ids.remove(viewer_id)
+
+    if viewer_ids:
+        # У зрителей без лайков фильтр пустой, но тоже полный
+        pipe = redis_client.pipeline()
+        pipe.delete(*[get_filter_key(viewer_id) for viewer_id in viewer_ids])
+        pipe.sadd(BUILT_KEY, *viewer_ids)
+        pipe.execute()
+        rebuilt_count += len(viewer_ids)
+
+    logger.info(f"Rebuilt seen filters for {rebuilt_count} users")
+    return rebuilt_count
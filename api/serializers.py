@@ -12,10 +12,12 @@ logger = logging.getLogger(__name__)
 
 class UserImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    card_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = UserImage
-        fields = ['id', 'image', 'image_url', 'created_at', 'is_main']
+        fields = ['id', 'image', 'image_url', 'card_url', 'thumbnail_url', 'created_at', 'is_main']
         
     def get_image_url(self, obj):
         if isinstance(obj, dict):
@@ -24,6 +26,21 @@ class UserImageSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_card_url(self, obj):
+        # Пока копия не готова - None, клиенты берут оригинал
+        if isinstance(obj, dict):
+            return None
+        if obj.card_image:
+            return obj.card_image.url
+        return None
+
+    def get_thumbnail_url(self, obj):
+        if isinstance(obj, dict):
+            return None
+        if obj.thumbnail:
+            return obj.thumbnail.url
+        return None
+
     def validate_image(self, value):
         logger.info(f"Validating image: {value}")
         logger.info(f"Image content type: {value.content_type}")
@@ -99,6 +116,24 @@ class LikeSerializer(serializers.ModelSerializer):
         fields = ['id', 'from_user', 'to_user', 'is_skip', 'created_at']
         read_only_fields = ['created_at']
 
+class SwipeEventSerializer(serializers.Serializer):
+    """Свайп для отложенной записи: пользователи проверяются при записи в базу"""
+    from_user = serializers.IntegerField()
+    to_user = serializers.IntegerField()
+    is_skip = serializers.BooleanField(default=False)
+
+class UserImageKeySerializer(serializers.Serializer):
+    """Фото, которое бот сам загрузил в хранилище: ключ объекта в бакете"""
+    telegram_id = serializers.IntegerField()
+    key = serializers.CharField(max_length=255)
+
+    def validate(self, data):
+        # Бот кладет фото в user_images/{telegram_id}/, чужие ключи не принимаем
+        prefix = f"user_images/{data['telegram_id']}/"
+        if not data['key'].startswith(prefix) or '..' in data['key']:
+            raise serializers.ValidationError({'key': f"Ключ должен начинаться с {prefix}"})
+        return data
+
 class MatchSerializer(serializers.ModelSerializer):
     class Meta:
         model = Match
@@ -0,0 +1,167 @@
+import logging
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Like, User, UserImage
+from . import candidate_index, db_routing, dirty_ratings, image_dedup, mutual_likes, profile_cards
+from .tasks import generate_image_renditions
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=User)
+def update_candidate_index(sender, instance, update_fields=None, **kwargs):
+    """Поддерживаем индекс кандидатов в актуальном состоянии при сохранении пользователя"""
+    if update_fields is not None and not candidate_index.INDEXED_FIELDS & set(update_fields):
+        return
+    try:
+        candidate_index.index_user(instance)
+    except Exception as e:
+        logger.error(f"Error indexing user {instance.telegram_id}: {str(e)}")
+
+
+@receiver(post_delete, sender=User)
+def remove_from_candidate_index(sender, instance, **kwargs):
+    try:
+        candidate_index.remove_user(instance.pk)
+    except Exception as e:
+        logger.error(f"Error removing user {instance.telegram_id} from index: {str(e)}")
+
+
+@receiver(post_save, sender=User)
+def invalidate_profile_card(sender, instance, update_fields=None, **kwargs):
+    """Сбрасываем карточку анкеты, если изменились показываемые в ней поля"""
+    if update_fields is not None and not profile_cards.CARD_FIELDS & set(update_fields):
+        return
+    try:
+        profile_cards.invalidate_card(instance.telegram_id)
+    except Exception as e:
+        logger.error(f"Error invalidating profile card of user {instance.telegram_id}: {str(e)}")
+
+
+@receiver(post_delete, sender=User)
+def remove_profile_card(sender, instance, **kwargs):
+    try:
+        profile_cards.invalidate_card(instance.telegram_id)
+    except Exception as e:
+        logger.error(f"Error removing profile card of user {instance.telegram_id}: {str(e)}")
+
+
+@receiver(post_delete, sender=User)
+def remove_inbound_likes(sender, instance, **kwargs):
+    def forget():
+        try:
+            mutual_likes.forget(instance.telegram_id)
+        except Exception as e:
+            logger.error(f"Error removing inbound likes of user {instance.telegram_id}: {str(e)}")
+
+    transaction.on_commit(forget)
+
+
+@receiver(post_save, sender=Like)
+def update_changed_like(sender, instance, created, update_fields=None, **kwargs):
+    """Лайк, ставший пропуском (или наоборот), меняет множество лайкнувших получателя"""
+    if created or (update_fields is not None and 'is_skip' not in update_fields):
+        return
+
+    def update():
+        try:
+            if instance.is_skip:
+                mutual_likes.remove_like(instance.from_user_id, instance.to_user_id)
+            else:
+                mutual_likes.confirm_like(instance.from_user_id, instance.to_user_id)
+        except Exception as e:
+            logger.error(f"Error updating like {instance.from_user_id} -> {instance.to_user_id} in Redis: {str(e)}")
+
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Like)
+def remove_deleted_like(sender, instance, **kwargs):
+    """Удаленный лайк (в том числе каскадом вместе с пользователем) больше не дает мэтч"""
+    if instance.is_skip:
+        return
+
+    def remove():
+        try:
+            mutual_likes.remove_like(instance.from_user_id, instance.to_user_id)
+        except Exception as e:
+            logger.error(f"Error removing like {instance.from_user_id} -> {instance.to_user_id} from Redis: {str(e)}")
+
+    transaction.on_commit(remove)
+
+
+@receiver(post_save, sender=UserImage)
+@receiver(post_delete, sender=UserImage)
+def invalidate_profile_card_images(sender, instance, **kwargs):
+    try:
+        profile_cards.invalidate_card(instance.user.telegram_id)
+    except Exception as e:
+        logger.error(f"Error invalidating profile card for image {instance.pk}: {str(e)}")
+
+
+@receiver(post_save, sender=UserImage)
+@receiver(post_delete, sender=UserImage)
+def forget_telegram_file_id(sender, instance, created=False, **kwargs):
+    """Сбрасываем file_id Telegram при изменении или удалении фото"""
+    if created:
+        return
+    try:
+        profile_cards.forget_file_id(instance.pk)
+    except Exception as e:
+        logger.error(f"Error removing Telegram file_id of image {instance.pk}: {str(e)}")
+
+
+@receiver(post_save, sender=UserImage)
+@receiver(post_delete, sender=UserImage)
+def mark_image_owner_dirty(sender, instance, created=True, **kwargs):
+    """Количество фотографий влияет на первичный рейтинг (post_delete не передает created)"""
+    if created:
+        dirty_ratings.mark_dirty(instance.user_id)
+
+
+@receiver(post_save, sender=UserImage)
+def schedule_image_renditions(sender, instance, created, **kwargs):
+    """Уменьшенные копии создаются в Celery после сохранения оригинала"""
+    # Копия уже загруженного фото получает готовые копии вместе с оригиналом
+    if not created or instance.card_image:
+        return
+
+    def schedule():
+        try:
+            generate_image_renditions.delay(instance.pk)
+        except Exception as e:
+            logger.error(f"Error scheduling renditions for image {instance.pk}: {str(e)}")
+
+    transaction.on_commit(schedule)
+
+
+@receiver(post_delete, sender=UserImage)
+def release_image_files(sender, instance, **kwargs):
+    """Объекты в хранилище удаляются, когда на них не осталось ссылок"""
+    def release():
+        try:
+            image_dedup.release_files(instance)
+        except Exception as e:
+            logger.error(f"Error releasing files of image {instance.pk}: {str(e)}")
+
+    transaction.on_commit(release)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=UserImage)
+@receiver(post_delete, sender=UserImage)
+def pin_primary_reads(sender, instance, **kwargs):
+    """После свайпа или изменения профиля пользователь читает из default, а не с реплики"""
+    if not db_routing.replicas_enabled():
+        return
+    try:
+        if sender is Like:
+            db_routing.pin_primary(instance.from_user_id)
+        elif sender is UserImage:
+            db_routing.pin_primary(instance.user.telegram_id)
+        else:
+            db_routing.pin_primary(instance.telegram_id)
+    except Exception as e:
+        logger.error(f"Error pinning primary reads for {sender.__name__} {instance.pk}: {str(e)}")
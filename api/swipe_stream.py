@@ -0,0 +1,235 @@
+import logging
+from collections import Counter, defaultdict
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from common.match_events import MATCH_EVENTS_KEY, MATCH_EVENTS_MAX_LENGTH
+from . import dirty_ratings, mutual_likes, seen_filter, swipes
+from .models import User, Like, Match
+from .redis_client import get_async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Отложенная запись свайпов: эндпоинты добавляют событие в Redis Stream
+# и сразу отвечают, а потребители (python manage.py consume_swipes) пачками
+# пишут лайки в базу, применяют счетчики и создают мэтчи. Ответ свайпа не
+# знает о мэтче - о нем пользователей уведомляет бот (common/match_events.py).
+SWIPE_STREAM_KEY = 'swipe_events'
+SWIPE_CONSUMER_GROUP = 'swipe_ingest'
+
+
+def is_enabled():
+    return settings.SWIPE_INGESTION_MODE == 'stream'
+
+
+def publish(from_user, to_user, is_skip):
+    """Добавить свайп в поток (id пользователей - telegram_id)"""
+    return redis_client.xadd(SWIPE_STREAM_KEY, {
+        'from_user': from_user,
+        'to_user': to_user,
+        'is_skip': int(is_skip),
+    })
+
+
+async def apublish(from_user, to_user, is_skip):
+    """Асинхронная publish"""
+    return await get_async_redis_client().xadd(SWIPE_STREAM_KEY, {
+        'from_user': from_user,
+        'to_user': to_user,
+        'is_skip': int(is_skip),
+    })
+
+
+def ensure_group():
+    try:
+        redis_client.xgroup_create(SWIPE_STREAM_KEY, SWIPE_CONSUMER_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def read_batch(consumer, count, block_ms):
+    """
+    Следующая пачка событий для потребителя. Сначала забираются события,
+    зависшие у упавших потребителей, затем новые.
+    """
+    _, claimed, *_ = redis_client.xautoclaim(
+        SWIPE_STREAM_KEY, SWIPE_CONSUMER_GROUP, consumer,
+        min_idle_time=settings.SWIPE_STREAM_CLAIM_IDLE_MS, start_id='0-0', count=count
+    )
+    if claimed:
+        return claimed
+
+    response = redis_client.xreadgroup(
+        SWIPE_CONSUMER_GROUP, consumer, {SWIPE_STREAM_KEY: '>'}, count=count, block=block_ms
+    )
+    return response[0][1] if response else []
+
+
+def ack(entry_ids):
+    """Подтвердить обработку и удалить события из потока"""
+    if entry_ids:
+        pipe = redis_client.pipeline()
+        pipe.xack(SWIPE_STREAM_KEY, SWIPE_CONSUMER_GROUP, *entry_ids)
+        pipe.xdel(SWIPE_STREAM_KEY, *entry_ids)
+        pipe.execute()
+
+
+def ingest(entries):
+    """
+    Записать пачку событий в базу. Возвращает количество новых свайпов и мэтчей.
+    Повторные свайпы той же пары и события несуществующих пользователей пропускаются.
+    """
+    events = {}
+    for _, fields in entries:
+        # Redis < 7 возвращает из XAUTOCLAIM удаленные события без полей -
+        # их только подтверждаем
+        if not fields:
+            continue
+        pair = (int(fields['from_user']), int(fields['to_user']))
+        events.setdefault(pair, fields['is_skip'] == '1')
+
+    users = User.objects.in_bulk({user_id for pair in events for user_id in pair}, field_name='telegram_id')
+    events = {
+        (from_id, to_id): is_skip for (from_id, to_id), is_skip in events.items()
+        if from_id in users and to_id in users and from_id != to_id
+    }
+    if not events:
+        return 0, 0
+
+    recorded = []
+    try:
+        with transaction.atomic():
+            # Приращения считаются только по действительно вставленным строкам:
+            # пару, которую уже записал другой потребитель, INSERT пропустит
+            new_swipes = _insert_likes(events)
+
+            # Взаимный лайк проверяется атомарно в Redis, как в Like.save:
+            # встречные лайки из других пачек и потребителей видят друг друга
+            # еще до коммита, чего не дает чтение таблицы под READ COMMITTED
+            recorded = [pair for pair, is_skip in new_swipes.items() if not is_skip]
+            matched = {
+                tuple(sorted((users[from_id].pk, users[to_id].pk)))
+                for (from_id, to_id), is_mutual in mutual_likes.record_likes(recorded).items()
+                if is_mutual
+            }
+            matches = _create_matches(matched)
+
+            deltas = defaultdict(Counter)
+            for (from_id, to_id), is_skip in new_swipes.items():
+                deltas[users[to_id].pk]['skips_count' if is_skip else 'likes_count'] += 1
+            for pair in matches:
+                for user_id in pair:
+                    deltas[user_id]['matches_count'] += 1
+            swipes.apply_counter_deltas(deltas)
+
+            transaction.on_commit(lambda: _after_ingest(new_swipes, users, deltas, matches))
+    except Exception:
+        try:
+            mutual_likes.discard_likes(recorded)
+        except Exception as e:
+            logger.error(f"Error discarding pending likes: {str(e)}")
+        raise
+
+    return len(new_swipes), len(matches)
+
+
+def _insert_likes(events):
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING для пачки свайпов.
+    Возвращает только вставленные свайпы: {(from_id, to_id): is_skip}.
+    """
+    meta = Like._meta
+    quote = connection.ops.quote_name
+    from_column = meta.get_field('from_user').column
+    to_column = meta.get_field('to_user').column
+    skip_column = meta.get_field('is_skip').column
+    created_field = meta.get_field('created_at')
+    created_at = created_field.get_db_prep_value(timezone.now(), connection)
+
+    # Одинаковый порядок вставки у всех потребителей - без взаимных блокировок
+    pairs = sorted(events)
+    params = []
+    for from_id, to_id in pairs:
+        params += [from_id, to_id, events[(from_id, to_id)], created_at]
+    columns = ', '.join(quote(column) for column in (from_column, to_column, skip_column, created_field.column))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(pairs))} "
+            f"ON CONFLICT ({quote(from_column)}, {quote(to_column)}) DO NOTHING "
+            f"RETURNING {quote(from_column)}, {quote(to_column)}, {quote(skip_column)}",
+            params
+        )
+        return {(from_id, to_id): bool(is_skip) for from_id, to_id, is_skip in cursor.fetchall()}
+
+
+def _create_matches(pairs):
+    """
+    Создать мэтчи для пар (меньший id, больший id), у которых мэтча еще нет.
+    Возвращает созданные пары.
+    """
+    if not pairs:
+        return []
+    pairs = sorted(pairs)
+
+    if connection.vendor == 'postgresql':
+        # Блокировка пары до конца транзакции: второй потребитель, нашедший тот же
+        # мэтч, дождется коммита первого и увидит его мэтч. Все пары - одним
+        # запросом, в порядке сортировки (volatile-функции считаются после ORDER BY)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(hashtextextended(key, 0)) '
+                'FROM unnest(%s::text[]) WITH ORDINALITY AS locks(key, position) ORDER BY position',
+                [[f"match:{user1}:{user2}" for user1, user2 in pairs]]
+            )
+
+    user_ids = {user_id for pair in pairs for user_id in pair}
+    existing = {
+        tuple(sorted(pair)) for pair in
+        Match.objects.filter(user1__in=user_ids, user2__in=user_ids).values_list('user1', 'user2')
+    }
+    created = [pair for pair in pairs if pair not in existing]
+    Match.objects.bulk_create([Match(user1_id=user1, user2_id=user2) for user1, user2 in created])
+    return created
+
+
+def _after_ingest(new_swipes, users, deltas, matches):
+    # Рейтинги пересчитает задача recalculate_dirty_ratings
+    dirty_ratings.mark_dirty(*deltas)
+
+    try:
+        mutual_likes.confirm_likes(pair for pair, is_skip in new_swipes.items() if not is_skip)
+    except Exception as e:
+        logger.error(f"Error updating inbound likes: {str(e)}")
+
+    if settings.SEEN_FILTER_ENABLED:
+        seen = defaultdict(list)
+        for from_id, to_id in new_swipes:
+            seen[users[from_id].pk].append(users[to_id].pk)
+        for viewer_id, user_ids in seen.items():
+            try:
+                seen_filter.add(viewer_id, *user_ids)
+            except Exception as e:
+                logger.error(f"Error updating seen filter for user {viewer_id}: {str(e)}")
+
+    if matches:
+        try:
+            publish_matches(matches, users)
+        except Exception as e:
+            logger.error(f"Error publishing {len(matches)} match events: {str(e)}")
+
+
+def publish_matches(matches, users):
+    """Уведомления о мэтчах для бота (пары id пользователей)"""
+    telegram_ids = {user.pk: user.telegram_id for user in users.values()}
+    pipe = redis_client.pipeline(transaction=False)
+    for user1, user2 in matches:
+        pipe.xadd(
+            MATCH_EVENTS_KEY,
+            {'user1': telegram_ids[user1], 'user2': telegram_ids[user2]},
+            maxlen=MATCH_EVENTS_MAX_LENGTH, approximate=True
+        )
+    pipe.execute()
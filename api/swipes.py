@@ -0,0 +1,78 @@
+import logging
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from . import candidate_index
+from .models import User
+from .ratings import (
+    behavioral_rating_expression,
+    combined_rating_expression,
+    primary_rating_expression,
+)
+
+logger = logging.getLogger(__name__)
+
+# Учет свайпа: счетчики и рейтинги обоих пользователей меняются одним UPDATE
+# без refresh_from_db. apply_swipe вызывается из Like.save внутри транзакции.
+
+
+def apply_swipe(like, is_match):
+    """Обновить счетчики после нового свайпа (и рейтинги при мэтче)"""
+    if like.is_skip:
+        User.objects.filter(pk=like.to_user.pk).update(skips_count=F('skips_count') + 1)
+        return
+
+    if not is_match:
+        User.objects.filter(pk=like.to_user.pk).update(likes_count=F('likes_count') + 1)
+        return
+
+    # Мэтч: лайк получателю и мэтч обоим, рейтинги считаются по новым счетчикам.
+    # В SET все выражения видят старые значения строки, поэтому приращения
+    # передаются в формулы явно.
+    likes = Case(
+        When(pk=like.to_user.pk, then=F('likes_count') + 1),
+        default=F('likes_count'),
+        output_field=PositiveIntegerField()
+    )
+    matches = F('matches_count') + 1
+    primary = primary_rating_expression()
+    behavioral = behavioral_rating_expression(likes=likes, matches=matches)
+    users = User.objects.filter(pk__in=[like.from_user.pk, like.to_user.pk])
+    users.update(
+        likes_count=likes,
+        matches_count=matches,
+        primary_rating=primary,
+        behavioral_rating=behavioral,
+        combined_rating=combined_rating_expression(primary, behavioral)
+    )
+
+    # UPDATE не вызывает сигналы - переносим новые рейтинги в индекс кандидатов
+    transaction.on_commit(lambda: _update_index_scores(users))
+
+
+def apply_counter_deltas(deltas):
+    """
+    Применить накопленные приращения счетчиков одним UPDATE.
+    deltas: {id пользователя: {поле счетчика: приращение}}
+    """
+    if not deltas:
+        return 0
+
+    fields = {field for counters in deltas.values() for field in counters}
+    return User.objects.filter(pk__in=list(deltas)).update(**{
+        field: F(field) + Case(
+            *[
+                When(pk=user_id, then=Value(counters[field]))
+                for user_id, counters in deltas.items() if counters.get(field)
+            ],
+            default=Value(0),
+            output_field=PositiveIntegerField()
+        )
+        for field in fields
+    })
+
+
+def _update_index_scores(users):
+    try:
+        candidate_index.update_scores(users)
+    except Exception as e:
+        logger.error(f"Error updating candidate index scores: {str(e)}")
@@ -1,67 +1,153 @@
 from celery import shared_task
-from .models import User
-from django.db.models import F
+from django.conf import settings
+from .models import User, UserImage
+from django.db.models import Max, Min
 from celery.utils.log import get_task_logger
+from . import candidate_index, dirty_ratings, image_dedup, image_renditions, rating_engine
+from .ratings import (
+    behavioral_rating_expression,
+    combined_rating_expression,
+    primary_rating_expression,
+)
 
 logger = get_task_logger(__name__)
 
+
+def all_ratings_fields():
+    """Выражения для пересчета всех трех рейтингов одним UPDATE"""
+    primary = primary_rating_expression()
+    behavioral = behavioral_rating_expression()
+    # Комбинированный считается из новых значений, а не из записанных в строке
+    return {
+        'primary_rating': primary,
+        'behavioral_rating': behavioral,
+        'combined_rating': combined_rating_expression(primary, behavioral),
+    }
+
+def update_users(users, **fields):
+    """UPDATE рейтингов для набора пользователей с обновлением индекса кандидатов"""
+    updated_count = users.update(**fields)
+
+    # Массовый UPDATE не вызывает сигналы - обновляем индекс кандидатов сами
+    if 'combined_rating' in fields:
+        try:
+            candidate_index.update_scores(users)
+        except Exception as e:
+            logger.error(f"Error updating candidate index scores: {str(e)}")
+
+    return updated_count
+
+def update_in_batches(**fields):
+    """
+    Пересчет рейтингов набором UPDATE по диапазонам id вместо цикла по
+    пользователям. Возвращает количество обновленных строк.
+    """
+    bounds = User.objects.aggregate(min_id=Min('id'), max_id=Max('id'))
+    if bounds['min_id'] is None:
+        return 0
+
+    batch_size = settings.RATING_UPDATE_BATCH_SIZE
+    updated_count = 0
+    for start in range(bounds['min_id'], bounds['max_id'] + 1, batch_size):
+        batch = User.objects.filter(id__gte=start, id__lt=start + batch_size)
+        updated_count += update_users(batch, **fields)
+
+    return updated_count
+
+def use_rating_engine():
+    return settings.RATING_ENGINE == 'numpy'
+
 @shared_task
 def recalculate_primary_ratings():
     """Пересчет первичных рейтингов для всех пользователей"""
-    users = User.objects.all()
-    updated_count = 0
-    
-    for user in users:
-        try:
-            user.calculate_primary_rating()
-            updated_count += 1
-        except Exception as e:
-            logger.error(f"Error calculating primary rating for user {user.telegram_id}: {str(e)}")
-    
+    if use_rating_engine():
+        updated_count = rating_engine.recalculate(fields=['primary_rating'])
+    else:
+        updated_count = update_in_batches(primary_rating=primary_rating_expression())
     logger.info(f"Updated primary ratings for {updated_count} users")
     return updated_count
 
 @shared_task
 def recalculate_behavioral_ratings():
     """Пересчет поведенческих рейтингов для всех пользователей"""
-    users = User.objects.all()
-    updated_count = 0
-    
-    for user in users:
-        try:
-            user.calculate_behavioral_rating()
-            updated_count += 1
-        except Exception as e:
-            logger.error(f"Error calculating behavioral rating for user {user.telegram_id}: {str(e)}")
-    
+    if use_rating_engine():
+        updated_count = rating_engine.recalculate(fields=['behavioral_rating'])
+    else:
+        updated_count = update_in_batches(behavioral_rating=behavioral_rating_expression())
     logger.info(f"Updated behavioral ratings for {updated_count} users")
     return updated_count
 
 @shared_task
 def recalculate_combined_ratings():
     """Пересчет комбинированных рейтингов для всех пользователей"""
-    users = User.objects.all()
-    updated_count = 0
-    
-    for user in users:
-        try:
-            user.calculate_combined_rating()
-            updated_count += 1
-        except Exception as e:
-            logger.error(f"Error calculating combined rating for user {user.telegram_id}: {str(e)}")
-    
+    if use_rating_engine():
+        updated_count = rating_engine.recalculate(fields=['combined_rating'])
+    else:
+        updated_count = update_in_batches(combined_rating=combined_rating_expression())
     logger.info(f"Updated combined ratings for {updated_count} users")
     return updated_count
 
 @shared_task
 def recalculate_all_ratings():
     """Пересчет всех типов рейтингов"""
-    primary_count = recalculate_primary_ratings()
-    behavioral_count = recalculate_behavioral_ratings()
-    combined_count = recalculate_combined_ratings()
-    
+    if use_rating_engine():
+        updated_count = rating_engine.recalculate()
+    else:
+        # Все три рейтинга одним UPDATE на пачку
+        updated_count = update_in_batches(**all_ratings_fields())
+    logger.info(f"Updated all ratings for {updated_count} users")
+
     return {
-        'primary_ratings': primary_count,
-        'behavioral_ratings': behavioral_count,
-        'combined_ratings': combined_count
-    } 
\ No newline at end of file
+        'primary_ratings': updated_count,
+        'behavioral_ratings': updated_count,
+        'combined_ratings': updated_count
+    }
+
+@shared_task
+def recalculate_dirty_ratings():
+    """
+    Пересчет рейтингов только тех пользователей, у которых что-то изменилось
+    с прошлого запуска (см. api/dirty_ratings.py)
+    """
+    batch_size = settings.DIRTY_RATINGS_BATCH_SIZE
+    # Отмеченные во время пересчета пользователи дождутся следующего запуска
+    batches = -(-dirty_ratings.pending_count() // batch_size)
+
+    updated_count = 0
+    for _ in range(batches):
+        user_ids = dirty_ratings.pop_batch(batch_size)
+        if not user_ids:
+            break
+        try:
+            updated_count += update_users(User.objects.filter(id__in=user_ids), **all_ratings_fields())
+        except Exception:
+            # Возвращаем пачку, чтобы не потерять пользователей
+            dirty_ratings.mark_dirty(*user_ids)
+            raise
+
+    logger.info(f"Updated ratings for {updated_count} changed users")
+    return updated_count
+
+@shared_task
+def generate_image_renditions(image_id):
+    """Уменьшенные копии загруженной фотографии для ленты и списков"""
+    image = UserImage.objects.filter(pk=image_id).first()
+    if image is None:
+        return False
+
+    try:
+        source = image_renditions.read_original(image)
+        if not image.content_hash:
+            # Фото, зарегистрированное ботом по ключу: оригинал читается здесь,
+            # API его не скачивает
+            image = image_dedup.deduplicate(image, source)
+            if image is None:
+                logger.info(f"Image {image_id} is a duplicate of a stored photo")
+                return True
+        image_renditions.generate(image, source)
+    except Exception as e:
+        logger.error(f"Error generating renditions for image {image_id}: {str(e)}")
+        return False
+
+    logger.info(f"Generated renditions for image {image_id}")
+    return True
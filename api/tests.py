@@ -1,3 +1,1066 @@
-from django.test import TestCase
+import io
+import random
+import threading
+from unittest import mock, skipUnless
+import fakeredis
+from PIL import Image
+from common.match_events import MATCH_EVENTS_KEY
+from common.queue_scripts import PROFILE_CARD_TTL, TELEGRAM_FILE_IDS_KEY, get_card_key
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from . import (
+    candidate_index, db_routing, dirty_ratings, feed, image_dedup, mutual_likes, profile_cards, profile_queue,
+    rating_engine, seen_filter, swipe_stream, swipes, tasks
+)
+from .management.commands import benchmark_serving
+from .models import Like, Match, User, UserImage
+from .ratings import behavioral_rating_expression, combined_rating_expression, primary_rating_expression
+from .redis_client import redis_client
+from .urls import SwipeView
+from .views import UserImageViewSet, UserViewSet
 
-# Create your tests here.
+
+class FakeRedisMixin:
+    """Общий redis_client (и зарегистрированные на нем скрипты) работает с fakeredis"""
+
+    def setUp(self):
+        super().setUp()
+        fake = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        patcher = mock.patch.object(redis_client, 'connection_pool', fake.connection_pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.redis = fake
+
+
+def create_user(telegram_id, gender='F', seeking_gender='M', **kwargs):
+    kwargs.setdefault('name', f'user{telegram_id}')
+    kwargs.setdefault('age', 25)
+    kwargs.setdefault('city', 'Moscow')
+    return User.objects.create(
+        telegram_id=telegram_id, gender=gender, seeking_gender=seeking_gender, **kwargs
+    )
+
+
+def create_image(user, is_main=False, name=None):
+    # card_image заполнен, чтобы сигнал не ставил задачу на уменьшенные копии
+    name = name or f'user_images/{user.telegram_id}/{UserImage.objects.count()}.jpg'
+    return UserImage.objects.create(user=user, image=name, card_image=name, is_main=is_main)
+
+
+class BuildCardsTests(FakeRedisMixin, TestCase):
+    def create_feed(self, size, first_id):
+        users = []
+        for telegram_id in range(first_id, first_id + size):
+            user = create_user(telegram_id)
+            create_image(user)
+            create_image(user, is_main=True)
+            users.append(user)
+        return users
+
+    def test_query_count_does_not_depend_on_feed_size(self):
+        for size, first_id in ((2, 100), (20, 200)):
+            users = self.create_feed(size, first_id)
+            with self.assertNumQueries(1):
+                cards = profile_cards.build_cards(users)
+            self.assertEqual(len(cards), size)
+            self.assertTrue(all(card['images'][0]['is_main'] for card in cards))
+
+    def test_first_image_without_main(self):
+        user = create_user(1)
+        first = create_image(user)
+        create_image(user)
+        card, = profile_cards.build_cards([user])
+        self.assertEqual(card['images'][0]['id'], first.id)
+        self.assertEqual(len(card['images']), 2)
+
+    def test_user_without_images(self):
+        card, = profile_cards.build_cards([create_user(1)])
+        self.assertEqual(card['images'], [])
+
+
+class ProfileCardCacheTests(FakeRedisMixin, TestCase):
+    """Карточка в кеше сбрасывается при изменении показываемых полей и фото"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(1)
+        self.image = create_image(self.user, is_main=True)
+        self.key = get_card_key(self.user.telegram_id)
+        profile_cards.get_card(self.user)
+
+    def test_cached_with_ttl(self):
+        self.assertTrue(self.redis.exists(self.key))
+        self.assertTrue(0 < self.redis.ttl(self.key) <= PROFILE_CARD_TTL)
+        with self.assertNumQueries(0):
+            card = profile_cards.get_card_by_id(self.user.telegram_id)
+        self.assertEqual(card['images'][0]['id'], self.image.id)
+
+    def test_card_field_changed(self):
+        self.user.name = 'renamed'
+        self.user.save(update_fields=['name'])
+        self.assertFalse(self.redis.exists(self.key))
+        self.assertEqual(profile_cards.get_card_by_id(self.user.telegram_id)['name'], 'renamed')
+
+    def test_other_field_changed(self):
+        self.user.primary_rating = 10
+        self.user.save(update_fields=['primary_rating'])
+        self.assertTrue(self.redis.exists(self.key))
+
+    def test_image_added_and_deleted(self):
+        image = create_image(self.user)
+        self.assertFalse(self.redis.exists(self.key))
+        self.assertEqual(len(profile_cards.get_card_by_id(self.user.telegram_id)['images']), 2)
+
+        image_id = image.pk
+        self.redis.hset(TELEGRAM_FILE_IDS_KEY, image_id, 'file-id')
+        image.delete()
+        self.assertFalse(self.redis.exists(self.key))
+        self.assertFalse(self.redis.hexists(TELEGRAM_FILE_IDS_KEY, image_id))
+        self.assertEqual(len(profile_cards.get_card_by_id(self.user.telegram_id)['images']), 1)
+
+    def test_deleted_user(self):
+        self.user.delete()
+        self.assertFalse(self.redis.exists(self.key))
+        self.assertIsNone(profile_cards.get_card_by_id(1))
+
+
+class RatingParityTests(FakeRedisMixin, TestCase):
+    """Векторный пересчет (rating_engine) совпадает с SQL-выражениями и методами User"""
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(0)
+        users = []
+        for telegram_id in range(1, 201):
+            users.append(User(
+                telegram_id=telegram_id,
+                # Пустые поля, короткая и длинная биография - все ветви формул
+                name=rng.choice(['', 'Anna']),
+                age=rng.choice([0, 18, 30]),
+                gender=rng.choice(['', 'M', 'F']),
+                seeking_gender=rng.choice(['', 'M', 'F']),
+                city=rng.choice(['', 'Moscow']),
+                bio=rng.choice(['', 'short bio', 'x' * 50, 'y' * 120]),
+                likes_count=rng.choice([0, 1, 7, 40]),
+                skips_count=rng.choice([0, 3, 25]),
+                matches_count=rng.choice([0, 1, 5, 60]),
+                conversations_initiated=rng.choice([0, 1, 4, 90]),
+            ))
+        User.objects.bulk_create(users)
+        UserImage.objects.bulk_create([
+            UserImage(user=user, image=f'user_images/{user.telegram_id}/{number}.jpg')
+            for user in User.objects.all()
+            for number in range(rng.choice([0, 1, 2, 5]))
+        ])
+
+    @staticmethod
+    def ratings():
+        return {
+            row[0]: row[1:]
+            for row in User.objects.values_list('id', *rating_engine.RATING_FIELDS)
+        }
+
+    def assertRatingsEqual(self, expected, actual):
+        self.assertEqual(expected.keys(), actual.keys())
+        for user_id, values in expected.items():
+            for field, value, other in zip(rating_engine.RATING_FIELDS, values, actual[user_id]):
+                self.assertAlmostEqual(value, other, places=9, msg=f'user #{user_id} {field}')
+
+    def test_engine_matches_sql_expressions(self):
+        self.assertEqual(rating_engine.recalculate(chunk_size=64), 200)
+        engine = self.ratings()
+
+        User.objects.update(primary_rating=0.0, behavioral_rating=0.0, combined_rating=0.0)
+        primary = primary_rating_expression()
+        behavioral = behavioral_rating_expression()
+        User.objects.update(
+            primary_rating=primary,
+            behavioral_rating=behavioral,
+            combined_rating=combined_rating_expression(primary, behavioral)
+        )
+        self.assertRatingsEqual(engine, self.ratings())
+
+        for user in User.objects.all():
+            user.update_ratings()
+        self.assertRatingsEqual(engine, self.ratings())
+
+    def test_engine_updates_candidate_index(self):
+        rating_engine.recalculate()
+        for user in User.objects.all()[:20]:
+            key = candidate_index.bucket_key(user.gender, user.seeking_gender, user.city)
+            self.assertEqual(self.redis.zscore(key, candidate_index.to_member(user.pk)), user.combined_rating)
+
+
+
+class DirtyRatingsTests(FakeRedisMixin, TestCase):
+    """Начатый диалог только отмечает пользователя; пересчитывает recalculate_dirty_ratings"""
+
+    def setUp(self):
+        super().setUp()
+        self.sender = create_user(1, gender='M', seeking_gender='F', likes_count=4, matches_count=2)
+        self.other = create_user(2)
+        self.match = Match.objects.create(user1=self.sender, user2=self.other)
+
+    def test_conversation_marks_dirty_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.match.mark_conversation_initiated(self.sender)
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.conversations_initiated, 1)
+        self.assertEqual(self.sender.behavioral_rating, 0.0)
+        self.assertEqual(dirty_ratings.pending_count(), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(dirty_ratings.pending_count(), 1)
+        self.assertEqual(tasks.recalculate_dirty_ratings(), 1)
+        self.assertEqual(dirty_ratings.pending_count(), 0)
+
+        self.sender.refresh_from_db()
+        rating = self.sender.behavioral_rating
+        self.sender.calculate_behavioral_rating()
+        self.assertGreater(rating, 0.0)
+        self.assertAlmostEqual(rating, self.sender.behavioral_rating)
+
+    def test_rolled_back_conversation_not_marked(self):
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.match.mark_conversation_initiated(self.sender)
+                raise RuntimeError
+        self.assertEqual(dirty_ratings.pending_count(), 0)
+
+    @override_settings(DIRTY_RATINGS_BATCH_SIZE=1)
+    def test_flush_in_batches(self):
+        dirty_ratings.mark_dirty(self.sender.pk, self.other.pk)
+        self.assertEqual(tasks.recalculate_dirty_ratings(), 2)
+        self.assertEqual(dirty_ratings.pending_count(), 0)
+        self.sender.refresh_from_db()
+        self.assertGreater(self.sender.combined_rating, 0.0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], DB_REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(FakeRedisMixin, TransactionTestCase):
+    """
+    GET-запросы читают с реплики, кроме пользователей, которые недавно что-то
+    изменили. TransactionTestCase: внутри транзакции роутер всегда выбирает default.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = create_user(1, gender='M', seeking_gender='F')
+        self.other = create_user(2)
+        # Регистрация тоже закрепляет пользователей за default - начинаем без меток
+        self.redis.delete(*[db_routing.get_pin_key(telegram_id) for telegram_id in (1, 2)])
+        self.router = db_routing.ReplicaRouter()
+
+    def read_alias(self, method='get', write=False, **params):
+        """Куда роутер направит чтение внутри запроса"""
+        aliases = []
+
+        def get_response(request):
+            if write:
+                self.router.db_for_write(User)
+            aliases.append(self.router.db_for_read(User))
+            return None
+
+        request = getattr(RequestFactory(), method)('/api/users/', params)
+        db_routing.ReplicaRoutingMiddleware(get_response)(request)
+        return aliases[0]
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.read_alias(exclude_user=1), 'replica_1')
+        self.assertEqual(self.read_alias(method='post', exclude_user=1), 'default')
+        # Вне запроса (задачи, команды) - default
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_write_in_request_pins_following_reads(self):
+        self.assertEqual(self.read_alias(write=True, exclude_user=1), 'default')
+
+    def test_pinned_after_write(self):
+        Like.objects.create(from_user=self.viewer, to_user=self.other)
+        pin_key = db_routing.get_pin_key(self.viewer.telegram_id)
+        self.assertTrue(0 < self.redis.ttl(pin_key) <= 10)
+
+        # Внутри окна закрепления автор лайка читает из default, остальные - с реплики
+        self.assertEqual(self.read_alias(exclude_user=1), 'default')
+        self.assertEqual(self.read_alias(exclude_user=2), 'replica_1')
+
+        # Окно истекло
+        self.redis.delete(pin_key)
+        self.assertEqual(self.read_alias(exclude_user=1), 'replica_1')
+
+    def test_replica_reads_block(self):
+        with db_routing.replica_reads():
+            self.assertEqual(self.router.db_for_read(User), 'replica_1')
+            self.router.db_for_write(User)
+            # Пересчет рейтингов пишет по ходу скана, но читать продолжает с реплики
+            self.assertEqual(self.router.db_for_read(User), 'replica_1')
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(User), 'default')
+
+
+class SwipeQueryTests(FakeRedisMixin, TestCase):
+    """Свайп - INSERT лайка и один UPDATE счетчиков; взаимный лайк проверяется в Redis"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = create_user(1, gender='M', seeking_gender='F', bio='x' * 50)
+        self.liked = create_user(2)
+        self.skipped = create_user(3)
+        # Горячий путь: множества лайкнувших уже загружены
+        for user in (self.viewer, self.liked, self.skipped):
+            mutual_likes.load(user.telegram_id)
+
+    def test_apply_swipe_is_one_update(self):
+        for like, is_match in (
+            (Like(from_user=self.viewer, to_user=self.skipped, is_skip=True), False),
+            (Like(from_user=self.viewer, to_user=self.liked), False),
+            (Like(from_user=self.liked, to_user=self.viewer), True),
+        ):
+            with self.assertNumQueries(1):
+                swipes.apply_swipe(like, is_match)
+
+        self.viewer.refresh_from_db()
+        self.liked.refresh_from_db()
+        self.skipped.refresh_from_db()
+        self.assertEqual(self.skipped.skips_count, 1)
+        self.assertEqual((self.viewer.likes_count, self.viewer.matches_count), (1, 1))
+        self.assertEqual((self.liked.likes_count, self.liked.matches_count), (1, 1))
+        # Рейтинги при мэтче посчитаны по новым счетчикам
+        behavioral = self.viewer.behavioral_rating
+        self.viewer.calculate_behavioral_rating()
+        self.assertAlmostEqual(behavioral, self.viewer.behavioral_rating)
+
+    def test_swipe_query_budget(self):
+        # SAVEPOINT, INSERT лайка, UPDATE счетчиков, RELEASE SAVEPOINT
+        with self.assertNumQueries(4):
+            skip = Like.objects.create(from_user=self.viewer, to_user=self.skipped, is_skip=True)
+        with self.assertNumQueries(4):
+            like = Like.objects.create(from_user=self.liked, to_user=self.viewer)
+        with self.assertNumQueries(4):
+            match = Like.objects.create(from_user=self.viewer, to_user=self.liked)
+        self.assertEqual((skip.is_match, like.is_match, match.is_match), (False, False, True))
+
+    def test_mutual_like_without_loaded_likes(self):
+        Like.objects.create(from_user=self.liked, to_user=self.viewer)
+        self.redis.flushall()
+        # Множество автора не загружено - проверка и загрузка идут в базу
+        match = Like.objects.create(from_user=self.viewer, to_user=self.liked)
+        self.assertTrue(match.is_match)
+        likes_in = mutual_likes.get_likes_in_key(self.viewer.telegram_id)
+        self.assertTrue(self.redis.sismember(likes_in, self.liked.telegram_id))
+
+
+
+class MutualLikeRollbackTests(FakeRedisMixin, TestCase):
+    """Лайк попадает в множество лайкнувших только после коммита"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = create_user(1, gender='M', seeking_gender='F')
+        self.other = create_user(2)
+        for user in (self.viewer, self.other):
+            mutual_likes.load(user.telegram_id)
+        self.likes_in = mutual_likes.get_likes_in_key(self.other.telegram_id)
+        self.pending = mutual_likes.get_pending_key(self.viewer.telegram_id, self.other.telegram_id)
+
+    def test_like_recorded_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(from_user=self.viewer, to_user=self.other)
+            self.assertFalse(self.redis.sismember(self.likes_in, self.viewer.telegram_id))
+        self.assertTrue(self.redis.sismember(self.likes_in, self.viewer.telegram_id))
+        self.assertFalse(self.redis.exists(self.pending))
+
+        self.assertTrue(Like.objects.create(from_user=self.other, to_user=self.viewer).is_match)
+
+    def test_failed_swipe_leaves_no_like(self):
+        with mock.patch.object(swipes, 'apply_swipe', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            Like.objects.create(from_user=self.viewer, to_user=self.other)
+        self.assertFalse(self.redis.exists(self.pending))
+
+        self.assertFalse(Like.objects.create(from_user=self.other, to_user=self.viewer).is_match)
+
+    def test_rolled_back_transaction_leaves_no_like(self):
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Like.objects.create(from_user=self.viewer, to_user=self.other)
+                raise RuntimeError
+        self.assertFalse(self.redis.sismember(self.likes_in, self.viewer.telegram_id))
+        # Отметка ожидания живет LIKE_PENDING_TTL секунд
+        self.assertLessEqual(self.redis.ttl(self.pending), settings.LIKE_PENDING_TTL)
+        self.redis.delete(self.pending)
+
+        self.assertFalse(Like.objects.create(from_user=self.other, to_user=self.viewer).is_match)
+
+
+class MutualLikeRemovalTests(FakeRedisMixin, TestCase):
+    """Удаленный или отмененный лайк убирается из множества лайкнувших"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = create_user(1, gender='M', seeking_gender='F')
+        self.other = create_user(2)
+        for user in (self.viewer, self.other):
+            mutual_likes.load(user.telegram_id)
+        self.likes_in = mutual_likes.get_likes_in_key(self.other.telegram_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.like = Like.objects.create(from_user=self.viewer, to_user=self.other)
+        self.assertTrue(self.redis.sismember(self.likes_in, self.viewer.telegram_id))
+
+    def test_deleted_like(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.like.delete()
+        self.assertFalse(self.redis.sismember(self.likes_in, self.viewer.telegram_id))
+        self.assertFalse(Like.objects.create(from_user=self.other, to_user=self.viewer).is_match)
+        self.assertFalse(Match.objects.exists())
+
+    def test_like_changed_to_skip(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.like.is_skip = True
+            self.like.save()
+        self.assertFalse(self.redis.sismember(self.likes_in, self.viewer.telegram_id))
+        self.assertFalse(Like.objects.create(from_user=self.other, to_user=self.viewer).is_match)
+
+        # Пропуск, снова ставший лайком, возвращается в множество
+        with self.captureOnCommitCallbacks(execute=True):
+            self.like.is_skip = False
+            self.like.save(update_fields=['is_skip'])
+        self.assertTrue(self.redis.sismember(self.likes_in, self.viewer.telegram_id))
+
+    def test_deleted_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.viewer.delete()
+        self.assertFalse(self.redis.sismember(self.likes_in, 1))
+
+        # Тот же telegram_id после повторной регистрации не получает чужой мэтч
+        again = create_user(1, gender='M', seeking_gender='F')
+        self.assertFalse(Like.objects.create(from_user=self.other, to_user=again).is_match)
+
+
+class FeedCursorTests(FakeRedisMixin, TestCase):
+    """Лента из базы продолжается с курсора (combined_rating, id)"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = create_user(1, gender='M', seeking_gender='F')
+        users = [
+            create_user(telegram_id, combined_rating=float(telegram_id % 3))
+            for telegram_id in range(2, 17)
+        ]
+        Like.objects.create(from_user=self.viewer, to_user=users[0], is_skip=True)
+        self.expected = [
+            user.pk for user in sorted(users[1:], key=lambda user: (user.combined_rating, user.pk), reverse=True)
+        ]
+        self.view = UserViewSet.as_view({'get': 'list'})
+
+    def test_pages_in_order(self):
+        for mode in feed.FEED_QUERY_MODES:
+            with override_settings(FEED_QUERY_MODE=mode):
+                profile_ids, cursor = [], None
+                while True:
+                    profiles, cursor = feed.get_db_feed(self.viewer, 4, cursor)
+                    profile_ids += [profile.pk for profile in profiles]
+                    if cursor is None:
+                        break
+                self.assertEqual(profile_ids, self.expected, mode)
+
+    def test_cursor_format(self):
+        for cursor in ((0.1 + 0.2, 7), (50.0, 1), candidate_index.CURSOR_END):
+            self.assertEqual(feed.parse_cursor(feed.format_cursor(cursor)), cursor)
+        with self.assertRaises(ValueError):
+            feed.parse_cursor('abc')
+
+    def request(self, **params):
+        return self.view(APIRequestFactory().get('/api/users/', {'exclude_user': 1, 'limit': 5, **params}))
+
+    def test_api_cursor(self):
+        profile_ids, cursor = [], ''
+        while True:
+            response = self.request(cursor=cursor)
+            self.assertEqual(response.status_code, 200)
+            profile_ids += [profile['telegram_id'] for profile in response.data]
+            cursor = response['X-Next-Cursor']
+            if not cursor:
+                break
+        telegram_ids = dict(User.objects.values_list('id', 'telegram_id'))
+        self.assertEqual(profile_ids, [telegram_ids[user_id] for user_id in self.expected])
+        self.assertEqual(self.request(cursor='abc').status_code, 400)
+
+    @override_settings(CANDIDATE_INDEX_ENABLED=False)
+    def test_refills_continue_from_saved_cursor(self):
+        first = [profile.pk for profile in feed.build_feed(self.viewer, 6)]
+        second = [profile.pk for profile in feed.build_feed(self.viewer, 6)]
+        third = [profile.pk for profile in feed.build_feed(self.viewer, 6)]
+        self.assertEqual(first + second + third, self.expected)
+        self.assertFalse(self.redis.exists(feed.get_cursor_key(self.viewer.telegram_id)))
+        # Лента закончилась - следующее пополнение начинается сначала
+        self.assertEqual([profile.pk for profile in feed.build_feed(self.viewer, 6)], self.expected[:6])
+
+
+class CandidateIndexTests(FakeRedisMixin, TestCase):
+    """Лента из индекса кандидатов: маркер готовности и постраничный обход по курсорам"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = create_user(1, gender='M', seeking_gender='F')
+        # Много равных рейтингов (как у новых пользователей с нулевым рейтингом)
+        self.users = [
+            create_user(telegram_id, combined_rating=50.0 if telegram_id % 5 == 0 else 0.0)
+            for telegram_id in range(2, 32)
+        ]
+        self.expected = [
+            user.pk for user in sorted(self.users, key=lambda user: (user.combined_rating, user.pk), reverse=True)
+        ]
+
+    def read_all(self, limit, on_page=None):
+        candidate_ids, cursors = [], None
+        while True:
+            page, cursors = candidate_index.get_candidate_ids(self.viewer, limit, cursors)
+            candidate_ids.extend(page)
+            if not cursors:
+                return candidate_ids
+            if on_page:
+                on_page(cursors)
+
+    def test_not_ready_before_rebuild(self):
+        # Сигналы post_save уже создали корзины, но индекс не перестроен
+        self.assertTrue(self.redis.exists(candidate_index.bucket_key('F', 'M', 'Moscow')))
+        self.assertIsNone(candidate_index.get_candidate_ids(self.viewer, 10))
+        self.assertIsNone(candidate_index.get_candidates(self.viewer, 10))
+
+        candidate_index.rebuild()
+        self.assertEqual(candidate_index.get_candidate_ids(self.viewer, 3)[0], self.expected[:3])
+
+    @override_settings(CANDIDATE_INDEX_PAGE_SIZE=4)
+    def test_paging(self):
+        candidate_index.rebuild()
+        self.assertEqual(self.read_all(5), self.expected)
+
+    @override_settings(CANDIDATE_INDEX_PAGE_SIZE=4, CANDIDATE_INDEX_MAX_SCAN=3)
+    def test_cursor_member_removed_or_rescored(self):
+        candidate_index.rebuild()
+        changed = []
+
+        def change_cursor_member(cursors):
+            # Участник курсора городской корзины исчезает или меняет рейтинг
+            _, user_id = cursors[candidate_index.bucket_key('F', 'M', 'Moscow')]
+            user = User.objects.get(pk=user_id)
+            if len(changed) % 2:
+                candidate_index.remove_user(user_id)
+            else:
+                user.combined_rating = 99.0
+                candidate_index.index_user(user)
+            changed.append(user_id)
+
+        candidate_ids = self.read_all(5, change_cursor_member)
+        self.assertEqual(candidate_ids, self.expected)
+        self.assertGreater(len(changed), 3)
+
+
+class SeenFilterTests(FakeRedisMixin, TestCase):
+    """Фильтр просмотренных заменяет запрос к лайкам только после rebuild()"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = create_user(1, gender='M', seeking_gender='F')
+        self.swiped, self.liked, self.fresh = [create_user(telegram_id) for telegram_id in (2, 3, 4)]
+        # Лайк, записанный до включения фильтра
+        Like.objects.create(from_user=self.viewer, to_user=self.swiped, is_skip=True)
+        self.redis.flushall()
+        candidate_index.rebuild()
+
+    def candidate_ids(self):
+        candidate_ids, _ = candidate_index.get_candidate_ids(self.viewer, 10)
+        return candidate_ids
+
+    def test_new_like_does_not_build_filter(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(from_user=self.viewer, to_user=self.liked)
+        self.assertTrue(self.redis.exists(seen_filter.get_filter_key(self.viewer.pk)))
+        self.assertFalse(seen_filter.is_built(self.viewer.pk))
+        self.assertEqual(self.candidate_ids(), [self.fresh.pk])
+
+    def test_rebuilt_filter_used(self):
+        self.assertEqual(seen_filter.rebuild(), 1)
+        self.assertTrue(seen_filter.is_built(self.viewer.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(from_user=self.viewer, to_user=self.liked)
+        with mock.patch.object(Like.objects, 'filter', side_effect=AssertionError):
+            self.assertEqual(self.candidate_ids(), [self.fresh.pk])
+
+    def test_viewer_without_likes(self):
+        self.assertEqual(seen_filter.rebuild([self.fresh.pk]), 1)
+        self.assertTrue(seen_filter.is_built(self.fresh.pk))
+
+    def test_added_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Like.objects.create(from_user=self.viewer, to_user=self.liked)
+        self.assertFalse(self.redis.exists(seen_filter.get_filter_key(self.viewer.pk)))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(seen_filter.seen_among(self.viewer.pk, [self.liked.pk]), {self.liked.pk})
+
+
+class BenchmarkServingTests(FakeRedisMixin, TestCase):
+    """benchmark_serving нагружает только временных пользователей и удаляет их"""
+
+    def test_fixture_users_removed(self):
+        existing = create_user(1)
+        command = benchmark_serving.Command(stdout=io.StringIO())
+        telegram_ids = command.seed(6)
+        self.assertNotIn(existing.telegram_id, telegram_ids)
+
+        viewer = User.objects.get(telegram_id=telegram_ids[0])
+        # Пополнение ленты двигает курсор и очередь зрителя
+        profile, = feed.build_feed(viewer, 1)
+        profile_queue.push_profiles(viewer.telegram_id, [profile.telegram_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(from_user=viewer, to_user=User.objects.get(telegram_id=telegram_ids[1]))
+        with self.captureOnCommitCallbacks(execute=True):
+            command.cleanup(telegram_ids)
+
+        self.assertEqual(list(User.objects.all()), [existing])
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(
+            [key for key in self.redis.keys() if any(str(telegram_id) in key for telegram_id in telegram_ids)], []
+        )
+
+
+
+def swipe_events(*swipes_list):
+    return [
+        (f'{number}-0', {'from_user': str(from_id), 'to_user': str(to_id), 'is_skip': str(int(is_skip))})
+        for number, (from_id, to_id, is_skip) in enumerate(swipes_list, 1)
+    ]
+
+
+class SwipeStreamIngestTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = create_user(1, gender='M', seeking_gender='F')
+        self.second = create_user(2)
+        self.third = create_user(3)
+        for user in (self.first, self.second, self.third):
+            mutual_likes.load(user.telegram_id)
+
+    def counters(self, user):
+        user.refresh_from_db()
+        return user.likes_count, user.skips_count, user.matches_count
+
+    def test_repeated_swipe_counted_once(self):
+        self.assertEqual(swipe_stream.ingest(swipe_events((1, 2, False), (1, 3, True))), (2, 0))
+        # Та же пара в следующей пачке (или у другого потребителя) уже вставлена
+        self.assertEqual(swipe_stream.ingest(swipe_events((1, 2, False), (1, 3, True))), (0, 0))
+        self.assertEqual(self.counters(self.second), (1, 0, 0))
+        self.assertEqual(self.counters(self.third), (0, 1, 0))
+
+    def test_match_in_one_batch(self):
+        self.assertEqual(swipe_stream.ingest(swipe_events((2, 1, False), (1, 2, False))), (2, 1))
+        match = Match.objects.get()
+        self.assertEqual((match.user1_id, match.user2_id), (self.first.pk, self.second.pk))
+        self.assertEqual(self.counters(self.first), (1, 0, 1))
+        self.assertEqual(self.counters(self.second), (1, 0, 1))
+
+    def test_match_across_uncommitted_batches(self):
+        # Встречный лайк еще не закоммичен - его видно по отметке ожидания в Redis
+        swipe_stream.ingest(swipe_events((2, 1, False)))
+        self.assertEqual(swipe_stream.ingest(swipe_events((1, 2, False))), (1, 1))
+        match = Match.objects.get()
+        self.assertEqual((match.user1_id, match.user2_id), (self.first.pk, self.second.pk))
+
+    def test_existing_match_not_duplicated(self):
+        Match.objects.create(user1=self.second, user2=self.first)
+        self.assertEqual(swipe_stream.ingest(swipe_events((2, 1, False), (1, 2, False))), (2, 0))
+        self.assertEqual(Match.objects.count(), 1)
+        self.assertEqual(self.counters(self.first), (1, 0, 0))
+
+    def test_cold_cache_batch_queries(self):
+        users = [create_user(telegram_id) for telegram_id in range(10, 30)]
+        # Половина получателей уже лайкнула автора - мэтчи найдутся по базе
+        for user in users[::2]:
+            Like.objects.create(from_user=user, to_user=self.first)
+
+        def ingest_queries(batch):
+            self.redis.flushall()
+            with CaptureQueriesContext(connection) as queries:
+                swipe_stream.ingest(swipe_events(*batch))
+            return len(queries)
+
+        small = ingest_queries([(1, users[0].telegram_id, False), (2, 3, False)])
+        large = ingest_queries(
+            [(1, user.telegram_id, False) for user in users[1:]]
+            + [(user.telegram_id, 2, False) for user in users]
+        )
+        # Проверка взаимных лайков не зависит от размера пачки
+        self.assertEqual(small, large)
+        self.assertEqual(Match.objects.count(), 10)
+
+    def test_deleted_entries_acknowledged(self):
+        # XAUTOCLAIM в Redis < 7 отдает удаленные события без полей
+        entries = [('0-1', None)] + swipe_events((1, 2, False))
+        self.assertEqual(swipe_stream.ingest(entries), (1, 0))
+
+    def test_match_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            swipe_stream.ingest(swipe_events((2, 1, False), (1, 2, False)))
+        self.assertEqual(self.redis.xlen(MATCH_EVENTS_KEY), 0)
+        for callback in callbacks:
+            callback()
+
+        (_, event), = self.redis.xrange(MATCH_EVENTS_KEY)
+        self.assertEqual(event, {'user1': '1', 'user2': '2'})
+        likes_in = mutual_likes.get_likes_in_key(self.first.telegram_id)
+        self.assertTrue(self.redis.sismember(likes_in, self.second.telegram_id))
+
+
+
+
+class SwipeViewTests(FakeRedisMixin, TestCase):
+    """POST /api/swipe/: результат свайпа и следующая анкета одним ответом"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = create_user(1, gender='M', seeking_gender='F')
+        self.liked = create_user(2)
+        self.queued = create_user(3)
+        for user in (self.viewer, self.liked):
+            mutual_likes.load(user.telegram_id)
+        profile_cards.store_cards(profile_cards.build_cards([self.queued]))
+        profile_queue.push_profiles(self.viewer.telegram_id, [self.queued.telegram_id])
+        self.view = SwipeView.as_view()
+
+    def swipe(self, to_user, is_skip=False):
+        request = APIRequestFactory().post(
+            '/api/swipe/', {'from_user': 1, 'to_user': to_user, 'is_skip': is_skip}, format='json'
+        )
+        return self.view(request)
+
+    def queue_length(self):
+        return self.redis.llen(profile_queue.get_queue_key(self.viewer.telegram_id))
+
+    def test_like(self):
+        response = self.swipe(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.data), {'success', 'match', 'matched_profile', 'next_profile'})
+        self.assertEqual((response.data['match'], response.data['matched_profile']), (False, None))
+        self.assertEqual(response.data['next_profile']['telegram_id'], self.queued.telegram_id)
+        self.assertEqual(self.queue_length(), 0)
+
+    def test_match(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(from_user=self.liked, to_user=self.viewer)
+        response = self.swipe(2)
+        self.assertTrue(response.data['match'])
+        self.assertEqual(response.data['matched_profile']['telegram_id'], self.liked.telegram_id)
+        self.assertEqual(response.data['next_profile']['telegram_id'], self.queued.telegram_id)
+        self.assertTrue(Match.objects.filter(user1=self.viewer, user2=self.liked).exists())
+
+    def test_empty_queue(self):
+        self.redis.delete(profile_queue.get_queue_key(self.viewer.telegram_id))
+        self.assertIsNone(self.swipe(2).data['next_profile'])
+
+    def test_failed_swipe_keeps_next_profile(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(from_user=self.liked, to_user=self.viewer)
+        with mock.patch.object(Match.objects, 'create', side_effect=RuntimeError('match failed')):
+            response = self.swipe(2)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.queue_length(), 1)
+
+
+class RegisterImageTests(FakeRedisMixin, TestCase):
+    """POST /api/images/register/: API не читает объект, хеш считает задача Celery"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(1, city='')
+        self.objects = {}
+        self.opened = []
+        for field in image_dedup.FILE_FIELDS:
+            storage = UserImage._meta.get_field(field).storage
+            for name, function in (
+                ('open', self.open_object), ('exists', self.objects.__contains__),
+                ('save', self.save_object), ('delete', self.delete_object),
+            ):
+                patcher = mock.patch.object(storage, name, side_effect=function)
+                patcher.start()
+                self.addCleanup(patcher.stop)
+        # Задачу вызываем в тесте напрямую
+        patcher = mock.patch.object(tasks.generate_image_renditions, 'delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.view = UserImageViewSet.as_view({'post': 'register'}, **UserImageViewSet.register.kwargs)
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, format='JPEG')
+        self.photo = buffer.getvalue()
+
+    def open_object(self, name, mode='rb'):
+        if name not in self.objects:
+            raise FileNotFoundError(name)
+        self.opened.append(name)
+        return ContentFile(self.objects[name], name=name)
+
+    def save_object(self, name, content, max_length=None):
+        self.objects[name] = content.read()
+        return name
+
+    def delete_object(self, name):
+        self.objects.pop(name, None)
+
+    def register(self, key, content=None, run_task=True):
+        self.objects[key] = content or self.photo
+        request = APIRequestFactory().post(
+            '/api/images/register/', {'telegram_id': 1, 'key': key}, format='json'
+        )
+        response = self.view(request)
+        if response.status_code == 201 and run_task:
+            tasks.generate_image_renditions(response.data['id'])
+        return response
+
+    def test_object_read_only_by_task(self):
+        response = self.register('user_images/1/a.jpg', run_task=False)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.opened, [])
+        self.assertEqual(UserImage.objects.get().content_hash, '')
+
+        tasks.generate_image_renditions(response.data['id'])
+        image = UserImage.objects.get()
+        self.assertEqual(image.content_hash, image_dedup.content_hash(ContentFile(self.photo)))
+        self.assertTrue(image.card_image)
+
+    def test_primary_rating_updated(self):
+        self.user.calculate_primary_rating()
+        rating = self.user.primary_rating
+        self.register('user_images/1/a.jpg')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.primary_rating, rating + 10)
+
+    def test_duplicate_of_other_user(self):
+        other = create_user(2)
+        self.objects['user_images/2/a.jpg'] = self.photo
+        original = create_image(other, name='user_images/2/a.jpg')
+        UserImage.objects.filter(pk=original.pk).update(
+            content_hash=image_dedup.content_hash(ContentFile(self.photo))
+        )
+
+        self.register('user_images/1/b.jpg')
+        image = UserImage.objects.get(user=self.user)
+        self.assertEqual(image.image.name, 'user_images/2/a.jpg')
+        self.assertNotIn('user_images/1/b.jpg', self.objects)
+
+    def test_own_duplicate_removed(self):
+        self.register('user_images/1/a.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.register('user_images/1/b.jpg')
+        image = UserImage.objects.get()
+        self.assertEqual(image.image.name, 'user_images/1/a.jpg')
+        self.assertTrue(image.is_main)
+        self.assertIn('user_images/1/a.jpg', self.objects)
+        self.assertNotIn('user_images/1/b.jpg', self.objects)
+
+    def test_different_photos_kept(self):
+        self.register('user_images/1/a.jpg')
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'white').save(buffer, format='JPEG')
+        self.register('user_images/1/b.jpg', buffer.getvalue())
+        self.assertEqual(UserImage.objects.count(), 2)
+        self.assertIn('user_images/1/a.jpg', self.objects)
+        self.assertIn('user_images/1/b.jpg', self.objects)
+
+    def test_missing_object(self):
+        request = APIRequestFactory().post(
+            '/api/images/register/', {'telegram_id': 1, 'key': 'user_images/1/missing.jpg'}, format='json'
+        )
+        self.assertEqual(self.view(request).status_code, 400)
+        self.assertFalse(UserImage.objects.exists())
+
+
+
+class UploadImageTests(FakeRedisMixin, TestCase):
+    """POST /api/images/: повторно загруженное фото не копируется в хранилище"""
+
+    def setUp(self):
+        super().setUp()
+        self.view = UserImageViewSet.as_view({'post': 'create'})
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, format='JPEG')
+        self.photo = buffer.getvalue()
+
+    def upload(self, telegram_id):
+        request = APIRequestFactory().post('/api/images/', {
+            'telegram_id': telegram_id,
+            'image': SimpleUploadedFile('photo.jpg', self.photo, content_type='image/jpeg'),
+        }, format='multipart')
+        return self.view(request)
+
+    def test_shared_copy_updates_primary_rating(self):
+        owner = create_user(1)
+        UserImage.objects.filter(pk=create_image(owner).pk).update(
+            content_hash=image_dedup.content_hash(ContentFile(self.photo))
+        )
+        # Без города рейтинг ниже предела в 100 баллов
+        user = create_user(2, city='')
+        user.calculate_primary_rating()
+        rating = user.primary_rating
+
+        response = self.upload(2)
+        self.assertEqual(response.status_code, 201)
+        user.refresh_from_db()
+        self.assertEqual(user.images.get().image.name, owner.images.get().image.name)
+        self.assertEqual(user.primary_rating, rating + 10)
+
+
+class ReleaseFilesTests(FakeRedisMixin, TestCase):
+    """Объект хранилища удаляется только вместе с последней ссылкой на него"""
+
+    def setUp(self):
+        super().setUp()
+        self.deleted = []
+        for field in image_dedup.FILE_FIELDS:
+            patcher = mock.patch.object(
+                UserImage._meta.get_field(field).storage, 'delete', side_effect=self.deleted.append
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_legacy_reference_kept(self):
+        first, second = create_user(1), create_user(2)
+        shared = create_image(first, name='user_images/1/a.jpg')
+        UserImage.objects.filter(pk=shared.pk).update(content_hash='a' * 64)
+        # Старая запись без хеша ссылается на тот же объект
+        create_image(second, name='user_images/1/a.jpg')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserImage.objects.get(pk=shared.pk).delete()
+        self.assertEqual(self.deleted, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.images.get().delete()
+        self.assertEqual(self.deleted, ['user_images/1/a.jpg'] * 2)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'параллельные транзакции проверяются на PostgreSQL')
+class SwipeStreamConcurrencyTests(FakeRedisMixin, TransactionTestCase):
+    """Два потребителя пишут пересекающиеся пачки в параллельных транзакциях"""
+
+    def setUp(self):
+        super().setUp()
+        self.first = create_user(1, gender='M', seeking_gender='F')
+        self.second = create_user(2)
+        for user in (self.first, self.second):
+            mutual_likes.load(user.telegram_id)
+
+    def ingest_in_parallel(self, first_batch, second_batch):
+        """
+        Первый потребитель записывает пачку и держит транзакцию открытой,
+        пока второй не начнет свою; возвращает результаты обоих.
+        """
+        results = {}
+        first_written = threading.Event()
+        second_started = threading.Event()
+
+        def first():
+            try:
+                with transaction.atomic():
+                    results['first'] = swipe_stream.ingest(first_batch)
+                    first_written.set()
+                    second_started.wait(5)
+                    # Второй потребитель успевает дойти до конфликта или проверки мэтча
+                    threading.Event().wait(0.5)
+            finally:
+                connections.close_all()
+
+        def second():
+            try:
+                first_written.wait(5)
+                second_started.set()
+                results['second'] = swipe_stream.ingest(second_batch)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def test_same_pair_counted_once(self):
+        results = self.ingest_in_parallel(swipe_events((1, 2, False)), swipe_events((1, 2, False)))
+        self.assertEqual(sorted(results.values()), [(0, 0), (1, 0)])
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.likes_count, 1)
+
+    def test_opposite_likes_make_one_match(self):
+        results = self.ingest_in_parallel(swipe_events((2, 1, False)), swipe_events((1, 2, False)))
+        self.assertEqual(sum(matches for _, matches in results.values()), 1)
+        match = Match.objects.get()
+        self.assertEqual((match.user1_id, match.user2_id), (self.first.pk, self.second.pk))
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.matches_count, 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'планы запросов проверяются только на PostgreSQL')
+class HotQueryPlanTests(TestCase):
+    """Лента, проверка взаимного лайка и поиск мэтчей идут по своим индексам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Данных достаточно, чтобы планировщик предпочел индексы полному чтению
+        rng = random.Random(0)
+        User.objects.bulk_create([
+            User(
+                telegram_id=telegram_id, name=f'user{telegram_id}', age=25, city='Moscow',
+                gender='MF'[telegram_id % 2], seeking_gender='FM'[telegram_id % 2],
+                combined_rating=rng.random() * 100
+            )
+            for telegram_id in range(1, 3001)
+        ])
+        user_ids = list(User.objects.values_list('id', flat=True))
+        pairs = set()
+        while len(pairs) < 15000:
+            pairs.add(tuple(rng.sample(range(1, 3001), 2)))
+        Like.objects.bulk_create([
+            Like(from_user_id=from_user, to_user_id=to_user, is_skip=rng.random() < 0.5)
+            for from_user, to_user in pairs
+        ])
+        Match.objects.bulk_create([
+            Match(user1_id=rng.choice(user_ids), user2_id=rng.choice(user_ids), is_active=rng.random() < 0.7)
+            for _ in range(3000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE api_user, api_like, api_match')
+
+        cls.viewer = User.objects.get(telegram_id=10)
+        cls.other = User.objects.get(telegram_id=11)
+
+    def assertUsesIndexes(self, queryset, *indexes):
+        plan = queryset.explain()
+        for index in indexes:
+            # "Index Scan using <индекс>" или "Bitmap Index Scan on <индекс>"
+            self.assertRegex(plan, rf'(using|on) {index}\b')
+
+    def test_feed(self):
+        for cursor in (None, (50.0, 1500)):
+            self.assertUsesIndexes(
+                feed.get_feed_queryset(self.viewer, 20, mode='not_exists', cursor=cursor),
+                'user_feed_idx', 'match_user1_only_active_idx', 'match_user2_only_active_idx'
+            )
+
+    def test_mutual_like(self):
+        self.assertUsesIndexes(
+            Like.objects.filter(from_user=self.other, to_user=self.viewer, is_skip=False),
+            'like_mutual_nonskip_idx'
+        )
+
+    def test_active_matches(self):
+        self.assertUsesIndexes(
+            Match.objects.filter(Q(user1=self.viewer) | Q(user2=self.viewer), is_active=True),
+            'match_user1_only_active_idx', 'match_user2_only_active_idx'
+        )
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.permissions import AllowAny
@@ -5,7 +6,8 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Like, User, UserImage, Match
-from .serializers import UserImageSerializer
+from .serializers import UserImageSerializer, SwipeEventSerializer
+from . import profile_cards, profile_queue, swipe_stream
 from django.db.models import Q
 import logging
 from .views import (
@@ -29,10 +31,25 @@ class SwipeView(APIView):
                     {'error': 'from_user and to_user are required'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+
+            if swipe_stream.is_enabled():
+                # Отложенная запись: лайк и мэтч создаст потребитель потока
+                serializer = SwipeEventSerializer(data=request.data)
+                if not serializer.is_valid():
+                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                swipe_stream.publish(**serializer.validated_data)
+                return Response({
+                    'success': True,
+                    'queued': True,
+                    'match': False,
+                    'matched_profile': None,
+                    'next_profile': self.next_profile(from_user_id),
+                }, status=status.HTTP_202_ACCEPTED)
             
             # Получаем пользователей
-            from_user = User.objects.filter(telegram_id=from_user_id).first()
-            to_user = User.objects.filter(telegram_id=to_user_id).first()
+            users = User.objects.in_bulk([from_user_id, to_user_id], field_name='telegram_id')
+            from_user = users.get(int(from_user_id))
+            to_user = users.get(int(to_user_id))
             
             if not from_user or not to_user:
                 return Response(
@@ -47,24 +64,25 @@ class SwipeView(APIView):
                 is_skip=is_skip
             )
             
-            result = {'success': True}
-            
-            # Проверяем на взаимный лайк
-            if not is_skip:
-                mutual_like = Like.objects.filter(
-                    from_user=to_user,
-                    to_user=from_user,
-                    is_skip=False
-                ).exists()
-                
-                if mutual_like:
-                    # Создаем мэтч
-                    match = Match.objects.create(
-                        user1=from_user,
-                        user2=to_user
-                    )
-                    result['match'] = True
+            # Результат свайпа и следующая анкета одним ответом для бота
+            result = {
+                'success': True,
+                'match': False,
+                'matched_profile': None,
+            }
             
+            # Взаимный лайк уже проверен в Like.save
+            if like.is_match:
+                # Создаем мэтч
+                Match.objects.create(
+                    user1=from_user,
+                    user2=to_user
+                )
+                result['match'] = True
+                result['matched_profile'] = profile_cards.get_card(to_user)
+
+            # Анкету снимаем с очереди последней: при ошибке свайпа она останется в очереди
+            result['next_profile'] = self.next_profile(from_user.telegram_id)
             return Response(result, status=status.HTTP_201_CREATED)
             
         except Exception as e:
@@ -74,6 +92,14 @@ class SwipeView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def next_profile(self, telegram_id):
+        """Следующая анкета из очереди зрителя; при ошибке бот возьмет ее сам"""
+        try:
+            return profile_queue.pop_profile_card(telegram_id)
+        except Exception as e:
+            logger.error(f"Error popping next profile for user {telegram_id}: {str(e)}")
+            return None
+
 class UserImagesView(APIView):
     permission_classes = [AllowAny]
     
@@ -104,7 +130,19 @@ router.register(r'matches', MatchViewSet)
 router.register(r'referrals', ReferralViewSet)
 router.register(r'images', UserImageViewSet, basename='images')
 
-urlpatterns = [
+urlpatterns = []
+if settings.ASYNC_HOT_VIEWS:
+    # Под ASGI горячие эндпоинты обслуживают async-представления (api/async_views.py);
+    # они стоят раньше роутера и отдают остальные запросы тем же представлениям DRF
+    from .async_views import AsyncMatchCheckView, AsyncSwipeView, AsyncUserImagesView, AsyncUserListView
+    urlpatterns += [
+        path('swipe/', AsyncSwipeView.as_view(), name='swipe-async'),
+        path('users/', AsyncUserListView.as_view(), name='user-list-async'),
+        path('matches/check/', AsyncMatchCheckView.as_view(), name='match-check-async'),
+        path('images/', AsyncUserImagesView.as_view(), name='user-images-async'),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
     # Добавляем специальные эндпоинты для бота
     path('swipe/', SwipeView.as_view(), name='swipe'),
@@ -2,7 +2,7 @@ import logging
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from .models import User, UserImage, Like, Match, Referral
 from .serializers import (
@@ -10,15 +10,15 @@ from .serializers import (
     UserImageSerializer,
     LikeSerializer,
     MatchSerializer,
-    ReferralSerializer
+    ReferralSerializer,
+    SwipeEventSerializer,
+    UserImageKeySerializer
 )
 from django.db.models import Q
 from rest_framework import serializers
 from rest_framework.generics import CreateAPIView
 from rest_framework.views import APIView
-import redis
-import json
-import os
+from . import feed, image_dedup, profile_cards, profile_queue, swipe_stream
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,8 +27,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
-
 
 class UserImageViewSet(viewsets.ModelViewSet):
     queryset = UserImage.objects.all()
@@ -62,8 +60,23 @@ class UserImageViewSet(viewsets.ModelViewSet):
             raise serializers.ValidationError({"image": "Файл должен быть изображением"})
         
         try:
+            # То же фото уже загружено: не создаем копию объекта в хранилище
+            image_hash = image_dedup.content_hash(image)
+            duplicate, is_own = image_dedup.find_duplicate(user, image_hash)
+            if is_own:
+                serializer.instance = duplicate
+                user.calculate_primary_rating()
+                logger.info(f"Image for user {telegram_id} already uploaded: {duplicate.image.name}")
+                return
+            if duplicate is not None:
+                instance = serializer.save(user=user, content_hash=image_hash, **image_dedup.shared_fields(duplicate))
+                # Новое фото пользователя - пересчитываем рейтинг, как и при загрузке
+                user.calculate_primary_rating()
+                logger.info(f"Reused stored image for user {telegram_id}: {instance.image.name}")
+                return
+
             # Сохраняем изображение
-            instance = serializer.save(user=user)
+            instance = serializer.save(user=user, content_hash=image_hash)
             
             # Проверяем, что файл действительно сохранился
             if not instance.image:
@@ -80,6 +93,42 @@ class UserImageViewSet(viewsets.ModelViewSet):
             
         except Exception as e:
             logger.error(f"Error saving image for user {telegram_id}: {str(e)}")
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser])
+    def register(self, request):
+        """
+        Регистрация фото, которое бот уже загрузил в MinIO: файл не проходит
+        через API, сохраняется только ключ объекта.
+        """
+        serializer = UserImageKeySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        telegram_id = serializer.validated_data['telegram_id']
+
+        try:
+            user = User.objects.get(telegram_id=telegram_id)
+        except User.DoesNotExist:
+            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        key = serializer.validated_data['key']
+        try:
+            stored = UserImage._meta.get_field('image').storage.exists(key)
+        except Exception as e:
+            logger.error(f"Error checking registered image {key}: {str(e)}")
+            stored = False
+        if not stored:
+            return Response({"key": "Объект не найден в хранилище"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Сам объект не читаем: хеш и поиск повторов - в задаче
+        # generate_image_renditions (сигнал на сохранение фото)
+        image = UserImage.objects.create(
+            user=user,
+            image=key,
+            is_main=not user.images.filter(is_main=True).exists()
+        )
+        # Пересчитываем рейтинг пользователя, как и при загрузке файла
+        user.calculate_primary_rating()
+        logger.info(f"Registered image for user {telegram_id}: {image.image.name}")
+        return Response(UserImageSerializer(image).data, status=status.HTTP_201_CREATED)
         
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -87,56 +136,53 @@ class UserViewSet(viewsets.ModelViewSet):
     lookup_field = 'telegram_id'
     permission_classes = [AllowAny]
 
-    def get_queryset(self):
-        queryset = User.objects.all()
-        if self.action == 'list':
-            # Фильтрация для поиска подходящих партнеров
-            exclude_user = self.request.query_params.get('exclude_user')
-            if exclude_user:
-                exclude_user = User.objects.get(telegram_id=exclude_user)
-                queryset = queryset.exclude(id=exclude_user.id)
-                
-                # Фильтруем по предпочтениям пола
-                queryset = queryset.filter(
-                    gender=exclude_user.seeking_gender,
-                    seeking_gender=exclude_user.gender
+    def list(self, request, *args, **kwargs):
+        # Подбор анкет для ленты пользователя
+        exclude_user = request.query_params.get('exclude_user')
+        if not exclude_user:
+            return super().list(request, *args, **kwargs)
+
+        exclude_user = User.objects.get(telegram_id=exclude_user)
+        limit = int(request.query_params.get('limit', 20))
+
+        # Явный курсор: постраничный обход ленты из базы без очереди в Redis
+        if 'cursor' in request.query_params:
+            cursor = request.query_params.get('cursor')
+            try:
+                cursor = feed.parse_cursor(cursor) if cursor else None
+            except ValueError:
+                return Response(
+                    {'error': 'cursor must look like <combined_rating>:<id>'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                
-                # Исключаем пользователей, с которыми уже есть лайки
-                liked_users = Like.objects.filter(
-                    from_user__telegram_id=exclude_user.telegram_id
-                ).values_list('to_user__telegram_id', flat=True)
-                queryset = queryset.exclude(telegram_id__in=liked_users)
-                
-                # Исключаем пользователей, с которыми уже есть мэтчи
-                matched_users = Match.objects.filter(
-                    Q(user1__telegram_id=exclude_user.telegram_id) | Q(user2__telegram_id=exclude_user.telegram_id),
-                    is_active=True
-                ).values_list('user1__telegram_id', 'user2__telegram_id')
-                matched_ids = set()
-                for user1, user2 in matched_users:
-                    matched_ids.add(user1)
-                    matched_ids.add(user2)
-                queryset = queryset.exclude(telegram_id__in=matched_ids)
-                
-                # Сортируем по рейтингу
-                queryset = queryset.order_by('-combined_rating')
-                
-                # Ограничиваем количество результатов
-                limit = int(self.request.query_params.get('limit', 20))
-                queryset = queryset[:limit]
-
-                try:
-                    redis_client = redis.from_url(REDIS_URL)
-                    profiles_data = [UserSerializer(profile).data for profile in queryset]
-                    queue_key = f"profile_queue:{exclude_user.telegram_id}"
-                    # Добавляем новые профили
-                    if profiles_data:
-                        redis_client.rpush(queue_key, *[json.dumps(profile) for profile in profiles_data])
-                        logger.info(f"Added {len(profiles_data)} profiles to queue for user {exclude_user.telegram_id}")
-                except Exception as e:
-                    logger.error(f"Error adding profiles to Redis queue: {str(e)}")
-        return queryset
+            profiles, next_cursor = feed.get_db_feed(exclude_user, limit, cursor)
+            return Response(
+                UserSerializer(profiles, many=True).data,
+                headers={'X-Next-Cursor': feed.format_cursor(next_cursor) if next_cursor else ''}
+            )
+
+        # Берем из ленты не больше анкет, чем поместится в очередь,
+        # иначе курсор уйдет дальше добавленных анкет
+        try:
+            limit = min(limit, profile_queue.free_slots(exclude_user.telegram_id))
+        except Exception as e:
+            logger.error(f"Error reading Redis queue length: {str(e)}")
+        if limit <= 0:
+            return Response([])
+
+        profiles = feed.build_feed(exclude_user, limit)
+        cards = profile_cards.build_cards(profiles)
+        try:
+            # Карточки кладем в общий кеш один раз, в очередь - только telegram_id
+            profile_cards.store_cards(cards)
+            added = profile_queue.push_profiles(
+                exclude_user.telegram_id,
+                [card['telegram_id'] for card in cards]
+            )
+            logger.info(f"Added {added} profiles to queue for user {exclude_user.telegram_id}")
+        except Exception as e:
+            logger.error(f"Error adding profiles to Redis queue: {str(e)}")
+        return Response(cards)
 
     @action(detail=True, methods=['post'])
     def upload_image(self, request, telegram_id=None):
@@ -154,6 +200,12 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+    @action(detail=True, methods=['get'])
+    def card(self, request, telegram_id=None):
+        """Карточка анкеты для ленты из общего кеша"""
+        user = self.get_object()
+        return Response(profile_cards.get_card(user))
+
     @action(detail=True, methods=['get'])
     def ratings(self, request, telegram_id=None):
         user = self.get_object()
@@ -199,20 +251,24 @@ class LikeViewSet(viewsets.ModelViewSet):
     serializer_class = LikeSerializer
     permission_classes = [AllowAny]
 
+    def create(self, request, *args, **kwargs):
+        if not swipe_stream.is_enabled():
+            return super().create(request, *args, **kwargs)
+
+        # Отложенная запись: событие уходит в поток, лайк и мэтч создаст потребитель
+        serializer = SwipeEventSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        swipe_stream.publish(**serializer.validated_data)
+        return Response({**serializer.validated_data, 'queued': True}, status=status.HTTP_202_ACCEPTED)
+
     def perform_create(self, serializer):
         like = serializer.save()
-        if not like.is_skip:
-            # Проверяем на взаимный лайк
-            mutual_like = Like.objects.filter(
-                from_user=like.to_user,
-                to_user=like.from_user,
-                is_skip=False
-            ).exists()
-            if mutual_like:
-                Match.objects.create(
-                    user1=like.from_user,
-                    user2=like.to_user
-                )
+        # Взаимный лайк уже проверен в Like.save
+        if like.is_match:
+            Match.objects.create(
+                user1=like.from_user,
+                user2=like.to_user
+            )
 
 class ReferralViewSet(viewsets.ModelViewSet):
     queryset = Referral.objects.all()
@@ -370,11 +426,25 @@ class UserImageView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            # То же фото уже загружено: не создаем копию объекта в хранилище
+            image_hash = image_dedup.content_hash(image_file)
+            duplicate, is_own = image_dedup.find_duplicate(user, image_hash)
+            if is_own:
+                return Response(UserImageSerializer(duplicate).data, status=status.HTTP_200_OK)
+
             # Создаем изображение
-            image = UserImage.objects.create(
-                user=user,
-                image=image_file
-            )
+            if duplicate is not None:
+                image = UserImage.objects.create(
+                    user=user,
+                    content_hash=image_hash,
+                    **image_dedup.shared_fields(duplicate)
+                )
+            else:
+                image = UserImage.objects.create(
+                    user=user,
+                    image=image_file,
+                    content_hash=image_hash
+                )
             
             # Если это первое изображение пользователя, делаем его главным
             if not UserImage.objects.filter(user=user, is_main=True).exists():
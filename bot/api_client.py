@@ -0,0 +1,114 @@
+import asyncio
+import os
+from typing import Any, Optional
+import aiohttp
+from bot.logger import logger
+
+API_URL = os.getenv('API_URL', 'http://web:8000')
+# Соединений с API одновременно (на все обработчики бота)
+API_POOL_LIMIT = int(os.getenv('API_POOL_LIMIT', '100'))
+# Таймаут одного запроса в секундах
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', '10'))
+# Повторы идемпотентных запросов при сетевых ошибках и 502/503/504
+API_RETRIES = int(os.getenv('API_RETRIES', '2'))
+API_RETRY_BACKOFF = float(os.getenv('API_RETRY_BACKOFF', '0.2'))
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE'}
+RETRY_STATUSES = {502, 503, 504}
+
+
+class APIError(Exception):
+    """Ошибка запроса к API: статус ответа или None при сетевой ошибке"""
+
+    def __init__(self, message: str, status: Optional[int] = None, data: Any = None):
+        super().__init__(message)
+        self.status = status
+        self.data = data
+
+
+class APIResponse:
+    def __init__(self, status: int, data: Any):
+        self.status = status
+        self.data = data
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise APIError(f"API responded with status {self.status}", self.status, self.data)
+        return self
+
+
+class APIClient:
+    """
+    Асинхронный клиент API поверх одной aiohttp.ClientSession:
+    общий пул keep-alive соединений, таймауты и повторы.
+    """
+
+    def __init__(self, base_url: str, pool_limit: int = API_POOL_LIMIT, timeout: float = API_TIMEOUT,
+                 retries: int = API_RETRIES, retry_backoff: float = API_RETRY_BACKOFF):
+        self.base_url = base_url.rstrip('/')
+        self.pool_limit = pool_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def connect(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_limit),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def request(self, method: str, path: str, *, timeout: Optional[float] = None,
+                      retries: Optional[int] = None, **kwargs) -> APIResponse:
+        """
+        Запрос к API. path - путь от корня API (/api/...). Возвращает ответ с
+        разобранным JSON; для статусов ошибок исключение не бросается.
+        """
+        await self.connect()
+        method = method.upper()
+        if retries is None:
+            # POST не повторяем: запрос мог дойти до API
+            retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+
+        url = f"{self.base_url}{path}"
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    if response.status in RETRY_STATUSES and attempt < retries:
+                        logger.warning(f"{method} {path} responded with {response.status}, retrying")
+                    else:
+                        return APIResponse(response.status, await self._read(response))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    raise APIError(f"{method} {path} failed: {str(e) or type(e).__name__}") from e
+                logger.warning(f"{method} {path} failed: {str(e) or type(e).__name__}, retrying")
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+    @staticmethod
+    async def _read(response: aiohttp.ClientResponse) -> Any:
+        if response.content_type == 'application/json':
+            return await response.json()
+        return await response.text()
+
+    async def get(self, path: str, **kwargs) -> APIResponse:
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> APIResponse:
+        return await self.request('POST', path, **kwargs)
+
+    async def patch(self, path: str, **kwargs) -> APIResponse:
+        return await self.request('PATCH', path, **kwargs)
+
+
+api_client = APIClient(API_URL)
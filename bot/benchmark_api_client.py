@@ -0,0 +1,85 @@
+"""
+Бенчмарк обработчиков бота против медленного API.
+
+Поднимает локальную заглушку API с задержкой ответа и запускает одновременно
+N обработчиков: с синхронным requests (блокирует цикл событий) и с общим
+асинхронным клиентом bot.api_client.
+
+    python -m bot.benchmark_api_client --handlers 200 --delay 0.1
+"""
+import argparse
+import asyncio
+import threading
+import time
+import requests
+from aiohttp import web
+from bot.api_client import APIClient
+
+
+def start_stub_api(delay: float, port: int) -> None:
+    """Заглушка API в отдельном потоке, чтобы ее не блокировали обработчики"""
+    async def handle(request):
+        await asyncio.sleep(delay)
+        return web.json_response({'telegram_id': 1, 'name': 'stub'})
+
+    async def serve():
+        app = web.Application()
+        app.router.add_get('/api/users/{telegram_id}/', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port, backlog=1024).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    ready.wait()
+
+
+async def run_blocking(base_url: str, handlers: int) -> float:
+    async def handler(user_id):
+        requests.get(f"{base_url}/api/users/{user_id}/", timeout=30).json()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(i) for i in range(handlers)))
+    return time.perf_counter() - started
+
+
+async def run_async(base_url: str, handlers: int, pool_limit: int) -> float:
+    client = APIClient(base_url, pool_limit=pool_limit, timeout=30)
+    await client.connect()
+    # Прогрев пула соединений не входит в замер
+    await client.get("/api/users/0/")
+
+    async def handler(user_id):
+        (await client.get(f"/api/users/{user_id}/")).raise_for_status()
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(handler(i) for i in range(handlers)))
+        return time.perf_counter() - started
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handlers', type=int, default=200, help='Одновременных обработчиков')
+    parser.add_argument('--delay', type=float, default=0.1, help='Задержка ответа заглушки в секундах')
+    parser.add_argument('--pool-limit', type=int, default=100, help='Размер пула соединений клиента')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    start_stub_api(args.delay, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    for name, run in (
+        ('requests', lambda: run_blocking(base_url, args.handlers)),
+        ('api_client', lambda: run_async(base_url, args.handlers, args.pool_limit)),
+    ):
+        seconds = asyncio.run(run())
+        print(f"{name:>10}: {args.handlers} handlers in {seconds:.2f} s, {args.handlers / seconds:,.1f} handlers/s")
+
+
+if __name__ == '__main__':
+    main()
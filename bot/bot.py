@@ -1,16 +1,25 @@
 import asyncio
 from bot.config import bot, dp
 from bot.storage.redis import queue_manager
+from bot.prefetch import load_profile_card
+from bot.api_client import api_client
+from bot.match_notifications import consume_match_events
 from bot.handlers.common_handlers import *
 from bot.handlers.profile_handlers import *
 from bot.handlers.matching_handlers import *
 from bot.handlers.referral import *
 
 async def main():
+    queue_manager.card_loader = load_profile_card
     await queue_manager.connect()
+    await api_client.connect()
+    # Уведомления о мэтчах из потока свайпов (SWIPE_INGESTION_MODE=stream)
+    match_events = asyncio.create_task(consume_match_events())
     try:
         await dp.start_polling(bot)
     finally:
+        match_events.cancel()
+        await api_client.close()
         await queue_manager.disconnect()
 
 if __name__ == '__main__':
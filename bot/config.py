@@ -8,5 +8,8 @@ load_dotenv()
 API_URL = os.getenv('API_URL', 'http://web:8000')
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+# Когда в очереди анкет остается меньше этого числа, бот пополняет ее в фоне
+PROFILE_QUEUE_LOW_WATERMARK = int(os.getenv('PROFILE_QUEUE_LOW_WATERMARK', '5'))
+
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage()) 
+dp = Dispatcher(storage=MemoryStorage())
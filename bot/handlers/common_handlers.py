@@ -1,17 +1,17 @@
 from aiogram import types
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
-from bot.config import dp, API_URL
+from bot.config import dp
 from bot.handlers.states import ProfileStates
-import requests
+from bot.api_client import api_client
 from bot.logger import logger
 
 @dp.message(Command("start"))
 async def start_cmd(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    response = requests.get(f"{API_URL}/api/users/{user_id}/")
+    response = await api_client.get(f"/api/users/{user_id}/")
     
-    if response.status_code == 200:
+    if response.status == 200:
         await message.answer(
             "🎉 Добро пожаловать назад! Ваш профиль уже создан.\n\n"
             "Доступные команды:\n"
@@ -23,7 +23,7 @@ async def start_cmd(message: types.Message, state: FSMContext):
     args = message.text.split()
     referrer_id = args[1] if len(args) > 1 else None
     if referrer_id:
-        requests.post(f"{API_URL}/api/referrals/", data={"referrer": referrer_id, "referred_user": message.from_user.id})
+        await api_client.post("/api/referrals/", data={"referrer": referrer_id, "referred_user": message.from_user.id})
     await message.answer(
         "👋 Привет! Давай создадим твой профиль для знакомств.\n"
         "📛 Как тебя зовут? (Используй реальное имя для доверия)"
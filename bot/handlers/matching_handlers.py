@@ -1,13 +1,16 @@
 from aiogram import types, F
 from aiogram.client import bot
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from typing import Optional
 import aiohttp
 import logging
-from bot.config import dp, API_URL, bot
+from bot.config import dp, bot
 from bot.storage.redis import queue_manager
 from bot.storage.minio import download_image_from_minio
-import requests
+from bot.prefetch import schedule_refill, prefetch_if_low
+from bot.api_client import APIError, api_client
 from urllib.parse import urlparse
 from bot.logger import logger
 import asyncio
@@ -16,83 +19,106 @@ logger = logging.getLogger(__name__)
 
 @dp.message(Command("next"))
 async def next_profile(message: types.Message):
-    user_id = message.from_user.id
+    await show_next_profile(message, message.from_user.id)
 
+async def show_next_profile(message: types.Message, user_id: int):
     try:
-        # Получаем список пользователей
-        response = requests.get(f"{API_URL}/api/users/?exclude_user={user_id}")
-        if response.status_code != 200:
-            logger.error(f"API request failed with status {response.status_code}")
-            await message.answer("😔 Произошла ошибка при загрузке анкет. Попробуйте позже!")
-            return
-
+        # Берем анкету из очереди сразу, без запроса к API
         profile = await queue_manager.get_next_profile(user_id)
 
+        if not profile:
+            # Очередь пуста (например, первый запуск) - ждем пополнения
+            if not await schedule_refill(user_id):
+                await message.answer("😔 Произошла ошибка при загрузке анкет. Попробуйте позже!")
+                return
+            profile = await queue_manager.get_next_profile(user_id)
+
+        # Очередь подходит к концу - пополняем ее в фоне
+        await prefetch_if_low(user_id)
+
         if not profile:
             await message.answer("😔 Пока нет новых анкет. Попробуйте позже!")
             return
-        
-        # Проверяем наличие изображений
-        if not profile.get('images'):
-            await message.answer("😔 У этого пользователя нет фотографий.")
-            return
-            
-        # Загружаем фото из MinIO
-        image_url = profile['images'][0]['image'].replace("https://http://minio:9000/media/", "")
-        # Извлекаем путь к файлу из URL
-        
-        logger.info(f"Trying to download image from path: {image_url}")
-        photo_data = await download_image_from_minio(image_url)
-        
-        if not photo_data:
-            await message.answer("😔 Не удалось загрузить фотографию пользователя.")
-            return
-        
-        # Создаем клавиатуру с кнопками
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="❤️", callback_data=f"like_{profile['telegram_id']}"),
-                    InlineKeyboardButton(text="➡️", callback_data=f"skip_{profile['telegram_id']}")
-                ]
-            ]
-        )
-        
-        # Отправляем анкету
-        await message.answer_photo(
-            photo_data,
-            caption=f"👤 {profile['name']}, {profile['age']}\n"
-                   f"🏙 {profile['city']}\n\n"
-                   f"📝 {profile['bio']}",
-            reply_markup=keyboard
-        )
-    except requests.RequestException as e:
-        logger.error(f"Network error: {str(e)}")
-        await message.answer("😔 Произошла ошибка при подключении к серверу. Попробуйте позже!")
+
+        await send_profile(message, profile)
     except Exception as e:
         logger.error(f"Error showing profile: {str(e)}")
         await message.answer("😔 Произошла ошибка при отображении анкеты. Попробуйте позже!")
 
+async def answer_profile_photo(message: types.Message, image: dict, **kwargs) -> Optional[types.Message]:
+    """
+    Отправить фото анкеты. Уже загруженное в Telegram фото отправляется по
+    file_id, иначе байты берутся из MinIO, а полученный file_id запоминается.
+    """
+    file_id = await queue_manager.get_file_id(image['id'])
+    if file_id:
+        try:
+            return await message.answer_photo(file_id, **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning(f"Cached file_id of image {image['id']} rejected: {str(e)}")
+            await queue_manager.forget_file_id(image['id'])
+
+    # Загружаем фото из MinIO: уменьшенную копию для ленты, если она уже готова
+    image_url = (image.get('card_url') or image['image']).replace("https://http://minio:9000/media/", "")
+    # Извлекаем путь к файлу из URL
+    
+    logger.info(f"Trying to download image from path: {image_url}")
+    photo_data = await download_image_from_minio(image_url)
+    
+    if not photo_data:
+        return None
+
+    sent = await message.answer_photo(photo_data, **kwargs)
+    await queue_manager.save_file_id(image['id'], sent.photo[-1].file_id)
+    return sent
+
+async def send_profile(message: types.Message, profile: dict):
+    """Отправить карточку анкеты с кнопками лайка и пропуска"""
+    # Проверяем наличие изображений
+    if not profile.get('images'):
+        await message.answer("😔 У этого пользователя нет фотографий.")
+        return
+    
+    # Создаем клавиатуру с кнопками
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="❤️", callback_data=f"like_{profile['telegram_id']}"),
+                InlineKeyboardButton(text="➡️", callback_data=f"skip_{profile['telegram_id']}")
+            ]
+        ]
+    )
+    
+    # Отправляем анкету
+    sent = await answer_profile_photo(
+        message,
+        profile['images'][0],
+        caption=f"👤 {profile['name']}, {profile['age']}\n"
+               f"🏙 {profile['city']}\n\n"
+               f"📝 {profile['bio']}",
+        reply_markup=keyboard
+    )
+    if not sent:
+        await message.answer("😔 Не удалось загрузить фотографию пользователя.")
+
 @dp.message(Command("matches"))
 async def show_matches(message: types.Message):
     user_id = message.from_user.id
     
     try:
-        response = requests.get(f"{API_URL}/api/matches/{user_id}/")
-        response.raise_for_status()
-        matches = response.json()
+        response = await api_client.get(f"/api/matches/{user_id}/")
+        matches = response.raise_for_status().data
         
         if not matches:
             await message.answer("😔 У вас пока нет мэтчей.")
             return
         
         for match in matches:
-            # Загружаем фото из MinIO
-            photo_data = await download_image_from_minio(match['images'][0]['image'])
             match_username = bot.get_chat(match['telegram_id'])
             
-            await message.answer_photo(
-                photo_data,
+            await answer_profile_photo(
+                message,
+                match['images'][0],
                 caption=f"👤 {match['name']}, {match['age']}\n"
                        f"🏙 {match['city']}\n\n"
                        f"📝 {match['bio']}\n\n"
@@ -107,62 +133,64 @@ async def show_matches(message: types.Message):
 async def process_profile_action(callback_query: types.CallbackQuery):
     user_id = callback_query.from_user.id
     action, profile_id = callback_query.data.split('_')
+    # Анкета, которую API уже снял с очереди, но бот еще не показал
+    next_profile = None
     
     try:
-        # Отправляем лайк или пропуск
-        response = requests.post(
-            f"{API_URL}/api/likes/",
+        # Один запрос: свайп, проверка мэтча и следующая анкета из очереди
+        response = await api_client.post(
+            "/api/swipe/",
             json={
                 'from_user': user_id,
                 'to_user': profile_id,
                 'is_skip': action == 'skip'
             }
         )
-        response.raise_for_status()
+        result = response.raise_for_status().data
+        next_profile = result.get('next_profile')
         
-        if action == 'like':
-            # Проверяем, есть ли мэтч
-            response = requests.get(
-                f"{API_URL}/api/matches/check/",
-                params={
-                    'user1': user_id,
-                    'user2': profile_id
-                }
-            )
-            response.raise_for_status()
-            is_match = response.json()['is_match']
+        if result.get('match'):
+            match = result['matched_profile']
+
+            match_username = (await bot.get_chat(callback_query.from_user.id)).username
+            match_to_username = (await bot.get_chat(profile_id)).username
             
-            if is_match:
-                # Получаем данные о мэтче
-                response = requests.get(f"{API_URL}/api/users/{profile_id}/")
-                response.raise_for_status()
-                match = response.json()
-
-                match_username = (await bot.get_chat(callback_query.from_user.id)).username
-                match_to_username = (await bot.get_chat(profile_id)).username
-                
-                # Отправляем сообщение о мэтче
-                await bot.send_message(
-                    profile_id,
-                    f"🎉 У вас мэтч с {callback_query.from_user.first_name}!\n"
-                    f"💬 Напишите @{match_username} в Telegram"
-                )
-                await callback_query.message.answer(
-                    f"🎉 У вас мэтч с {match['name']}!\n"
-                    f"💬 Напишите @{match_to_username} в Telegram"
-                )
-            else:
-                await callback_query.message.answer("✅ Лайк отправлен!")
-        
+            # Отправляем сообщение о мэтче
+            await bot.send_message(
+                profile_id,
+                f"🎉 У вас мэтч с {callback_query.from_user.first_name}!\n"
+                f"💬 Напишите @{match_username} в Telegram"
+            )
+            await callback_query.message.answer(
+                f"🎉 У вас мэтч с {match['name']}!\n"
+                f"💬 Напишите @{match_to_username} в Telegram"
+            )
+        elif action == 'like':
+            # Свайп, принятый в поток (queued), еще не записан: о мэтче
+            # сообщит bot/match_notifications.py после его обработки
+            await callback_query.message.answer("✅ Лайк отправлен!")
         else:  # skip
             await callback_query.message.answer("➡️ Следующая анкета...")
         
         # Удаляем сообщение с анкетой
         await callback_query.message.delete()
+
+        # Следующая анкета уже пришла в ответе; если очередь была пуста - обычный путь /next
+        if next_profile:
+            await prefetch_if_low(user_id)
+            await send_profile(callback_query.message, next_profile)
+            next_profile = None
+        else:
+            await show_next_profile(callback_query.message, user_id)
         
-    except requests.exceptions.RequestException as e:
+    except APIError as e:
         logger.error(f"API request error: {str(e)}")
         await callback_query.message.answer("😔 Произошла ошибка при отправке действия. Попробуйте позже!")
     except Exception as e:
         logger.error(f"Error processing profile action: {str(e)}")
-        await callback_query.message.answer("😔 Произошла ошибка при обработке действия. Попробуйте позже!") 
+        await callback_query.message.answer("😔 Произошла ошибка при обработке действия. Попробуйте позже!")
+    finally:
+        # Анкета не показана - возвращаем ее в очередь, чтобы /next показал ее снова
+        if next_profile:
+            await queue_manager.return_profile(user_id, next_profile['telegram_id'])
+
@@ -1,11 +1,13 @@
+import uuid
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from aiogram.filters.command import Command
-from bot.config import dp, bot, API_URL
+from bot.config import dp, bot
 from bot.handlers.states import ProfileStates
-import requests
+from bot.storage.redis import queue_manager
+from bot.api_client import api_client
+from bot.storage.minio import upload_stream
 from bot.logger import logger
-import os
 
 @dp.message(Command("edit"))
 async def edit_profile(message: types.Message, state: FSMContext):
@@ -101,6 +103,9 @@ async def process_photos(message: types.Message, state: FSMContext):
             if not data.get('photos_uploaded'):
                 await message.answer("📸 Для завершения профиля нужно добавить хотя бы одно фото!")
                 return
+
+            # Предпочтения могли измениться - лента начнется заново
+            await queue_manager.reset_feed(message.from_user.id)
             
             await message.answer(
                 "🎉 Профиль успешно создан!\n\n"
@@ -129,16 +134,16 @@ async def process_photos(message: types.Message, state: FSMContext):
         
         try:
             # Сначала проверяем, существует ли пользователь
-            check_response = requests.get(f"{API_URL}/api/users/{message.from_user.id}/")
-            if check_response.status_code == 200:
+            check_response = await api_client.get(f"/api/users/{message.from_user.id}/")
+            if check_response.status == 200:
                 # Пользователь уже существует, обновляем данные
-                response = requests.patch(
-                    f"{API_URL}/api/users/{message.from_user.id}/",
+                response = await api_client.patch(
+                    f"/api/users/{message.from_user.id}/",
                     json=user_data
                 )
             else:
                 # Создаем нового пользователя
-                response = requests.post(f"{API_URL}/api/users/", json=user_data)
+                response = await api_client.post("/api/users/", json=user_data)
             
             response.raise_for_status()
             
@@ -153,29 +158,27 @@ async def process_photos(message: types.Message, state: FSMContext):
     # Загрузка фото
     photo = message.photo[-1]
     file_info = await bot.get_file(photo.file_id)
-    file_url = f"https://api.telegram.org/file/bot{os.getenv('TELEGRAM_BOT_TOKEN')}/{file_info.file_path}"
     
     try:
-        # Загружаем фото с указанием telegram_id
-        with requests.get(file_url, stream=True) as image:
-            files = {
-                'image': (file_info.file_path, image.raw, 'image/jpeg'),
-                'telegram_id': (None, str(message.from_user.id))
-            }
-            response = requests.post(
-                f"{API_URL}/api/images/",
-                files=files
-            )
-            response.raise_for_status()
-            
-            # Обновляем счетчик загруженных фото
-            photos_uploaded = data.get('photos_uploaded', 0) + 1
-            await state.update_data(photos_uploaded=photos_uploaded)
-            
-            await message.answer(
-                f"✅ Фото успешно добавлено! ({photos_uploaded}/5)\n"
-                "Отправьте еще фото или напишите /done для завершения"
-            )
+        # Фото идет из Telegram прямо в MinIO, API получает только ключ объекта
+        key = f"user_images/{message.from_user.id}/{uuid.uuid4().hex}.jpg"
+        chunks = bot.session.stream_content(bot.session.api.file_url(bot.token, file_info.file_path))
+        await upload_stream(key, chunks, file_info.file_size)
+        # Повторы фото находит задача Celery по содержимому объекта
+        response = await api_client.post(
+            "/api/images/register/",
+            json={'telegram_id': message.from_user.id, 'key': key}
+        )
+        response.raise_for_status()
+        
+        # Обновляем счетчик загруженных фото
+        photos_uploaded = data.get('photos_uploaded', 0) + 1
+        await state.update_data(photos_uploaded=photos_uploaded)
+        
+        await message.answer(
+            f"✅ Фото успешно добавлено! ({photos_uploaded}/5)\n"
+            "Отправьте еще фото или напишите /done для завершения"
+        )
     except Exception as e:
         logger.error(f"Photo upload error: {str(e)}")
         await message.answer("🚫 Ошибка загрузки фото! Попробуйте снова.") 
@@ -0,0 +1,74 @@
+import asyncio
+import redis.asyncio as redis
+from common.match_events import MATCH_EVENTS_KEY, MATCH_NOTIFY_GROUP
+from bot.config import bot
+from bot.logger import logger
+from bot.storage.redis import queue_manager
+
+# В режиме SWIPE_INGESTION_MODE=stream ответ на свайп приходит до записи в базу,
+# поэтому о мэтче пользователи узнают из потока match_events (common/match_events.py).
+# Бот запущен одним процессом, поэтому потребитель в группе один.
+CONSUMER_NAME = 'bot'
+BATCH_SIZE = 50
+BLOCK_MS = 5000
+
+
+async def ensure_group():
+    try:
+        await queue_manager.redis.xgroup_create(MATCH_EVENTS_KEY, MATCH_NOTIFY_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+async def match_username(telegram_id: int) -> str:
+    return (await bot.get_chat(telegram_id)).username
+
+
+async def notify_match(user1: int, user2: int) -> None:
+    """Сообщить обоим пользователям о мэтче"""
+    for recipient, partner in ((user1, user2), (user2, user1)):
+        try:
+            profile = await queue_manager.get_profile_card(partner)
+            if not profile:
+                continue
+            await bot.send_message(
+                recipient,
+                f"🎉 У вас мэтч с {profile['name']}!\n"
+                f"💬 Напишите @{await match_username(partner)} в Telegram"
+            )
+        except Exception as e:
+            # Пользователь мог заблокировать бота - событие все равно подтверждаем
+            logger.error(f"Error notifying user {recipient} about match with {partner}: {str(e)}")
+
+
+async def consume_match_events() -> None:
+    """Фоновая задача бота: рассылает уведомления о мэтчах из потока"""
+    if not queue_manager.connected:
+        await queue_manager.connect()
+    await ensure_group()
+
+    # Сначала события, полученные до перезапуска, но не подтвержденные
+    last_id = '0'
+    while True:
+        try:
+            response = await queue_manager.redis.xreadgroup(
+                MATCH_NOTIFY_GROUP, CONSUMER_NAME, {MATCH_EVENTS_KEY: last_id},
+                count=BATCH_SIZE, block=BLOCK_MS
+            )
+            entries = response[0][1] if response else []
+            if not entries and last_id == '0':
+                last_id = '>'
+                continue
+
+            for entry_id, fields in entries:
+                # Событие, удаленное из потока по MAXLEN, приходит без полей
+                if fields:
+                    await notify_match(int(fields['user1']), int(fields['user2']))
+                await queue_manager.redis.xack(MATCH_EVENTS_KEY, MATCH_NOTIFY_GROUP, entry_id)
+                await queue_manager.redis.xdel(MATCH_EVENTS_KEY, entry_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading match events: {str(e)}")
+            await asyncio.sleep(1)
@@ -0,0 +1,55 @@
+import asyncio
+from typing import Optional
+from bot.api_client import APIError, api_client
+from bot.config import PROFILE_QUEUE_LOW_WATERMARK
+from bot.storage.redis import queue_manager
+from bot.logger import logger
+
+# Текущие пополнения очередей: не больше одного запроса к API на пользователя
+_refills: dict = {}
+
+
+async def refill_queue(user_id: int) -> bool:
+    """Просит API дописать новую порцию анкет в очередь пользователя"""
+    try:
+        response = await api_client.get("/api/users/", params={'exclude_user': user_id})
+    except APIError as e:
+        logger.error(f"Network error refilling queue for user {user_id}: {str(e)}")
+        return False
+
+    if response.status != 200:
+        logger.error(f"Queue refill for user {user_id} failed with status {response.status}")
+        return False
+    return True
+
+
+def schedule_refill(user_id: int) -> asyncio.Task:
+    """Запускает пополнение очереди в фоне или возвращает уже запущенное"""
+    task = _refills.get(user_id)
+    if task and not task.done():
+        return task
+
+    task = asyncio.create_task(refill_queue(user_id))
+    _refills[user_id] = task
+
+    def forget(finished):
+        if _refills.get(user_id) is finished:
+            del _refills[user_id]
+
+    task.add_done_callback(forget)
+    return task
+
+
+async def prefetch_if_low(user_id: int) -> None:
+    """Фоновое пополнение, если очередь опустилась ниже порога"""
+    length = await queue_manager.get_queue_length(user_id)
+    if length < PROFILE_QUEUE_LOW_WATERMARK:
+        schedule_refill(user_id)
+
+
+async def load_profile_card(profile_id: int) -> Optional[dict]:
+    """Карточка анкеты из API, когда ее нет в кеше Redis (None - анкета удалена)"""
+    response = await api_client.get(f"/api/users/{profile_id}/card/")
+    if response.status == 404:
+        return None
+    return response.raise_for_status().data
@@ -1,8 +1,10 @@
-import io
+import asyncio
 import os
-from io import BytesIO
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
 from minio import Minio
+from minio.error import S3Error
 from aiogram.types import BufferedInputFile
 from bot.logger import logger
 
@@ -11,6 +13,10 @@ MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT', 'minio:9000')
 MINIO_ACCESS_KEY = os.getenv('MINIO_ACCESS_KEY', 'minioadmin')
 MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY', 'minioadmin')
 MINIO_BUCKET = os.getenv('MINIO_BUCKET', 'media')
+# Сколько байт популярных фотографий держать в памяти бота
+MINIO_IMAGE_CACHE_BYTES = int(os.getenv('MINIO_IMAGE_CACHE_BYTES', str(64 * 1024 * 1024)))
+# Сколько байт загружаемого файла держать между Telegram и MinIO
+MINIO_UPLOAD_BUFFER_BYTES = int(os.getenv('MINIO_UPLOAD_BUFFER_BYTES', str(256 * 1024)))
 
 # Инициализация клиента MinIO
 minio_client = Minio(
@@ -20,6 +26,76 @@ minio_client = Minio(
     secure=False  # Используем HTTP вместо HTTPS
 )
 
+
+class ImageCache:
+    """LRU-кеш байтов изображений с ограничением по суммарному размеру"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self.items.get(key)
+        if data is not None:
+            self.items.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        self.pop(key)
+        self.items[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted)
+
+    def pop(self, key: str) -> None:
+        data = self.items.pop(key, None)
+        if data is not None:
+            self.size -= len(data)
+
+
+image_cache = ImageCache(MINIO_IMAGE_CACHE_BYTES)
+# Загрузки в процессе: одновременные запросы одной фотографии ждут одну загрузку
+_downloads: dict = {}
+
+
+def _read_object(image_path: str) -> Optional[bytes]:
+    """Один GET без stat_object; соединение возвращается в пул"""
+    try:
+        response = minio_client.get_object(MINIO_BUCKET, image_path)
+    except S3Error as e:
+        if e.code == 'NoSuchKey':
+            logger.error(f"Image not found in storage: {image_path}")
+            return None
+        raise
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+async def read_image(image_path: str) -> Optional[bytes]:
+    """Байты изображения из кеша или из MinIO (блокирующий клиент работает в потоке)"""
+    data = image_cache.get(image_path)
+    if data is not None:
+        return data
+
+    download = _downloads.get(image_path)
+    if download is None:
+        download = asyncio.ensure_future(asyncio.to_thread(_read_object, image_path))
+        _downloads[image_path] = download
+        download.add_done_callback(lambda _: _downloads.pop(image_path, None))
+
+    data = await download
+    if data is not None:
+        image_cache.put(image_path, data)
+    return data
+
+
 async def download_image_from_minio(image_path: str) -> Optional[BufferedInputFile]:
     """Скачивает изображение из MinIO и возвращает BufferedInputFile"""
     try:
@@ -28,18 +104,92 @@ async def download_image_from_minio(image_path: str) -> Optional[BufferedInputFi
             logger.error("Empty image path provided")
             return None
 
-        # Check if object exists first
-        try:
-            minio_client.stat_object(MINIO_BUCKET, image_path)
-        except Exception as e:
-            logger.error(f"Image not found in storage: {image_path}")
+        data = await read_image(image_path)
+        if data is None:
             return None
-
-        # Use in-memory buffer instead of temp file
-        buffer = minio_client.get_object(MINIO_BUCKET, image_path)
-        
-        return BufferedInputFile(io.BytesIO(buffer.read()).getvalue(), filename=image_path)
+        return BufferedInputFile(data, filename=image_path)
 
     except Exception as e:
         logger.error(f"MinIO error: {str(e)}")
         return None
+
+
+class StreamReader:
+    """
+    Файловый объект для put_object поверх потока кусков из цикла событий.
+    Буфер ограничен: пишущий ждет, пока MinIO не заберет прочитанное.
+    """
+
+    def __init__(self, max_buffer: int = MINIO_UPLOAD_BUFFER_BYTES):
+        self.max_buffer = max_buffer
+        self.buffer = bytearray()
+        self.eof = False
+        self.error: Optional[BaseException] = None
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, chunk: bytes) -> None:
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.buffer) < self.max_buffer or self.closed)
+            if self.closed:
+                raise IOError("Upload stream is closed")
+            self.buffer += chunk
+            self.condition.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self.condition:
+            self.eof = True
+            self.error = error
+            self.condition.notify_all()
+
+    def read(self, size: int = -1) -> bytes:
+        with self.condition:
+            self.condition.wait_for(lambda: self.buffer or self.eof)
+            if self.error is not None:
+                raise IOError("Source stream failed") from self.error
+            if size < 0 or size > len(self.buffer):
+                size = len(self.buffer)
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            self.condition.notify_all()
+            return data
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+def _put_stream(object_name: str, reader: StreamReader, length: int, content_type: str) -> None:
+    try:
+        minio_client.put_object(MINIO_BUCKET, object_name, reader, length, content_type=content_type)
+    finally:
+        # Если MinIO ответил ошибкой, пишущий не должен ждать вечно
+        reader.close()
+
+
+async def upload_stream(object_name: str, chunks: AsyncIterator[bytes], length: int,
+                        content_type: str = 'image/jpeg') -> None:
+    """
+    Загружает в MinIO поток кусков (например, файл из Telegram) без сборки
+    файла в памяти бота. length - точный размер файла.
+    """
+    reader = StreamReader()
+    upload = asyncio.ensure_future(asyncio.to_thread(_put_stream, object_name, reader, length, content_type))
+    try:
+        async for chunk in chunks:
+            if upload.done():
+                break
+            await asyncio.to_thread(reader.write, chunk)
+        reader.finish()
+    except asyncio.CancelledError as e:
+        reader.finish(e)
+        raise
+    except Exception as e:
+        reader.finish(e)
+        await asyncio.wait([upload])
+        if upload.exception() is not None:
+            # Поток закрыт из-за ошибки MinIO - сообщаем именно о ней
+            raise upload.exception() from e
+        raise
+    await upload
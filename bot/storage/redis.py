@@ -1,17 +1,34 @@
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 import json
 import os
 import redis.asyncio as redis
 from bot.logger import logger
+from common.queue_scripts import (
+    PROFILE_QUEUE_MAX_LENGTH,
+    PROFILE_QUEUE_TTL,
+    PUSH_PROFILES_SCRIPT,
+    POP_PROFILE_SCRIPT,
+    RETURN_PROFILE_SCRIPT,
+    PROFILE_CARD_TTL,
+    TELEGRAM_FILE_IDS_KEY,
+    get_queue_key,
+    get_queue_members_key,
+    get_card_key,
+)
 
 REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 
 
 class ProfileQueueManager:
-    def __init__(self, redis_url: str):
+    def __init__(self, redis_url: str, card_loader: Optional[Callable[[int], Awaitable[Optional[dict]]]] = None):
         self.redis_url = redis_url
+        # Загружает карточку анкеты из API, если ее нет в общем кеше
+        self.card_loader = card_loader
         self.redis = None
         self.connected = False
+        self.push_profiles_script = None
+        self.pop_profile_script = None
+        self.return_profile_script = None
 
     async def connect(self):
         if not self.connected:
@@ -22,6 +39,9 @@ class ProfileQueueManager:
                     decode_responses=True
                 )
                 await self.redis.ping()
+                self.push_profiles_script = self.redis.register_script(PUSH_PROFILES_SCRIPT)
+                self.pop_profile_script = self.redis.register_script(POP_PROFILE_SCRIPT)
+                self.return_profile_script = self.redis.register_script(RETURN_PROFILE_SCRIPT)
                 self.connected = True
                 logger.info("Successfully connected to Redis")
             except Exception as e:
@@ -39,27 +59,74 @@ class ProfileQueueManager:
                 logger.error(f"Error disconnecting from Redis: {str(e)}")
 
     def get_queue_key(self, user_id: int) -> str:
-        return f"profile_queue:{user_id}"
+        return get_queue_key(user_id)
+
+    def get_queue_members_key(self, user_id: int) -> str:
+        return get_queue_members_key(user_id)
+
+    def get_cursor_key(self, user_id: int) -> str:
+        # Позицию в ленте ведет API (api/feed.py), бот только сбрасывает ее
+        return f"feed_cursor:{user_id}"
+
+    async def reset_feed(self, user_id: int) -> None:
+        """Начать ленту заново: очистить очередь и позицию (например, после смены анкеты)"""
+        if not self.connected:
+            await self.connect()
+
+        try:
+            await self.redis.delete(
+                self.get_queue_key(user_id),
+                self.get_queue_members_key(user_id),
+                self.get_cursor_key(user_id)
+            )
+        except Exception as e:
+            logger.error(f"Error resetting feed: {str(e)}")
+
+    async def _pop_profile(self, user_id: int) -> Optional[dict]:
+        keys = [self.get_queue_key(user_id), self.get_queue_members_key(user_id)]
+        while True:
+            profile_id = await self.pop_profile_script(keys=keys)
+            if not profile_id:
+                return None
+
+            profile = await self.get_profile_card(int(profile_id))
+            if profile:
+                return profile
+            # Анкета удалена - берем следующую
+
+    async def get_profile_card(self, profile_id: int) -> Optional[dict]:
+        card = await self.redis.get(get_card_key(profile_id))
+        if card:
+            return json.loads(card)
+        if self.card_loader:
+            return await self.card_loader(profile_id)
+        return None
 
     async def get_next_profile(self, user_id: int) -> Optional[dict]:
         if not self.connected:
             await self.connect()
             
-        queue_key = self.get_queue_key(user_id)
         try:
-            profile_data = await self.redis.lpop(queue_key)
-            if profile_data:
-                return json.loads(profile_data)
-            return None
+            return await self._pop_profile(user_id)
         except Exception as e:
             logger.error(f"Error getting next profile: {str(e)}")
             self.connected = False
             await self.connect()
             # Повторная попытка
-            profile_data = await self.redis.lpop(queue_key)
-            if profile_data:
-                return json.loads(profile_data)
-            return None
+            return await self._pop_profile(user_id)
+
+    async def return_profile(self, user_id: int, profile_id: int) -> None:
+        """Вернуть в начало очереди анкету, которую взяли, но не смогли показать"""
+        if not self.connected:
+            await self.connect()
+
+        try:
+            await self.return_profile_script(
+                keys=[self.get_queue_key(user_id), self.get_queue_members_key(user_id)],
+                args=[PROFILE_QUEUE_TTL, profile_id]
+            )
+        except Exception as e:
+            logger.error(f"Error returning profile {profile_id} to queue: {str(e)}")
 
     async def get_queue_length(self, user_id: int) -> int:
         if not self.connected:
@@ -76,16 +143,54 @@ class ProfileQueueManager:
         if not self.connected:
             await self.connect()
             
-        queue_key = self.get_queue_key(user_id)
+        if not profiles:
+            return
+
         try:
-            # Добавляем профили в очередь
+            # Карточки кладем в общий кеш, в очередь - только telegram_id без дублей
+            pipe = self.redis.pipeline(transaction=False)
             for profile in profiles:
-                await self.redis.rpush(queue_key, json.dumps(profile))
-            logger.info(f"Added {len(profiles)} profiles to queue for user {user_id}")
+                pipe.set(get_card_key(profile['telegram_id']), json.dumps(profile), ex=PROFILE_CARD_TTL)
+            await pipe.execute()
+            added = await self.push_profiles_script(
+                keys=[self.get_queue_key(user_id), self.get_queue_members_key(user_id)],
+                args=[PROFILE_QUEUE_MAX_LENGTH, PROFILE_QUEUE_TTL, *[profile['telegram_id'] for profile in profiles]]
+            )
+            logger.info(f"Added {added} profiles to queue for user {user_id}")
         except Exception as e:
             logger.error(f"Error adding profiles to queue: {str(e)}")
             raise
 
 
+    async def get_file_id(self, image_id: int) -> Optional[str]:
+        """file_id фотографии в Telegram, если она уже отправлялась"""
+        if not self.connected:
+            await self.connect()
+
+        try:
+            return await self.redis.hget(TELEGRAM_FILE_IDS_KEY, image_id)
+        except Exception as e:
+            logger.error(f"Error getting file_id of image {image_id}: {str(e)}")
+            return None
+
+    async def save_file_id(self, image_id: int, file_id: str) -> None:
+        if not self.connected:
+            await self.connect()
+
+        try:
+            await self.redis.hset(TELEGRAM_FILE_IDS_KEY, image_id, file_id)
+        except Exception as e:
+            logger.error(f"Error saving file_id of image {image_id}: {str(e)}")
+
+    async def forget_file_id(self, image_id: int) -> None:
+        if not self.connected:
+            await self.connect()
+
+        try:
+            await self.redis.hdel(TELEGRAM_FILE_IDS_KEY, image_id)
+        except Exception as e:
+            logger.error(f"Error removing file_id of image {image_id}: {str(e)}")
+
+
 # Инициализация менеджера очереди
 queue_manager = ProfileQueueManager(REDIS_URL)
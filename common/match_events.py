@@ -0,0 +1,12 @@
+# Уведомления о мэтчах, созданных потребителем потока свайпов
+# (SWIPE_INGESTION_MODE=stream). Эндпоинт свайпа отвечает до записи в базу
+# и не знает о мэтче, поэтому пользователей уведомляет бот: потребитель
+# (api/swipe_stream.py) после коммита добавляет событие в поток match_events,
+# бот читает его группой match_notify (bot/match_notifications.py).
+#
+# Поля события: user1, user2 - telegram_id пользователей мэтча.
+
+MATCH_EVENTS_KEY = 'match_events'
+MATCH_NOTIFY_GROUP = 'match_notify'
+# Примерный предел длины потока, если бот долго не забирает события
+MATCH_EVENTS_MAX_LENGTH = 100000
@@ -0,0 +1,84 @@
+import os
+
+# Общий формат очередей анкет в Redis. Очередь пишет API (api/profile_queue.py),
+# читает бот (bot/storage/redis.py), поэтому ключи и Lua-скрипты описаны в общем
+# пакете, от которого зависят оба, а не друг от друга.
+#
+# Очередь - это список profile_queue:{id} с telegram_id анкет и множество
+# profile_queue_members:{id} с теми же id. Скрипты обновляют их атомарно, поэтому
+# анкета не попадает в очередь дважды, а длина очереди ограничена.
+#
+# Сами карточки анкет хранятся один раз на всех в ключах profile_card:{telegram_id}
+# (JSON) со сроком жизни PROFILE_CARD_TTL: API сбрасывает карточку при изменении
+# пользователя или фото, а карточки неактивных анкет истекают сами.
+#
+# file_id фотографий, уже загруженных в Telegram, хранятся в хеше
+# telegram_file_ids (id UserImage -> file_id): бот отправляет фото по file_id
+# вместо байтов из MinIO. API удаляет запись при изменении или удалении фото.
+
+PROFILE_QUEUE_MAX_LENGTH = int(os.getenv('PROFILE_QUEUE_MAX_LENGTH', '100'))
+PROFILE_QUEUE_TTL = int(os.getenv('PROFILE_QUEUE_TTL', str(24 * 60 * 60)))
+
+PROFILE_CARD_TTL = int(os.getenv('PROFILE_CARD_TTL', str(24 * 60 * 60)))
+
+TELEGRAM_FILE_IDS_KEY = 'telegram_file_ids'
+
+
+def get_queue_key(user_id) -> str:
+    return f"profile_queue:{user_id}"
+
+
+def get_queue_members_key(user_id) -> str:
+    return f"profile_queue_members:{user_id}"
+
+
+def get_card_key(telegram_id) -> str:
+    return f"profile_card:{telegram_id}"
+
+
+# KEYS: очередь, множество; ARGV: макс. длина, TTL, затем telegram_id анкет
+PUSH_PROFILES_SCRIPT = """
+local length = redis.call('LLEN', KEYS[1])
+local max_length = tonumber(ARGV[1])
+local added = 0
+for i = 3, #ARGV do
+    if length >= max_length then
+        break
+    end
+    if redis.call('SADD', KEYS[2], ARGV[i]) == 1 then
+        redis.call('RPUSH', KEYS[1], ARGV[i])
+        length = length + 1
+        added = added + 1
+    end
+end
+local ttl = tonumber(ARGV[2])
+if ttl > 0 and length > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+    redis.call('EXPIRE', KEYS[2], ttl)
+end
+return added
+"""
+
+# KEYS: очередь, множество. Возвращает telegram_id из головы очереди или nil
+POP_PROFILE_SCRIPT = """
+local telegram_id = redis.call('LPOP', KEYS[1])
+if telegram_id then
+    redis.call('SREM', KEYS[2], telegram_id)
+end
+return telegram_id
+"""
+
+# KEYS: очередь, множество; ARGV: TTL, telegram_id. Возвращает анкету, которую
+# не удалось показать, в голову очереди (если ее там еще нет)
+RETURN_PROFILE_SCRIPT = """
+if redis.call('SADD', KEYS[2], ARGV[2]) == 0 then
+    return 0
+end
+redis.call('LPUSH', KEYS[1], ARGV[2])
+local ttl = tonumber(ARGV[1])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+    redis.call('EXPIRE', KEYS[2], ttl)
+end
+return 1
+"""
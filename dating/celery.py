@@ -10,20 +10,13 @@ app.autodiscover_tasks()
 
 # Настройка периодических задач
 app.conf.beat_schedule = {
-    'recalculate-primary-ratings': {
-        'task': 'api.tasks.recalculate_primary_ratings',
-        'schedule': crontab(hour='*/6'),  # Каждые 6 часов
-    },
-    'recalculate-behavioral-ratings': {
-        'task': 'api.tasks.recalculate_behavioral_ratings',
-        'schedule': crontab(hour='*/3'),  # Каждые 3 часа
-    },
-    'recalculate-combined-ratings': {
-        'task': 'api.tasks.recalculate_combined_ratings',
-        'schedule': crontab(hour='*/3'),  # Каждые 3 часа
+    'recalculate-dirty-ratings': {
+        'task': 'api.tasks.recalculate_dirty_ratings',
+        'schedule': crontab(),  # Каждую минуту, только измененные пользователи
     },
+    # Полный пересчет - сверка на случай пропущенных отметок
     'recalculate-all-ratings': {
         'task': 'api.tasks.recalculate_all_ratings',
-        'schedule': crontab(hour=0, minute=0),  # Раз в сутки в полночь
+        'schedule': crontab(hour=3, minute=0, day_of_week='sunday'),  # Раз в неделю ночью
     },
-} 
\ No newline at end of file
+}
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base as postgresql_base
+from prometheus_client import Counter, Histogram
+from psycopg import IsolationLevel
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+# Бэкенд PostgreSQL с пулом соединений psycopg_pool (в Django 4.2 своего пула нет).
+# Django по-прежнему "открывает" и "закрывает" соединение на каждый запрос или
+# задачу Celery, но вместо connect/close соединение берется из пула и
+# возвращается в него. Настройки пула - DATABASES[...]['OPTIONS']['pool'].
+
+POOL_CHECKOUT_SECONDS = Histogram(
+    'django_db_pool_checkout_seconds',
+    'Время ожидания соединения из пула',
+    ['alias'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    'django_db_pool_checkout_timeouts_total',
+    'Соединение из пула не получено за timeout',
+    ['alias']
+)
+
+# Пулы процесса: после fork (воркеры gunicorn/uvicorn, prefork Celery)
+# потомок создает свой пул, соединения родителя не используются
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, pool_options):
+    # База входит в ключ: тесты переключают NAME на тестовую базу
+    key = (alias, os.getpid(), *(conn_params.get(param) for param in ('host', 'port', 'dbname', 'user')))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = dict(pool_options)
+                check = options.pop('check', True)
+                pool = ConnectionPool(
+                    kwargs=conn_params,
+                    check=ConnectionPool.check_connection if check else None,
+                    name=f"{alias}-{os.getpid()}",
+                    open=True,
+                    **options
+                )
+                _pools[key] = pool
+    return pool
+
+
+class DatabaseWrapper(postgresql_base.DatabaseWrapper):
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        if not postgresql_base.is_psycopg3:
+            raise ImproperlyConfigured('dating.db.postgresql_pool requires psycopg 3')
+
+        # Уровень изоляции как в родительском get_new_connection; у соединения
+        # из пула его задаем каждый раз, чтобы не зависеть от прошлого владельца
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        try:
+            self.isolation_level = IsolationLevel(
+                isolation_level if isolation_level is not None else IsolationLevel.READ_COMMITTED
+            )
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {isolation_level} "
+                f"specified. Use one of the psycopg.IsolationLevel values."
+            )
+
+        pool = get_pool(self.alias, conn_params, self.settings_dict['OPTIONS'].get('pool', {}))
+        started = time.perf_counter()
+        try:
+            connection = pool.getconn()
+        except PoolTimeout:
+            POOL_CHECKOUT_TIMEOUTS.labels(self.alias).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.labels(self.alias).observe(time.perf_counter() - started)
+
+        connection.isolation_level = self.isolation_level if isolation_level is not None else None
+        self.pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            # Незавершенную транзакцию пул откатит, сломанное соединение закроет
+            with self.wrap_database_errors:
+                return self.pool.putconn(self.connection)
@@ -58,6 +58,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.db_routing.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django_prometheus.middleware.PrometheusAfterMiddleware',
 ]
@@ -142,7 +143,7 @@ WSGI_APPLICATION = 'dating.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
+        'ENGINE': os.getenv('DB_ENGINE', 'dating.db.postgresql_pool'),
         'NAME': os.getenv('DB_NAME', 'dating_db'),
         'USER': os.getenv('DB_USER', 'postgres'),
         'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
@@ -151,6 +152,40 @@ DATABASES = {
     }
 }
 
+# Пул соединений psycopg 3 (бэкенд dating.db.postgresql_pool). Настройки на процесс:
+# у web, celery_worker и celery_beat свои значения в docker-compose.yml
+DB_POOL_OPTIONS = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '4')),
+    # Сколько секунд ждать свободное соединение
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    # Соединения старше max_lifetime и простаивающие дольше max_idle закрываются
+    'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', str(30 * 60))),
+    'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', str(5 * 60))),
+    # Проверка соединения перед выдачей из пула
+    'check': os.getenv('DB_POOL_CHECK', 'True').lower() == 'true',
+}
+if DATABASES['default']['ENGINE'] == 'dating.db.postgresql_pool':
+    DATABASES['default']['OPTIONS'] = {'pool': DB_POOL_OPTIONS}
+
+# Реплики для чтения: хосты через запятую (host или host:port), алиасы replica_1, replica_2...
+# Локально - сервис db_replica: docker compose --profile replica up, DB_REPLICA_HOSTS=db_replica
+DATABASE_REPLICAS = []
+for replica_number, replica_host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    replica_host, _, replica_port = replica_host.strip().partition(':')
+    DATABASES[f'replica_{replica_number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        # В тестах реплика - та же база
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{replica_number}')
+
+DATABASE_ROUTERS = ['api.db_routing.ReplicaRouter']
+# Сколько секунд после изменений пользователя его запросы читают из default (отставание реплики)
+DB_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -248,3 +283,40 @@ CELERY_TIMEZONE = 'UTC'
 
 # Настройки для периодических задач
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# Настройки ленты анкет
+# Индекс кандидатов в Redis (перестроить: python manage.py rebuild_candidate_index)
+CANDIDATE_INDEX_ENABLED = os.getenv('CANDIDATE_INDEX_ENABLED', 'True').lower() == 'true'
+CANDIDATE_INDEX_PAGE_SIZE = int(os.getenv('CANDIDATE_INDEX_PAGE_SIZE', '100'))
+CANDIDATE_INDEX_MAX_SCAN = int(os.getenv('CANDIDATE_INDEX_MAX_SCAN', '2000'))
+# Способ исключения просмотренных анкет в запросе к базе: not_exists или exclude_lists
+FEED_QUERY_MODE = os.getenv('FEED_QUERY_MODE', 'not_exists')
+# Фильтр Блума просмотренных анкет (после изменения параметров: python manage.py rebuild_seen_filters)
+SEEN_FILTER_ENABLED = os.getenv('SEEN_FILTER_ENABLED', 'True').lower() == 'true'
+SEEN_FILTER_CAPACITY = int(os.getenv('SEEN_FILTER_CAPACITY', '10000'))
+SEEN_FILTER_ERROR_RATE = float(os.getenv('SEEN_FILTER_ERROR_RATE', '0.01'))
+# Сколько секунд хранится позиция зрителя в ленте
+FEED_CURSOR_TTL = int(os.getenv('FEED_CURSOR_TTL', str(24 * 60 * 60)))
+
+# Массовый пересчет рейтингов: пользователей в одном UPDATE
+RATING_UPDATE_BATCH_SIZE = int(os.getenv('RATING_UPDATE_BATCH_SIZE', '50000'))
+# Движок пересчета рейтингов в Celery-задачах: sql (UPDATE по диапазонам id) или numpy
+RATING_ENGINE = os.getenv('RATING_ENGINE', 'sql')
+# Движок numpy: пользователей в одной загруженной пачке и в одном bulk_update
+RATING_ENGINE_CHUNK_SIZE = int(os.getenv('RATING_ENGINE_CHUNK_SIZE', '20000'))
+RATING_ENGINE_WRITE_BATCH_SIZE = int(os.getenv('RATING_ENGINE_WRITE_BATCH_SIZE', '2000'))
+# Инкрементальный пересчет рейтингов измененных пользователей: пользователей в одном UPDATE
+DIRTY_RATINGS_BATCH_SIZE = int(os.getenv('DIRTY_RATINGS_BATCH_SIZE', '1000'))
+# Запись свайпов: sync (сразу в базу) или stream (Redis Stream + python manage.py consume_swipes)
+SWIPE_INGESTION_MODE = os.getenv('SWIPE_INGESTION_MODE', 'sync')
+SWIPE_STREAM_BATCH_SIZE = int(os.getenv('SWIPE_STREAM_BATCH_SIZE', '500'))
+SWIPE_STREAM_BLOCK_MS = int(os.getenv('SWIPE_STREAM_BLOCK_MS', '1000'))
+# Через сколько миллисекунд событие упавшего потребителя забирает другой
+SWIPE_STREAM_CLAIM_IDLE_MS = int(os.getenv('SWIPE_STREAM_CLAIM_IDLE_MS', '60000'))
+# Множества лайкнувших пользователя в Redis для проверки взаимного лайка: время жизни в секундах
+LIKES_IN_TTL = int(os.getenv('LIKES_IN_TTL', str(7 * 24 * 60 * 60)))
+# Сколько секунд лайк незавершенной транзакции виден встречному лайку
+LIKE_PENDING_TTL = int(os.getenv('LIKE_PENDING_TTL', '10'))
+# Асинхронные версии горячих эндпоинтов (свайп, лента, проверка мэтча, фото).
+# Включается для ASGI-сервера (uvicorn dating.asgi:application)
+ASYNC_HOT_VIEWS = os.getenv('ASYNC_HOT_VIEWS', 'False').lower() == 'true'
@@ -0,0 +1,3 @@
+#!/bin/bash
+# Подключения для потоковой репликации (сервис db_replica в docker-compose.yml)
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"